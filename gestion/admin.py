@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 from django.utils.html import format_html
 from .models import Medicament, Client, Commande, Facture, LigneCommande
 from django.core.exceptions import ValidationError
@@ -7,6 +8,9 @@ class LigneCommandeInline(admin.TabularInline):
     model = LigneCommande
     extra = 1
     readonly_fields = ('prix_unitaire', 'sous_total', 'status_stock')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('medicament')
     
     def sous_total(self, instance):
         if instance.pk:
@@ -51,9 +55,16 @@ class CommandeAdmin(admin.ModelAdmin):
     readonly_fields = ['date_commande']
     list_filter = ['statut']
     search_fields = ['client__nom', 'client__prenom']
+    list_select_related = ['client']
+
+    def get_queryset(self, request):
+        # Lignes et médicaments préchargés pour alerte_stock
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('lignes', queryset=LigneCommande.objects.select_related('medicament'))
+        )
     
     def total(self, obj):
-        return f"{obj.calculer_total()}€"
+        return f"{obj.montant_total}€"
     
     def alerte_stock(self, obj):
         alertes = []
@@ -99,7 +110,14 @@ class FactureAdmin(admin.ModelAdmin):
     fields = ['commande', 'remise', 'methode_paiement', 'montant_total', 
              'get_montant_final', 'date_facture', 'est_payee']
     list_filter = ['methode_paiement', 'est_payee']
+    # Commande.__str__ affiche le client
+    list_select_related = ['commande__client']
     
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'commande':
+            kwargs['queryset'] = Commande.objects.select_related('client')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
     def get_montant_total(self, obj):
         return f"{obj.montant_total:.2f}€"
     get_montant_total.short_description = "Montant total"
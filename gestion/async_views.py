@@ -0,0 +1,149 @@
+import asyncio
+import base64
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.utils import timezone
+from rest_framework.utils import encoders
+
+from .models import Client, Commande, Medicament, VenteJournaliere
+from .serializers import CommandeSerializer, MedicamentSerializer
+from .services import agreger_ventes
+from .views import periode_ventes
+
+# Variantes asynchrones des lectures lourdes pour le déploiement ASGI
+# (pharmacie/asgi.py) : l'ORM asynchrone libère la boucle d'événements pendant
+# les requêtes SQL au lieu de bloquer un thread de worker.
+
+TAILLE_PAGE = 50
+TAILLE_PAGE_MAX = 500
+
+
+def _reponse(donnees, status=200):
+    return JsonResponse(donnees, status=status, safe=False, encoder=encoders.JSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def _taille_page(request):
+    try:
+        return max(1, min(int(request.GET.get('page_size', TAILLE_PAGE)), TAILLE_PAGE_MAX))
+    except ValueError:
+        return TAILLE_PAGE
+
+
+def _encoder_curseur(*valeurs):
+    return base64.urlsafe_b64encode(json.dumps(valeurs).encode()).decode()
+
+
+def _decoder_curseur(request, *types):
+    """Relit un curseur produit par `_encoder_curseur` ; lève ValueError si
+    son contenu ne correspond pas aux `types` attendus, position par position."""
+    curseur = request.GET.get('cursor')
+    if not curseur:
+        return None
+    valeurs = json.loads(base64.urlsafe_b64decode(curseur.encode()))
+    if (not isinstance(valeurs, list) or len(valeurs) != len(types)
+            or not all(isinstance(v, t) and not isinstance(v, bool) for v, t in zip(valeurs, types))):
+        raise ValueError('Curseur invalide')
+    return valeurs
+
+
+async def _en_parallele(fonction):
+    """Exécute une requête synchrone dans un thread dédié avec sa propre
+    connexion, pour que plusieurs agrégats indépendants avancent en même
+    temps (l'ORM asynchrone sérialise sinon les appels d'une même requête)."""
+
+    def executer():
+        try:
+            return fonction()
+        finally:
+            connection.close()
+
+    return await sync_to_async(executer, thread_sensitive=False)()
+
+
+async def _page_medicaments(request, medicaments):
+    try:
+        curseur = _decoder_curseur(request, int)
+        if curseur:
+            medicaments = medicaments.filter(id__lt=curseur[0])
+    except ValueError:
+        return _reponse({'error': 'Curseur invalide'}, status=400)
+    taille = _taille_page(request)
+    lignes = [m async for m in medicaments.order_by('-id')[:taille + 1]]
+    suivant = _encoder_curseur(lignes[taille - 1].pk) if len(lignes) > taille else None
+    return _reponse({'next': suivant, 'results': MedicamentSerializer(lignes[:taille], many=True).data})
+
+
+async def liste_medicaments(request):
+    return await _page_medicaments(request, Medicament.objects.all())
+
+
+async def rupture_stock(request):
+    return await _page_medicaments(request, Medicament.objects.en_rupture())
+
+
+async def stock_faible(request):
+    return await _page_medicaments(request, Medicament.objects.stock_faible())
+
+
+async def historique_client(request, pk):
+    client = await aget_object_or_404(Client, pk=pk)
+    commandes = client.get_historique_achats().order_by('-date_commande', '-id')
+    try:
+        curseur = _decoder_curseur(request, str, int)
+        if curseur:
+            date_commande = datetime.fromisoformat(curseur[0])
+            commandes = commandes.filter(date_commande__lte=date_commande).exclude(
+                date_commande=date_commande, id__gte=curseur[1])
+    except ValueError:
+        return _reponse({'error': 'Curseur invalide'}, status=400)
+    taille = _taille_page(request)
+    lignes = [c async for c in commandes[:taille + 1]]
+    suivant = None
+    if len(lignes) > taille:
+        dernier = lignes[taille - 1]
+        suivant = _encoder_curseur(dernier.date_commande.isoformat(), dernier.pk)
+    return _reponse({'next': suivant, 'results': CommandeSerializer(lignes[:taille], many=True).data})
+
+
+async def statistiques_ventes(request):
+    try:
+        debut, fin = periode_ventes(request.GET)
+    except ValueError:
+        return _reponse({'error': 'Dates attendues au format AAAA-MM-JJ'}, status=400)
+    cumuls = [c async for c in VenteJournaliere.objects.filter(jour__range=(debut, fin))]
+    return _reponse(agreger_ventes(cumuls, debut, fin))
+
+
+async def _statistiques_stock():
+    rupture, faible, valeur = await asyncio.gather(
+        _en_parallele(lambda: Medicament.objects.en_rupture().count()),
+        _en_parallele(lambda: Medicament.objects.stock_faible().count()),
+        _en_parallele(Medicament.objects.valeur_stock),
+    )
+    return {'rupture_stock': rupture, 'stock_faible': faible, 'valeur_stock_total': valeur}
+
+
+async def statistiques_stock(request):
+    return _reponse(await _statistiques_stock())
+
+
+async def tableau_de_bord(request):
+    # Agrégats indépendants du tableau de bord calculés simultanément
+    aujourd_hui = timezone.localdate()
+    stock, ventes_du_jour, en_attente = await asyncio.gather(
+        _statistiques_stock(),
+        _en_parallele(lambda: agreger_ventes(
+            VenteJournaliere.objects.filter(jour=aujourd_hui), aujourd_hui, aujourd_hui)),
+        _en_parallele(lambda: Commande.objects.filter(statut='En attente').count()),
+    )
+    return _reponse({
+        'stock': stock,
+        'ventes_du_jour': {cle: ventes_du_jour[cle] for cle in ('total_ventes', 'montant_total', 'montant_net', 'par_methode')},
+        'commandes_en_attente': en_attente,
+    })
@@ -0,0 +1,97 @@
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+CLE_VERSION_CATALOGUE = 'gestion:catalogue:version'
+
+_compteurs = {'hits': 0, 'misses': 0}
+_verrou = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'GESTION_CACHE_ALIAS', 'default')]
+
+
+def _compter(nom):
+    with _verrou:
+        _compteurs[nom] += 1
+
+
+def statistiques_cache():
+    """Compteurs de succès/échecs du processus courant."""
+    with _verrou:
+        hits, misses = _compteurs['hits'], _compteurs['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'ratio': round(hits / total, 3) if total else None}
+
+
+def reinitialiser_statistiques_cache():
+    with _verrou:
+        _compteurs.update(hits=0, misses=0)
+
+
+def version_catalogue():
+    cache = _cache()
+    version = cache.get(CLE_VERSION_CATALOGUE)
+    if version is None:
+        # Initialisée à l'horodatage pour ne jamais réutiliser une version
+        # antérieure à une éviction de la clé
+        cache.add(CLE_VERSION_CATALOGUE, time.time_ns(), timeout=None)
+        version = cache.get(CLE_VERSION_CATALOGUE)
+    return version
+
+
+def invalider_catalogue():
+    """Change la version du catalogue : toutes les réponses en cache deviennent
+    inaccessibles. Exécuté après le commit pour ne pas laisser un lecteur
+    concurrent remettre en cache l'ancien état sous la nouvelle version."""
+    transaction.on_commit(_incrementer_version)
+
+
+def _incrementer_version():
+    cache = _cache()
+    try:
+        cache.incr(CLE_VERSION_CATALOGUE)
+    except ValueError:
+        cache.set(CLE_VERSION_CATALOGUE, time.time_ns(), timeout=None)
+
+
+# En-têtes de validation (voir conditionnel.py) conservés avec la réponse
+ENTETES_CONDITIONNELS = ('ETag', 'Last-Modified')
+
+
+def cache_catalogue(methode):
+    """Met en cache les réponses GET d'une vue du catalogue, sous une clé
+    versionnée par `invalider_catalogue`. L'ETag est mis en cache avec les
+    données : un succès, 304 compris, ne fait aucune requête."""
+
+    @wraps(methode)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != 'GET' or 'stream' in request.query_params:
+            return methode(self, request, *args, **kwargs)
+
+        cache = _cache()
+        cle = f'gestion:catalogue:{version_catalogue()}:{request.accepted_media_type}:{request.get_full_path()}'
+        en_cache = cache.get(cle)
+        if en_cache is not None:
+            _compter('hits')
+            donnees, entetes = en_cache
+            response = get_conditional_response(request, etag=entetes.get('ETag')) or Response(donnees)
+            for nom, valeur in entetes.items():
+                response[nom] = valeur
+            return response
+
+        _compter('misses')
+        response = methode(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            entetes = {nom: response[nom] for nom in ENTETES_CONDITIONNELS if response.has_header(nom)}
+            cache.set(cle, (response.data, entetes), getattr(settings, 'GESTION_CACHE_TIMEOUT', 300))
+        return response
+
+    return wrapper
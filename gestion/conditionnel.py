@@ -0,0 +1,66 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .services import agregat_scalaire
+
+
+def etat_modifications(queryset, *dependances):
+    """Retourne [(max(date_modification), nombre de lignes)] pour `queryset`
+    puis pour chaque queryset de `dependances`, en une seule requête faite de
+    sous-requêtes scalaires."""
+    querysets = [qs.prefetch_related(None) for qs in (queryset, *dependances)]
+    selection = {'nombre_0': Subquery(agregat_scalaire(querysets[0], n=Count('*')))}
+    for index, dependance in enumerate(querysets[1:], start=1):
+        selection[f'derniere_{index}'] = Subquery(agregat_scalaire(dependance, d=Max('date_modification')))
+        selection[f'nombre_{index}'] = Subquery(agregat_scalaire(dependance, n=Count('*')))
+    ligne = agregat_scalaire(querysets[0], derniere_0=Max('date_modification')).annotate(**selection).get()
+    return [(ligne[f'derniere_{index}'], ligne[f'nombre_{index}']) for index in range(len(querysets))]
+
+
+def reponse_conditionnelle(methode):
+    """GET conditionnel pour une action list/retrieve de ModelViewSet.
+
+    L'ETag fort est dérivé de l'URL, du type de contenu négocié et de
+    `etat_modifications` sur le queryset de la vue (filtré sur la clé pour
+    une action de détail) et sur `etag_dependances`, {modèle: chemin} des
+    modèles dont la représentation reprend des champs, limités aux lignes
+    référencées par le queryset via `chemin`. `If-None-Match` reçoit un 304 avant
+    toute sérialisation. Last-Modified est informatif : une suppression ne
+    change pas max(date_modification), seul l'ETag sert de validateur.
+    """
+
+    @wraps(methode)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return methode(self, request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        cle = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if cle is not None:
+            queryset = queryset.filter(**{self.lookup_field: cle})
+        dependances = getattr(self, 'etag_dependances', {})
+        etat = etat_modifications(queryset, *(
+            modele.objects.filter(pk__in=queryset.prefetch_related(None).values(chemin))
+            for modele, chemin in dependances.items()
+        ))
+        if cle is not None and not etat[0][1]:
+            # Objet absent : laisser la vue répondre 404
+            return methode(self, request, *args, **kwargs)
+
+        empreinte = repr((request.get_full_path(), request.accepted_media_type, etat))
+        etag = quote_etag(hashlib.sha1(empreinte.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = methode(self, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            dates = [derniere for derniere, _ in etat if derniere is not None]
+            if dates:
+                response['Last-Modified'] = http_date(max(dates).timestamp())
+        return response
+
+    return wrapper
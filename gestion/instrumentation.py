@@ -0,0 +1,138 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('gestion.instrumentation')
+
+_metriques = {}
+_verrou = threading.Lock()
+
+_PLACEHOLDERS = re.compile(r'(%s|\?)(\s*,\s*(%s|\?))*')
+_LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def gabarit_sql(sql):
+    """Réduit une requête à son gabarit : littéraux et listes IN (...) de
+    longueur variable sont remplacés, pour regrouper les requêtes identiques."""
+    return _PLACEHOLDERS.sub('?', _LITTERAUX.sub('?', sql))
+
+
+def requetes_repetees(requetes, seuil):
+    """Gabarits exécutés au moins `seuil` fois dans une même requête HTTP :
+    symptôme probable d'un N+1."""
+    compteur = Counter(gabarit_sql(sql) for sql, _ in requetes)
+    return {gabarit: nombre for gabarit, nombre in compteur.most_common() if nombre >= seuil}
+
+
+def metriques():
+    with _verrou:
+        return {nom: dict(valeurs) for nom, valeurs in sorted(_metriques.items())}
+
+
+def reinitialiser_metriques():
+    with _verrou:
+        _metriques.clear()
+
+
+def _enregistrer(mesure):
+    with _verrou:
+        agregat = _metriques.setdefault(mesure['url_name'], {
+            'appels': 0, 'duree_ms_totale': 0.0, 'duree_ms_max': 0.0,
+            'requetes_sql_totales': 0, 'duree_sql_ms_totale': 0.0,
+            'n_plus_un_detectes': 0, 'dernier_n_plus_un': None,
+        })
+        agregat['appels'] += 1
+        agregat['duree_ms_totale'] = round(agregat['duree_ms_totale'] + mesure['duree_ms'], 3)
+        agregat['duree_ms_max'] = max(agregat['duree_ms_max'], mesure['duree_ms'])
+        agregat['requetes_sql_totales'] += mesure['requetes_sql']
+        agregat['duree_sql_ms_totale'] = round(agregat['duree_sql_ms_totale'] + mesure['duree_sql_ms'], 3)
+        if mesure['n_plus_un']:
+            agregat['n_plus_un_detectes'] += 1
+            agregat['dernier_n_plus_un'] = mesure['n_plus_un']
+
+
+class _FluxMesure:
+    """Itère le corps d'une réponse en flux en gardant la collecte SQL active ;
+    `terminer` est appelé une seule fois, à la fermeture de la réponse."""
+
+    def __init__(self, contenu, terminer):
+        self._contenu = iter(contenu)
+        self._terminer = terminer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._contenu)
+
+    def close(self):
+        terminer, self._terminer = self._terminer, None
+        if terminer:
+            terminer()
+
+
+class InstrumentationMiddleware:
+    """Mesure, par nom d'URL, la durée de la requête, le nombre et la durée
+    des requêtes SQL, et signale les gabarits SQL répétés (N+1 probables).
+
+    Pour une StreamingHttpResponse, la mesure couvre la production du corps et
+    s'arrête à la fermeture de la réponse ; un corps asynchrone est exclu (la
+    collecte, liée à la connexion du thread, s'arrête au retour de la vue).
+
+    Activé par GESTION_INSTRUMENTATION = True ; sinon le middleware se retire
+    de la chaîne au démarrage et ne coûte rien."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'GESTION_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.seuil_n_plus_un = getattr(settings, 'GESTION_N_PLUS_UN_SEUIL', 5)
+
+    def __call__(self, request):
+        requetes = []
+
+        def chronometrer(execute, sql, params, many, context):
+            debut = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                requetes.append((sql, time.perf_counter() - debut))
+
+        debut = time.perf_counter()
+        with ExitStack() as pile:
+            for connexion in connections.all():
+                pile.enter_context(connexion.execute_wrapper(chronometrer))
+            response = self.get_response(request)
+            if response.streaming and not response.is_async:
+                collecte = pile.pop_all()
+
+                def terminer():
+                    collecte.close()
+                    self._mesurer(request, response, time.perf_counter() - debut, requetes)
+
+                response.streaming_content = _FluxMesure(response.streaming_content, terminer)
+                return response
+        self._mesurer(request, response, time.perf_counter() - debut, requetes)
+        return response
+
+    def _mesurer(self, request, response, duree, requetes):
+        match = getattr(request, 'resolver_match', None)
+        mesure = {
+            'url_name': (match.url_name or match.view_name) if match else 'non_resolue',
+            'methode': request.method,
+            'statut': response.status_code,
+            'duree_ms': round(duree * 1000, 3),
+            'requetes_sql': len(requetes),
+            'duree_sql_ms': round(sum(d for _, d in requetes) * 1000, 3),
+            'n_plus_un': requetes_repetees(requetes, self.seuil_n_plus_un),
+        }
+        _enregistrer(mesure)
+        logger.info(json.dumps(mesure, ensure_ascii=False), extra={'instrumentation': mesure})
@@ -0,0 +1,183 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client as ClientHttp
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from gestion.models import Client, Commande, Medicament
+
+
+class Command(BaseCommand):
+    help = ("Mesure débit, latences (p50/p95/p99) et nombre de requêtes SQL des routes de l'API gestion, "
+            "et écrit les résultats dans un fichier JSON comparable d'une exécution à l'autre.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help="Requêtes HTTP par scénario.")
+        parser.add_argument('--sortie', default='benchmark_api.json')
+        parser.add_argument('--comparer', help="Fichier de résultats précédent à comparer.")
+        parser.add_argument('--base-existante', action='store_true',
+                            help="Utilise la base configurée (elle sera modifiée) au lieu d'une base jetable.")
+        parser.add_argument('--commandes', type=int, default=20000, help="Volume généré pour la base jetable.")
+        parser.add_argument('--medicaments', type=int, default=2000)
+        parser.add_argument('--clients', type=int, default=5000)
+        parser.add_argument('--graine', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+            environnement_prepare = True
+        except RuntimeError:
+            # Déjà préparé, par exemple sous le lanceur de tests
+            environnement_prepare = False
+        ancien_nom = None
+        try:
+            if not options['base_existante']:
+                ancien_nom = self._creer_base_jetable(options)
+            resultats = self.executer(options)
+        finally:
+            if ancien_nom is not None:
+                connection.creation.destroy_test_db(ancien_nom, verbosity=0)
+            if environnement_prepare:
+                teardown_test_environment()
+
+        with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+            json.dump(resultats, fichier, indent=2, ensure_ascii=False)
+        self._afficher(resultats, options['comparer'])
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['sortie']}"))
+
+    def _creer_base_jetable(self, options):
+        # Base fichier (et non en mémoire) pour des mesures représentatives
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(
+            tempfile.gettempdir(), 'benchmark_gestion.sqlite3')
+        ancien_nom = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        call_command('generer_donnees', commandes=options['commandes'], medicaments=options['medicaments'],
+                     clients=options['clients'], graine=options['graine'], stdout=open(os.devnull, 'w'))
+        return ancien_nom
+
+    # Scénarios
+
+    def _scenarios(self, rng):
+        client_ids = list(Client.objects.values_list('pk', flat=True)[:1000])
+        medicament_ids = list(Medicament.objects.filter(quantite_en_stock__gte=100).values_list('pk', flat=True)[:500])
+        if not client_ids or len(medicament_ids) < 3:
+            raise CommandError("La base doit contenir des clients et au moins 3 médicaments en stock (voir generer_donnees).")
+        creees = []
+
+        def creer_commande():
+            return 'post', reverse('commande-list'), {
+                'client': rng.choice(client_ids),
+                'lignes': [{'medicament': pk, 'quantite': 1} for pk in rng.sample(medicament_ids, 3)],
+            }
+
+        # Sans commande créée (échecs de creer_commande), l'itération est
+        # comptée en erreur au lieu d'interrompre la mesure.
+        def valider_commande():
+            if creees:
+                return 'post', reverse('valider-commande', args=[rng.choice(creees)]), None
+
+        def facturer():
+            if creees:
+                return 'post', reverse('facture-list'), {'commande': creees.pop()}
+
+        return creees, [
+            ('liste_medicaments', lambda: ('get', reverse('medicament-list'), None)),
+            ('liste_commandes', lambda: ('get', reverse('commande-list'), None)),
+            ('liste_factures', lambda: ('get', reverse('facture-list'), None)),
+            ('historique_client', lambda: ('get', reverse('client-historique', args=[rng.choice(client_ids)]), None)),
+            ('creer_commande', creer_commande),
+            ('valider_commande', valider_commande),
+            ('facturer_commande', facturer),
+            ('stats_ventes', lambda: ('get', reverse('stats-ventes'), None)),
+            ('stats_stock', lambda: ('get', reverse('stats-stock'), None)),
+        ]
+
+    def executer(self, options):
+        rng = random.Random(options['graine'])
+        http = ClientHttp()
+        creees, scenarios = self._scenarios(rng)
+        resultats = {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'volumes': {
+                    'medicaments': Medicament.objects.count(),
+                    'clients': Client.objects.count(),
+                    'commandes': Commande.objects.count(),
+                },
+            },
+            'scenarios': {},
+        }
+
+        for nom, construire in scenarios:
+            latences, requetes_sql, erreurs = [], [], 0
+            debut_scenario = time.perf_counter()
+            for _ in range(options['iterations']):
+                requete = construire()
+                if requete is None:
+                    erreurs += 1
+                    continue
+                methode, url, donnees = requete
+                with CaptureQueriesContext(connection) as requetes:
+                    debut = time.perf_counter()
+                    if methode == 'get':
+                        response = http.get(url)
+                    else:
+                        response = http.post(url, donnees, content_type='application/json')
+                    latences.append((time.perf_counter() - debut) * 1000)
+                requetes_sql.append(len(requetes))
+                if response.status_code >= 400:
+                    erreurs += 1
+                elif nom == 'creer_commande':
+                    creees.append(response.json()['id'])
+            duree = time.perf_counter() - debut_scenario
+            resultats['scenarios'][nom] = self._statistiques(latences, requetes_sql, erreurs, duree)
+        return resultats
+
+    @staticmethod
+    def _statistiques(latences, requetes_sql, erreurs, duree):
+        requetes_http = len(latences)
+        latences, requetes_sql = latences or [0.0], requetes_sql or [0]
+        centiles = statistics.quantiles(latences, n=100, method='inclusive') if len(latences) > 1 else latences * 99
+        return {
+            'requetes_http': requetes_http,
+            'erreurs': erreurs,
+            'rps': round(requetes_http / duree, 1),
+            'latence_ms': {
+                'moyenne': round(statistics.fmean(latences), 3),
+                'p50': round(centiles[49], 3),
+                'p95': round(centiles[94], 3),
+                'p99': round(centiles[98], 3),
+            },
+            'requetes_sql': {
+                'moyenne': round(statistics.fmean(requetes_sql), 2),
+                'max': max(requetes_sql),
+            },
+        }
+
+    def _afficher(self, resultats, comparer):
+        precedents = {}
+        if comparer:
+            with open(comparer, encoding='utf-8') as fichier:
+                precedents = json.load(fichier).get('scenarios', {})
+
+        self.stdout.write(f"{'scénario':<20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'SQL':>6} {'err':>4}")
+        for nom, mesure in resultats['scenarios'].items():
+            ligne = (f"{nom:<20} {mesure['rps']:>9} {mesure['latence_ms']['p50']:>9} "
+                     f"{mesure['latence_ms']['p95']:>9} {mesure['latence_ms']['p99']:>9} "
+                     f"{mesure['requetes_sql']['moyenne']:>6} {mesure['erreurs']:>4}")
+            precedent = precedents.get(nom)
+            if precedent and precedent['rps']:
+                ecart = (mesure['rps'] - precedent['rps']) / precedent['rps'] * 100
+                ligne += f"   ({ecart:+.1f} % req/s, p95 {precedent['latence_ms']['p95']} -> {mesure['latence_ms']['p95']})"
+            self.stdout.write(ligne)
@@ -0,0 +1,105 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient, Client as ClientHttp
+from django.urls import reverse
+
+from gestion.models import Client
+
+from .benchmark_api import Command as BenchmarkApiCommand
+
+
+class Command(BenchmarkApiCommand):
+    help = ("Compare, à concurrence égale, les lectures lourdes servies par les vues synchrones (WSGI) "
+            "et par leurs variantes asynchrones (ASGI).")
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--concurrence', type=int, default=16, help="Requêtes simultanées.")
+        parser.set_defaults(sortie='benchmark_asgi.json')
+
+    def _paires(self, rng):
+        client_ids = list(Client.objects.values_list('pk', flat=True)[:1000])
+        # Paramètre aléatoire : contourne le cache du catalogue côté WSGI
+        return [
+            ('catalogue', lambda: (reverse('medicament-list'), {'v': rng.random()}),
+             lambda: (reverse('async-medicaments'), {})),
+            ('historique_client', lambda: (reverse('client-historique', args=[rng.choice(client_ids)]), {}),
+             lambda: (reverse('async-client-historique', args=[rng.choice(client_ids)]), {})),
+            ('stats_ventes', lambda: (reverse('stats-ventes'), {}), lambda: (reverse('async-stats-ventes'), {})),
+            ('stats_stock', lambda: (reverse('stats-stock'), {}), lambda: (reverse('async-stats-stock'), {})),
+        ]
+
+    def executer(self, options):
+        rng = random.Random(options['graine'])
+        concurrence = options['concurrence']
+        resultats = {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'iterations': options['iterations'],
+                'concurrence': concurrence,
+            },
+            'scenarios': {},
+        }
+        for nom, construire_wsgi, construire_asgi in self._paires(rng):
+            resultats['scenarios'][f'{nom}_wsgi'] = self._wsgi(construire_wsgi, options['iterations'], concurrence)
+            resultats['scenarios'][f'{nom}_asgi'] = async_to_sync(self._asgi)(
+                construire_asgi, options['iterations'], concurrence)
+        return resultats
+
+    def _wsgi(self, construire, iterations, concurrence):
+        def worker(nombre):
+            http, latences, erreurs = ClientHttp(), [], 0
+            try:
+                for _ in range(nombre):
+                    url, params = construire()
+                    debut = time.perf_counter()
+                    response = http.get(url, params)
+                    latences.append((time.perf_counter() - debut) * 1000)
+                    erreurs += response.status_code >= 400
+            finally:
+                connection.close()
+            return latences, erreurs
+
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(concurrence) as executeur:
+            parts = list(executeur.map(worker, self._repartir(iterations, concurrence)))
+        return self._agreger(parts, time.perf_counter() - debut)
+
+    async def _asgi(self, construire, iterations, concurrence):
+        async def worker(nombre):
+            http, latences, erreurs = AsyncClient(), [], 0
+            for _ in range(nombre):
+                url, params = construire()
+                debut = time.perf_counter()
+                response = await http.get(url, params)
+                latences.append((time.perf_counter() - debut) * 1000)
+                erreurs += response.status_code >= 400
+            return latences, erreurs
+
+        debut = time.perf_counter()
+        parts = await asyncio.gather(*(worker(n) for n in self._repartir(iterations, concurrence)))
+        return self._agreger(parts, time.perf_counter() - debut)
+
+    @staticmethod
+    def _repartir(iterations, concurrence):
+        return [iterations // concurrence + (i < iterations % concurrence) for i in range(concurrence)]
+
+    def _agreger(self, parts, duree):
+        latences = [latence for latences_worker, _ in parts for latence in latences_worker]
+        mesure = self._statistiques(latences, [0], sum(erreurs for _, erreurs in parts), duree)
+        del mesure['requetes_sql']
+        return mesure
+
+    def _afficher(self, resultats, comparer):
+        self.stdout.write(f"{'scénario':<24} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>4}")
+        for nom, mesure in resultats['scenarios'].items():
+            self.stdout.write(
+                f"{nom:<24} {mesure['rps']:>9} {mesure['latence_ms']['p50']:>9} "
+                f"{mesure['latence_ms']['p95']:>9} {mesure['latence_ms']['p99']:>9} {mesure['erreurs']:>4}"
+            )
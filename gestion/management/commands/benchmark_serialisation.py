@@ -0,0 +1,77 @@
+import time
+from datetime import datetime
+
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from gestion.models import Commande, Facture, Medicament
+from gestion.views import CommandeViewSet, FactureViewSet, MedicamentViewSet, PaiementViewSet
+
+from .benchmark_api import Command as BenchmarkApiCommand
+
+CIBLES = (
+    ('medicaments', MedicamentViewSet),
+    ('commandes', CommandeViewSet),
+    ('factures', FactureViewSet),
+    ('paiements', PaiementViewSet),
+)
+
+
+class Command(BenchmarkApiCommand):
+    help = ("Compare la sérialisation des listes par les ModelSerializer et par le chemin rapide "
+            "`.values()` (ValeursSerializer) : temps de rendu JSON de N lignes et identité des octets produits.")
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--lignes', type=int, default=10000, help="Lignes sérialisées par rendu.")
+        parser.set_defaults(sortie='benchmark_serialisation.json', iterations=10, medicaments=10000, commandes=10000)
+
+    def executer(self, options):
+        rendu = JSONRenderer()
+        resultats = {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'lignes': options['lignes'],
+                'volumes': {
+                    'medicaments': Medicament.objects.count(),
+                    'commandes': Commande.objects.count(),
+                    'factures': Facture.objects.count(),
+                },
+            },
+            'scenarios': {},
+        }
+        for nom, vue in CIBLES:
+            ordering = vue.pagination_class.ordering
+            queryset = vue.queryset.order_by(*([ordering] if isinstance(ordering, str) else ordering))
+            valeurs = vue.valeurs_serializer_class()
+            modes = {
+                'serializer': lambda: rendu.render(vue.serializer_class(queryset[:options['lignes']], many=True).data),
+                'valeurs': lambda: rendu.render(valeurs.serialiser(valeurs.preparer(queryset)[:options['lignes']])),
+            }
+            # Le chemin rapide doit produire exactement les mêmes octets
+            reference = modes['serializer']()
+            for mode, rendre in modes.items():
+                latences, requetes_sql, erreurs = [], [], 0
+                debut_scenario = time.perf_counter()
+                for _ in range(options['iterations']):
+                    with CaptureQueriesContext(connection) as requetes:
+                        debut = time.perf_counter()
+                        contenu = rendre()
+                        latences.append((time.perf_counter() - debut) * 1000)
+                    requetes_sql.append(len(requetes))
+                    erreurs += contenu != reference
+                duree = time.perf_counter() - debut_scenario
+                resultats['scenarios'][f'{nom}_{mode}'] = self._statistiques(latences, requetes_sql, erreurs, duree)
+        return resultats
+
+    def _afficher(self, resultats, comparer):
+        super()._afficher(resultats, comparer)
+        scenarios = resultats['scenarios']
+        for nom, _ in CIBLES:
+            reference, rapide = scenarios[f'{nom}_serializer'], scenarios[f'{nom}_valeurs']
+            if rapide['latence_ms']['p50']:
+                self.stdout.write(f"{nom:<20} accélération x{reference['latence_ms']['p50'] / rapide['latence_ms']['p50']:.1f}")
@@ -0,0 +1,168 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from gestion.models import Client, Commande, Medicament, VenteJournaliere
+
+from .benchmark_api import Command as BenchmarkApiCommand
+
+# Profils comparés : réglages SQLite par défaut de Django (journal DELETE,
+# connexion ouverte à chaque requête) et profil de production des settings
+PROFILS = {
+    'defaut': {'pragmas': 'PRAGMA journal_mode=DELETE;', 'persistante': False, 'debut_ecriture': 'BEGIN'},
+    'production': {'pragmas': settings.GESTION_SQLITE_PRAGMAS, 'persistante': True, 'debut_ecriture': 'BEGIN IMMEDIATE'},
+}
+
+
+class Command(BenchmarkApiCommand):
+    help = ("Mesure le débit d'une charge mixte lectures/écritures concurrentes sur SQLite, "
+            "avec les réglages par défaut puis avec le profil de production.")
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--duree', type=float, default=5, help="Durée de chaque profil, en secondes.")
+        parser.add_argument('--lecteurs', type=int, default=8, help="Threads de lecture.")
+        parser.add_argument('--ecrivains', type=int, default=2, help="Threads d'écriture.")
+        parser.set_defaults(sortie='benchmark_sqlite.json')
+
+    def _lectures(self):
+        """Requêtes de lecture de l'application, compilées une fois par l'ORM."""
+        def compiler(queryset):
+            sql, params = queryset.query.sql_with_params()
+            return sql.replace('%s', '?'), list(params)
+
+        debut = timezone.now() - timedelta(days=30)
+        client_ids = list(Client.objects.values_list('pk', flat=True)[:1000])
+        historique = compiler(Commande.objects.filter(client_id=0).order_by('-date_commande', '-id')[:50])
+        requetes = [
+            compiler(Medicament.objects.stock_faible().order_by('-id')[:50]),
+            compiler(Medicament.objects.order_by('-id').values()[:50]),
+            compiler(VenteJournaliere.objects.filter(jour__gte=debut.date()).values('methode_paiement')
+                     .annotate(total=Sum('montant_net'))),
+        ]
+
+        def suivante(rng):
+            if rng.random() < 0.4:
+                sql, params = historique
+                return sql, [rng.choice(client_ids)] + params[1:]
+            return rng.choice(requetes)
+        return suivante
+
+    def executer(self, options):
+        rng = random.Random(options['graine'])
+        medicament_ids = list(Medicament.objects.filter(quantite_en_stock__gte=100).values_list('pk', flat=True)[:500])
+        commande_ids = list(Commande.objects.values_list('pk', flat=True)[:1000])
+        lecture = self._lectures()
+        source = connection.settings_dict['NAME']
+
+        resultats = {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'duree_s': options['duree'],
+                'lecteurs': options['lecteurs'],
+                'ecrivains': options['ecrivains'],
+                'volumes': {'medicaments': Medicament.objects.count(), 'commandes': Commande.objects.count()},
+            },
+            'scenarios': {},
+        }
+        for nom, profil in PROFILS.items():
+            # Chaque profil part d'une copie identique de la base
+            chemin = os.path.join(tempfile.gettempdir(), f'benchmark_sqlite_{nom}.sqlite3')
+            for suffixe in ('', '-wal', '-shm'):
+                if os.path.exists(chemin + suffixe):
+                    os.remove(chemin + suffixe)
+            connection.ensure_connection()
+            copie = sqlite3.connect(chemin)
+            connection.connection.backup(copie)
+            copie.close()
+            try:
+                mesures = self._charge(chemin, profil, lecture, medicament_ids, commande_ids, rng, options)
+            finally:
+                for suffixe in ('', '-wal', '-shm'):
+                    if os.path.exists(chemin + suffixe):
+                        os.remove(chemin + suffixe)
+            resultats['scenarios'][f'{nom}_lectures'] = mesures['lectures']
+            resultats['scenarios'][f'{nom}_ecritures'] = mesures['ecritures']
+        return resultats
+
+    def _charge(self, chemin, profil, lecture, medicament_ids, commande_ids, rng, options):
+        def ouvrir():
+            # Attente sur verrou : 5 s du module sqlite3 (comme Django) pour le
+            # profil par défaut, busy_timeout des pragmas pour la production
+            base = sqlite3.connect(chemin, timeout=5, isolation_level=None, check_same_thread=False)
+            for pragma in profil['pragmas'].split(';'):
+                if pragma.strip():
+                    base.execute(pragma)
+            return base
+
+        ouvrir().close()  # Mode de journal appliqué avant la charge
+        fin = time.perf_counter() + options['duree']
+        mesures = {'lectures': ([], [], [0]), 'ecritures': ([], [], [0])}
+        verrou = threading.Lock()
+
+        def travailleur(type_operation, graine):
+            alea = random.Random(graine)
+            latences, instructions, erreurs = [], [], 0
+            base = ouvrir() if profil['persistante'] else None
+            while time.perf_counter() < fin:
+                courante = base or ouvrir()
+                debut = time.perf_counter()
+                try:
+                    if type_operation == 'lectures':
+                        sql, params = lecture(alea)
+                        courante.execute(sql, params).fetchall()
+                        instructions.append(1)
+                    else:
+                        self._ecrire(courante, profil['debut_ecriture'], alea, medicament_ids, commande_ids)
+                        instructions.append(5)
+                    latences.append((time.perf_counter() - debut) * 1000)
+                except sqlite3.OperationalError:
+                    # "database is locked" : délai d'attente dépassé
+                    erreurs += 1
+                    if courante.in_transaction:
+                        courante.execute('ROLLBACK')
+                finally:
+                    if base is None:
+                        courante.close()
+            if base is not None:
+                base.close()
+            with verrou:
+                cumul = mesures[type_operation]
+                cumul[0].extend(latences)
+                cumul[1].extend(instructions)
+                cumul[2][0] += erreurs
+
+        threads = [threading.Thread(target=travailleur, args=('lectures', rng.random())) for _ in range(options['lecteurs'])]
+        threads += [threading.Thread(target=travailleur, args=('ecritures', rng.random())) for _ in range(options['ecrivains'])]
+        debut = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duree = time.perf_counter() - debut
+        return {
+            nom: self._statistiques(latences or [0], instructions or [0], erreurs[0], duree)
+            for nom, (latences, instructions, erreurs) in mesures.items()
+        }
+
+    @staticmethod
+    def _ecrire(base, debut_ecriture, alea, medicament_ids, commande_ids):
+        """Même forme qu'un ajout de ligne : lecture du prix, réservation du
+        stock et mise à jour des totaux de la commande, en une transaction."""
+        medicament_id = alea.choice(medicament_ids)
+        base.execute(debut_ecriture)
+        prix, = base.execute('SELECT prix FROM gestion_medicament WHERE id = ?', [medicament_id]).fetchone()
+        base.execute('UPDATE gestion_medicament SET quantite_en_stock = quantite_en_stock - 1 '
+                     'WHERE id = ? AND quantite_en_stock >= 1', [medicament_id])
+        base.execute('UPDATE gestion_commande SET montant_total = montant_total + ?, nombre_lignes = nombre_lignes + 1 '
+                     'WHERE id = ?', [prix, alea.choice(commande_ids)])
+        base.execute('COMMIT')
@@ -0,0 +1,236 @@
+import csv
+import json
+import sys
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from gestion.cache import invalider_catalogue
+from gestion.models import Medicament
+from gestion.recherche import indexer_medicaments
+from gestion.services import numeroter_synchro
+
+CHAMPS = ['id', 'nom', 'categorie', 'prix', 'quantite_en_stock', 'seuil_alerte']
+CHAMPS_MODIFIABLES = CHAMPS[1:]
+
+
+class LigneInvalide(Exception):
+    pass
+
+
+def _format(chemin, format_demande):
+    if format_demande:
+        return format_demande
+    return 'jsonl' if Path(chemin).suffix in ('.jsonl', '.ndjson') else 'csv'
+
+
+def _entier(valeur, champ):
+    try:
+        entier = int(valeur)
+    except (TypeError, ValueError):
+        raise LigneInvalide(f"{champ} doit être un entier ({valeur!r})")
+    if entier < 0:
+        raise LigneInvalide(f"{champ} doit être positif ({valeur!r})")
+    return entier
+
+
+def _nettoyer(ligne):
+    """Convertit une ligne brute en valeurs typées ; les colonnes absentes ou
+    vides sont omises (elles conservent la valeur existante)."""
+    valeurs = {}
+    for champ in CHAMPS:
+        valeur = ligne.get(champ)
+        if valeur is None or (isinstance(valeur, str) and not valeur.strip()):
+            continue
+        if isinstance(valeur, str):
+            valeur = valeur.strip()
+        if champ in ('id', 'quantite_en_stock', 'seuil_alerte'):
+            valeurs[champ] = _entier(valeur, champ)
+        elif champ == 'prix':
+            try:
+                prix = Decimal(str(valeur))
+            except InvalidOperation:
+                raise LigneInvalide(f"prix invalide ({valeur!r})")
+            if prix < 0 or prix != prix.quantize(Decimal('0.01')) or prix >= 10 ** 6:
+                raise LigneInvalide(f"prix invalide ({valeur!r})")
+            valeurs[champ] = prix
+        else:
+            if len(valeur) > 100:
+                raise LigneInvalide(f"{champ} dépasse 100 caractères")
+            valeurs[champ] = valeur
+    return valeurs
+
+
+class Command(BaseCommand):
+    help = "Import (upsert par lots) et export en flux du catalogue Medicament au format CSV ou JSON Lines."
+
+    def add_arguments(self, parser):
+        sous_commandes = parser.add_subparsers(dest='action', required=True)
+
+        importer = sous_commandes.add_parser('import', help="Importe un fichier (upsert par id, sinon par nom).")
+        importer.add_argument('fichier')
+        importer.add_argument('--format', choices=['csv', 'jsonl'])
+        importer.add_argument('--taille-lot', type=int, default=1000)
+        importer.add_argument('--dry-run', action='store_true',
+                              help="Valide et simule l'import sans rien enregistrer.")
+        importer.add_argument('--rapport', help="Écrit les lignes rejetées dans ce fichier CSV.")
+
+        exporter = sous_commandes.add_parser('export', help="Exporte le catalogue ('-' pour la sortie standard).")
+        exporter.add_argument('fichier')
+        exporter.add_argument('--format', choices=['csv', 'jsonl'])
+        exporter.add_argument('--taille-lot', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['taille_lot'] < 1:
+            raise CommandError("--taille-lot doit être supérieur à 0.")
+        if options['action'] == 'import':
+            self.importer(options)
+        else:
+            self.exporter(options)
+
+    # Import
+
+    def _lire(self, fichier, format_fichier):
+        if format_fichier == 'csv':
+            # Numéro de ligne du fichier, en-tête comprise
+            for numero, ligne in enumerate(csv.DictReader(fichier), start=2):
+                yield numero, ligne
+        else:
+            for numero, texte in enumerate(fichier, start=1):
+                if not texte.strip():
+                    continue
+                try:
+                    ligne = json.loads(texte)
+                except ValueError as e:
+                    yield numero, e
+                    continue
+                yield numero, ligne if isinstance(ligne, dict) else ValueError("objet JSON attendu")
+
+    def importer(self, options):
+        format_fichier = _format(options['fichier'], options['format'])
+        self.crees = self.mis_a_jour = 0
+        self.erreurs = []
+        try:
+            fichier = open(options['fichier'], newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(e)
+
+        with fichier, transaction.atomic():
+            lignes = self._lire(fichier, format_fichier)
+            while lot := list(islice(lignes, options['taille_lot'])):
+                self._importer_lot(lot)
+            if options['dry_run']:
+                transaction.set_rollback(True)
+            elif self.crees or self.mis_a_jour:
+                invalider_catalogue()
+
+        if options['rapport'] and self.erreurs:
+            with open(options['rapport'], 'w', newline='', encoding='utf-8') as rapport:
+                writer = csv.writer(rapport)
+                writer.writerow(['ligne', 'erreur'])
+                writer.writerows(self.erreurs)
+        for numero, erreur in self.erreurs[:20]:
+            self.stderr.write(f"Ligne {numero}: {erreur}")
+        if len(self.erreurs) > 20:
+            self.stderr.write(f"... {len(self.erreurs) - 20} autre(s) erreur(s)")
+
+        prefixe = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefixe}{self.crees} créé(s), {self.mis_a_jour} mis à jour, {len(self.erreurs)} rejeté(s)."
+        ))
+
+    def _importer_lot(self, lot):
+        valides = []
+        for numero, ligne in lot:
+            try:
+                if isinstance(ligne, Exception):
+                    raise LigneInvalide(f"JSON invalide: {ligne}")
+                valides.append((numero, _nettoyer(ligne)))
+            except LigneInvalide as e:
+                self.erreurs.append((numero, str(e)))
+
+        par_id = Medicament.objects.in_bulk([v['id'] for _, v in valides if 'id' in v])
+        par_nom = {}
+        noms = [v['nom'] for _, v in valides if 'id' not in v and 'nom' in v]
+        for medicament in Medicament.objects.filter(nom__in=noms):
+            par_nom.setdefault(medicament.nom, []).append(medicament)
+
+        a_creer, a_modifier, champs_modifies = [], {}, set()
+        for numero, valeurs in valides:
+            if 'id' in valeurs:
+                existant = par_id.get(valeurs['id'])
+            else:
+                correspondances = par_nom.get(valeurs.get('nom'), [])
+                if len(correspondances) > 1:
+                    self.erreurs.append((numero, f"nom ambigu ({valeurs['nom']!r}), préciser l'id"))
+                    continue
+                existant = correspondances[0] if correspondances else None
+
+            if existant is not None:
+                for champ in CHAMPS_MODIFIABLES:
+                    if champ in valeurs:
+                        setattr(existant, champ, valeurs[champ])
+                # Une ligne déjà créée dans ce lot est simplement complétée
+                if not existant._state.adding:
+                    champs_modifies.update(champ for champ in CHAMPS_MODIFIABLES if champ in valeurs)
+                    a_modifier[existant.pk] = existant
+                continue
+
+            manquants = [champ for champ in ('nom', 'categorie', 'prix', 'quantite_en_stock') if champ not in valeurs]
+            if manquants:
+                self.erreurs.append((numero, f"champ(s) obligatoire(s) manquant(s): {', '.join(manquants)}"))
+                continue
+            medicament = Medicament(**valeurs)
+            a_creer.append(medicament)
+            if 'id' not in valeurs:
+                par_nom[medicament.nom] = [medicament]
+            else:
+                par_id[medicament.id] = medicament
+
+        # Écritures groupées sans signal : numéroter pour la synchronisation
+        numeroter_synchro(Medicament, [*a_creer, *a_modifier.values()])
+        Medicament.objects.bulk_create(a_creer)
+        if a_modifier and champs_modifies:
+            # INSERT ... ON CONFLICT DO UPDATE : une requête par lot, bien plus
+            # rapide que les CASE WHEN générés par bulk_update()
+            Medicament.objects.bulk_create(
+                a_modifier.values(), update_conflicts=True,
+                unique_fields=['id'], update_fields=[*sorted(champs_modifies), 'date_modification', 'sequence_synchro'],
+            )
+        # Écritures groupées sans signal : tenir l'index de recherche à jour
+        if a_creer or {'nom', 'categorie'} & champs_modifies:
+            indexer_medicaments([*a_creer, *a_modifier.values()])
+        self.crees += len(a_creer)
+        self.mis_a_jour += len(a_modifier)
+
+    # Export
+
+    def exporter(self, options):
+        format_fichier = _format(options['fichier'], options['format'])
+        lignes = Medicament.objects.order_by('id').values_list(*CHAMPS).iterator(chunk_size=options['taille_lot'])
+
+        if options['fichier'] == '-':
+            self._ecrire(sys.stdout, format_fichier, lignes)
+            return
+        with open(options['fichier'], 'w', newline='', encoding='utf-8') as fichier:
+            nombre = self._ecrire(fichier, format_fichier, lignes)
+        self.stdout.write(self.style.SUCCESS(f"{nombre} médicament(s) exporté(s)."))
+
+    def _ecrire(self, fichier, format_fichier, lignes):
+        nombre = 0
+        if format_fichier == 'csv':
+            writer = csv.writer(fichier)
+            writer.writerow(CHAMPS)
+            for ligne in lignes:
+                writer.writerow(ligne)
+                nombre += 1
+        else:
+            for ligne in lignes:
+                valeurs = dict(zip(CHAMPS, ligne))
+                valeurs['prix'] = str(valeurs['prix'])
+                fichier.write(json.dumps(valeurs, ensure_ascii=False) + '\n')
+                nombre += 1
+        return nombre
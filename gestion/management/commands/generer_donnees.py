@@ -0,0 +1,156 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from gestion.models import Client, Commande, Facture, LigneCommande, Medicament, Paiement
+from gestion.recherche import reconstruire_index
+from gestion.services import montant_net, numeroter_synchro, reconstruire_ventes_journalieres
+
+PREFIXES = ['Doli', 'Para', 'Ibu', 'Amoxi', 'Spas', 'Smec', 'Gavis', 'Efferal', 'Clari', 'Azi', 'Lora', 'Cetiri',
+            'Ome', 'Panto', 'Metfor', 'Ator', 'Rami', 'Bisopro', 'Levo', 'Dexa']
+SUFFIXES = ['prane', 'cétamol', 'profène', 'cilline', 'fon', 'ta', 'con', 'gan', 'thromycine', 'mycine',
+            'tadine', 'zine', 'prazole', 'mine', 'vastatine', 'pril', 'lol', 'thyrox', 'méthasone']
+CATEGORIES = ['Antalgique', 'Antibiotique', 'Anti-inflammatoire', 'Antispasmodique', 'Digestif',
+              'Antihistaminique', 'Cardiologie', 'Diabète', 'Dermatologie', 'Vitamines']
+NOMS = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+        'Benali', 'Haddad', 'Mansouri', 'Ziani', 'Amrani']
+PRENOMS = ['Jean', 'Marie', 'Lucie', 'Paul', 'Sofia', 'Karim', 'Nadia', 'Louis', 'Inès', 'Yanis']
+STATUTS = ['En attente', 'Expédiée', 'Annulée']
+METHODES = ['ESP', 'CB', 'CHQ']
+
+
+@contextmanager
+def dates_libres(*modeles_champs):
+    """Désactive temporairement auto_now_add pour pouvoir répartir les dates
+    générées dans le passé."""
+    champs = [modele._meta.get_field(nom) for modele, nom in modeles_champs]
+    for champ in champs:
+        champ.auto_now_add = False
+    try:
+        yield
+    finally:
+        for champ in champs:
+            champ.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "Remplit la base avec des volumes réalistes de médicaments, clients, commandes, factures et paiements."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicaments', type=int, default=2000)
+        parser.add_argument('--clients', type=int, default=5000)
+        parser.add_argument('--commandes', type=int, default=50000)
+        parser.add_argument('--lignes-max', type=int, default=5, help="Nombre maximal de lignes par commande.")
+        parser.add_argument('--taux-facture', type=float, default=0.8, help="Part des commandes facturées.")
+        parser.add_argument('--taux-paiement', type=float, default=0.6, help="Part des factures réglées.")
+        parser.add_argument('--jours', type=int, default=365, help="Période couverte, en jours avant aujourd'hui.")
+        parser.add_argument('--lot', type=int, default=5000, help="Commandes insérées par transaction.")
+        parser.add_argument('--graine', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['lot'] < 1:
+            raise CommandError("--lot doit être supérieur à 0.")
+        if options['commandes'] > 0 and min(options['medicaments'], options['clients'], options['lignes_max']) < 1:
+            raise CommandError("Générer des commandes demande au moins un médicament, un client et --lignes-max >= 1.")
+        self.rng = random.Random(options['graine'])
+        self.maintenant = timezone.now()
+
+        medicaments = self._generer_medicaments(options['medicaments'])
+        client_ids = self._generer_clients(options['clients'])
+        self.stdout.write(f"{len(medicaments)} médicament(s), {len(client_ids)} client(s) créés.")
+
+        with dates_libres((Commande, 'date_commande'), (Facture, 'date_facture'), (Paiement, 'date_paiement')):
+            total = options['commandes']
+            for debut in range(0, total, options['lot']):
+                with transaction.atomic():
+                    self._generer_lot(min(options['lot'], total - debut), medicaments, client_ids, options)
+                self.stdout.write(f"{min(debut + options['lot'], total)}/{total} commande(s)")
+
+        # Tables dérivées non maintenues par les insertions groupées
+        reconstruire_ventes_journalieres()
+        reconstruire_index()
+        self.stdout.write(self.style.SUCCESS("Données générées."))
+
+    def _generer_medicaments(self, nombre):
+        rng = self.rng
+        medicaments = Medicament.objects.bulk_create(numeroter_synchro(Medicament, [
+            Medicament(
+                nom=f"{rng.choice(PREFIXES)}{rng.choice(SUFFIXES)} {rng.choice([100, 200, 250, 500, 1000])}mg #{i}",
+                categorie=rng.choice(CATEGORIES),
+                prix=Decimal(rng.randint(150, 4500)) / 100,
+                quantite_en_stock=rng.randint(0, 500),
+                seuil_alerte=rng.choice([5, 10, 20]),
+            )
+            for i in range(nombre)
+        ]), batch_size=5000)
+        return [(medicament.pk, medicament.prix) for medicament in medicaments]
+
+    def _generer_clients(self, nombre):
+        rng = self.rng
+        clients = Client.objects.bulk_create(numeroter_synchro(Client, [
+            Client(
+                nom=rng.choice(NOMS), prenom=rng.choice(PRENOMS),
+                adresse=f"{rng.randint(1, 200)} rue de la Pharmacie",
+                telephone=f"06{rng.randint(0, 99999999):08d}",
+                est_regulier=rng.random() < 0.3,
+            )
+            for _ in range(nombre)
+        ]), batch_size=5000)
+        return [client.pk for client in clients]
+
+    def _generer_lot(self, taille, medicaments, client_ids, options):
+        rng = self.rng
+        commandes, lignes_par_commande = [], []
+        for _ in range(taille):
+            choisis = rng.sample(medicaments, rng.randint(1, min(options['lignes_max'], len(medicaments))))
+            lignes = [(pk, prix, rng.randint(1, 5)) for pk, prix in choisis]
+            commandes.append(Commande(
+                client_id=rng.choice(client_ids),
+                date_commande=self.maintenant - timedelta(seconds=rng.randint(0, options['jours'] * 86400)),
+                statut=rng.choices(STATUTS, weights=[2, 7, 1])[0],
+                montant_total=sum(prix * quantite for _, prix, quantite in lignes),
+                nombre_lignes=len(lignes),
+            ))
+            lignes_par_commande.append(lignes)
+        Commande.objects.bulk_create(commandes, batch_size=2000)
+
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande_id=commande.pk, medicament_id=pk, quantite=quantite, prix_unitaire=prix)
+            for commande, lignes in zip(commandes, lignes_par_commande)
+            for pk, prix, quantite in lignes
+        ], batch_size=2000)
+
+        factures = []
+        for commande in commandes:
+            if commande.statut == 'Annulée' or rng.random() >= options['taux_facture']:
+                continue
+            remise = Decimal(rng.choice([0, 0, 0, 5, 10]))
+            factures.append(Facture(
+                commande_id=commande.pk,
+                client_id=commande.client_id,
+                date_facture=commande.date_commande + timedelta(minutes=rng.randint(1, 120)),
+                remise=remise,
+                montant_total=commande.montant_total,
+                montant_net=montant_net(commande.montant_total, remise),
+                methode_paiement=rng.choice(METHODES),
+            ))
+        payees = []
+        for facture in factures:
+            if rng.random() < options['taux_paiement']:
+                facture.montant_paye = facture.montant_net
+                facture.est_payee = True
+                payees.append(facture)
+        Facture.objects.bulk_create(factures, batch_size=2000)
+
+        Paiement.objects.bulk_create([
+            Paiement(
+                facture_id=facture.pk, montant=facture.montant_paye, methode=facture.methode_paiement,
+                date_paiement=min(facture.date_facture + timedelta(days=rng.randint(0, 30)), self.maintenant),
+            )
+            for facture in payees
+        ], batch_size=2000)
@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from gestion.routers import ALIAS_REPLIQUE
+
+
+class Command(BaseCommand):
+    help = ("Recopie la base principale dans la réplique en lecture avec l'API de sauvegarde SQLite, "
+            "une fois ou à intervalle régulier.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--destination', help="Fichier de la réplique (par défaut, la base 'replica' configurée).")
+        parser.add_argument('--intervalle', type=float, default=0,
+                            help="Secondes entre deux copies ; 0 pour une seule copie.")
+        parser.add_argument('--pages', type=int, default=-1,
+                            help="Pages copiées par étape (-1 : tout en une étape).")
+
+    def handle(self, *args, **options):
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != 'sqlite':
+            raise CommandError("La réplique par sauvegarde n'est disponible qu'avec SQLite.")
+        destination = options['destination'] or settings.DATABASES.get(ALIAS_REPLIQUE, {}).get('NAME')
+        if not destination:
+            raise CommandError("Aucune réplique configurée (PHARMACIE_PROFIL_BD=production) ; précisez --destination.")
+
+        while True:
+            debut = time.perf_counter()
+            source.ensure_connection()
+            cible = sqlite3.connect(destination)
+            try:
+                source.connection.backup(cible, pages=options['pages'])
+            finally:
+                cible.close()
+            self.stdout.write(f"Réplique {destination} rafraîchie en {(time.perf_counter() - debut) * 1000:.0f} ms.")
+            if not options['intervalle']:
+                break
+            time.sleep(options['intervalle'])
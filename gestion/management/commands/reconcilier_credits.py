@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from gestion.models import Client, MouvementCredit
+from gestion.services import prochaine_sequence
+
+
+class Command(BaseCommand):
+    help = "Compare le crédit stocké sur Client avec le solde du registre MouvementCredit."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corriger', action='store_true',
+                            help="Reconstruit depuis le registre les soldes incohérents.")
+
+    def handle(self, *args, **options):
+        soldes = (
+            MouvementCredit.objects
+            .filter(client=OuterRef('pk'))
+            .order_by()
+            .values('client')
+            .annotate(solde=Round(Sum('montant'), 2))
+            .values('solde')
+        )
+        clients = (
+            Client.objects
+            .annotate(solde_registre=Coalesce(
+                Subquery(soldes),
+                Value(0),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ))
+            .filter(~Q(credit=F('solde_registre')))
+            .values_list('pk', 'credit', 'solde_registre')
+        )
+
+        incoherents = 0
+        for pk, credit, solde_registre in clients.iterator():
+            incoherents += 1
+            self.stdout.write(f"Client #{pk}: crédit {credit} (registre {solde_registre})")
+            if options['corriger']:
+                Client.objects.filter(pk=pk).update(
+                    credit=solde_registre, date_modification=timezone.now(), sequence_synchro=prochaine_sequence(Client),
+                )
+
+        if not incoherents:
+            self.stdout.write(self.style.SUCCESS("Tous les soldes de crédit sont cohérents avec le registre."))
+        elif options['corriger']:
+            self.stdout.write(self.style.SUCCESS(f"{incoherents} solde(s) reconstruit(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{incoherents} solde(s) incohérent(s)."))
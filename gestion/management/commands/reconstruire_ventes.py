@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from gestion.services import reconstruire_ventes_journalieres
+
+
+class Command(BaseCommand):
+    help = "Reconstruit le cumul journalier des ventes (VenteJournaliere) depuis les factures."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=date.fromisoformat, help="Premier jour (AAAA-MM-JJ).")
+        parser.add_argument('--fin', type=date.fromisoformat, help="Dernier jour (AAAA-MM-JJ).")
+
+    def handle(self, *args, **options):
+        nombre = reconstruire_ventes_journalieres(options['debut'], options['fin'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} ligne(s) de cumul reconstruite(s)."))
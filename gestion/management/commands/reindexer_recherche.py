@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from gestion.recherche import reconstruire_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des médicaments."
+
+    def handle(self, *args, **options):
+        reconstruire_index()
+        self.stdout.write(self.style.SUCCESS("Index de recherche reconstruit."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from gestion.models import Commande
+
+
+class Command(BaseCommand):
+    help = "Compare les totaux stockés sur Commande avec les totaux recalculés depuis les lignes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corriger', action='store_true',
+                            help="Réécrit les totaux stockés incohérents.")
+
+    def handle(self, *args, **options):
+        commandes = (
+            Commande.objects
+            .annotate(
+                # Arrondi au centime : SQLite calcule le produit en flottant
+                total_reel=Coalesce(
+                    Round(Sum(F('lignes__quantite') * F('lignes__prix_unitaire')), 2),
+                    Value(0),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+                lignes_reelles=Count('lignes'),
+            )
+            .filter(~Q(montant_total=F('total_reel')) | ~Q(nombre_lignes=F('lignes_reelles')))
+            .values_list('pk', 'montant_total', 'total_reel', 'nombre_lignes', 'lignes_reelles')
+        )
+
+        incoherentes = 0
+        for pk, montant_total, total_reel, nombre_lignes, lignes_reelles in commandes.iterator():
+            incoherentes += 1
+            self.stdout.write(
+                f"Commande #{pk}: total {montant_total} (réel {total_reel}), "
+                f"lignes {nombre_lignes} (réel {lignes_reelles})"
+            )
+            if options['corriger']:
+                Commande.objects.filter(pk=pk).update(
+                    montant_total=total_reel, nombre_lignes=lignes_reelles,
+                    date_modification=timezone.now(), version=F('version') + 1)
+
+        if not incoherentes:
+            self.stdout.write(self.style.SUCCESS("Tous les totaux de commande sont cohérents."))
+        elif options['corriger']:
+            self.stdout.write(self.style.SUCCESS(f"{incoherentes} commande(s) corrigée(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{incoherentes} commande(s) incohérente(s)."))
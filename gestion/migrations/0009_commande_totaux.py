@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:07
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remplir_totaux(apps, schema_editor):
+    Commande = apps.get_model('gestion', 'Commande')
+    LigneCommande = apps.get_model('gestion', 'LigneCommande')
+    lignes = LigneCommande.objects.filter(commande=OuterRef('pk')).values('commande')
+    Commande.objects.update(
+        montant_total=Coalesce(
+            Subquery(lignes.annotate(total=Sum(F('quantite') * F('prix_unitaire'))).values('total')),
+            0,
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        nombre_lignes=Coalesce(Subquery(lignes.annotate(nombre=Count('id')).values('nombre')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_facture_methode_paiement_alter_facture_montant_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='montant_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='commande',
+            name='nombre_lignes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(remplir_totaux, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:09
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_commande_totaux'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicament',
+            index=models.Index(fields=['quantite_en_stock'], name='medicament_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicament',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('quantite_en_stock'), '-', models.F('seuil_alerte')), name='medicament_marge_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:10
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def remplir_ventes(apps, schema_editor):
+    Facture = apps.get_model('gestion', 'Facture')
+    VenteJournaliere = apps.get_model('gestion', 'VenteJournaliere')
+    totaux = {}
+    lignes = Facture.objects.values_list('date_facture', 'methode_paiement', 'montant_total', 'remise')
+    for date_facture, methode, montant_total, remise in lignes.iterator():
+        cle = (timezone.localdate(date_facture), methode)
+        net = (montant_total * (100 - remise) / 100).quantize(Decimal('0.01'))
+        nombre, brut_cumul, net_cumul = totaux.get(cle, (0, Decimal(0), Decimal(0)))
+        totaux[cle] = (nombre + 1, brut_cumul + montant_total, net_cumul + net)
+    VenteJournaliere.objects.bulk_create([
+        VenteJournaliere(jour=jour, methode_paiement=methode, nombre_factures=nombre,
+                         montant_brut=brut, montant_net=net)
+        for (jour, methode), (nombre, brut, net) in totaux.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_medicament_index_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VenteJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('methode_paiement', models.CharField(choices=[('ESP', 'Espèces'), ('CB', 'Carte Bancaire'), ('CHQ', 'Chèque'), ('CRD', 'Crédit')], max_length=3)),
+                ('nombre_factures', models.IntegerField(default=0)),
+                ('montant_brut', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('montant_net', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'ordering': ['jour', 'methode_paiement'],
+                'constraints': [models.UniqueConstraint(fields=('jour', 'methode_paiement'), name='vente_journaliere_jour_methode_unique')],
+            },
+        ),
+        migrations.RunPython(remplir_ventes, migrations.RunPython.noop),
+    ]
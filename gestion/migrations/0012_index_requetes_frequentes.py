@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_vente_journaliere'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['client', 'date_commande'], name='commande_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['date_commande', 'id'], name='commande_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['statut', 'date_commande'], name='commande_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['date_facture', 'id'], name='facture_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['methode_paiement', 'est_payee'], name='facture_methode_payee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicament',
+            index=models.Index(fields=['nom'], name='medicament_nom_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicament',
+            index=models.Index(fields=['categorie', 'nom'], name='medicament_categorie_nom_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:17
+
+from django.db import migrations
+
+SQL_CREATION = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS medicament_recherche USING fts5("
+    "nom, categorie, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+)
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(SQL_CREATION)
+    schema_editor.execute(
+        "INSERT INTO medicament_recherche (rowid, nom, categorie) "
+        "SELECT id, nom, categorie FROM gestion_medicament"
+    )
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS medicament_recherche")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_index_requetes_frequentes'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
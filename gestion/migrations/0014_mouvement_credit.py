@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def ouvrir_registre(apps, schema_editor):
+    # Solde d'ouverture : le crédit existant devient le premier mouvement
+    Client = apps.get_model('gestion', 'Client')
+    MouvementCredit = apps.get_model('gestion', 'MouvementCredit')
+    MouvementCredit.objects.bulk_create([
+        MouvementCredit(client_id=pk, montant=credit, motif='OUVERTURE')
+        for pk, credit in Client.objects.exclude(credit=0).values_list('pk', 'credit').iterator()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_medicament_recherche'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='credit',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='MouvementCredit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('montant', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('motif', models.CharField(choices=[('OUVERTURE', "Solde d'ouverture"), ('FACTURE', 'Facture à crédit'), ('PAIEMENT', 'Paiement à crédit'), ('REMBOURSEMENT', 'Remboursement'), ('AJUSTEMENT', 'Ajustement')], max_length=15)),
+                ('date_mouvement', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements_credit', to='gestion.client')),
+                ('facture', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_credit', to='gestion.facture')),
+                ('paiement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_credit', to='gestion.paiement')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client', 'date_mouvement'], name='mouvement_client_date_idx')],
+            },
+        ),
+        migrations.RunPython(ouvrir_registre, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:25
+
+from django.db import migrations, models
+from django.db.models import BooleanField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def remplir_montants(apps, schema_editor):
+    Facture = apps.get_model('gestion', 'Facture')
+    Paiement = apps.get_model('gestion', 'Paiement')
+    Facture.objects.update(montant_net=Round(F('montant_total') * (100 - F('remise')) / 100, 2))
+    # montant_paye et est_payee n'étaient pas maintenus : les reprendre des
+    # paiements valides
+    payes = (Paiement.objects.filter(facture=OuterRef('pk'), est_valide=True)
+             .order_by().values('facture').annotate(total=Sum('montant')).values('total'))
+    Facture.objects.update(montant_paye=Round(Coalesce(Subquery(payes), Value(0)), 2))
+    Facture.objects.update(est_payee=ExpressionWrapper(Q(montant_net__lte=F('montant_paye')), output_field=BooleanField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0014_mouvement_credit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='montant_net',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='facture',
+            name='montant_paye',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(remplir_montants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def remplir_client(apps, schema_editor):
+    Commande = apps.get_model('gestion', 'Commande')
+    Facture = apps.get_model('gestion', 'Facture')
+    Facture.objects.update(client_id=Subquery(
+        Commande.objects.filter(pk=OuterRef('commande_id')).values('client_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0015_facture_montants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='client',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='factures', to='gestion.client'),
+        ),
+        migrations.RunPython(remplir_client, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='facture',
+            name='client',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='factures', to='gestion.client'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(condition=models.Q(('est_payee', False)), fields=['client', 'date_facture', 'montant_net', 'montant_paye'], name='facture_impayee_client_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0016_facture_client'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='commande',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='medicament',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['date_modification'], name='client_modification_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['date_modification'], name='commande_modification_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['date_modification'], name='facture_modification_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicament',
+            index=models.Index(fields=['date_modification'], name='medicament_modification_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:06
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def numeroter_existants(apps, schema_editor):
+    # Séquences initiales distinctes et non nulles : une synchronisation
+    # depuis 0 voit toutes les lignes existantes
+    for nom in ('Medicament', 'Client'):
+        apps.get_model('gestion', nom).objects.update(sequence_synchro=F('pk'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0017_date_modification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuppressionSynchro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modele', models.CharField(choices=[('medicament', 'Médicament'), ('client', 'Client')], max_length=20)),
+                ('objet_id', models.BigIntegerField()),
+                ('sequence', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='sequence_synchro',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='medicament',
+            name='sequence_synchro',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(numeroter_existants, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['sequence_synchro'], name='client_sequence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicament',
+            index=models.Index(fields=['sequence_synchro'], name='medicament_sequence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suppressionsynchro',
+            index=models.Index(fields=['modele', 'sequence'], name='suppression_sequence_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0018_sequence_synchro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
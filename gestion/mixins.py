@@ -0,0 +1,139 @@
+import json
+from functools import lru_cache
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+
+
+class StreamingListMixin:
+    """Export en flux (`?stream=1`) : les lignes sont sérialisées au fil du
+    curseur de la base, la mémoire reste constante quelle que soit la taille
+    de la table."""
+    stream_param = 'stream'
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_param) in ('1', 'true'):
+            return self.stream_list(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
+    def stream_list(self, queryset):
+        ordering = getattr(self.pagination_class, 'ordering', None)
+        if ordering:
+            queryset = queryset.order_by(*([ordering] if isinstance(ordering, str) else ordering))
+        response = StreamingHttpResponse(self._stream_rows(queryset), content_type='application/json')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def _stream_rows(self, queryset):
+        yield '['
+        for index, donnees in enumerate(self._stream_donnees(queryset)):
+            ligne = json.dumps(donnees, cls=encoders.JSONEncoder,
+                               ensure_ascii=False, separators=(',', ':'))
+            yield ligne if index == 0 else ',' + ligne
+        yield ']'
+
+    def _stream_donnees(self, queryset):
+        valeurs = self.get_valeurs_serializer() if hasattr(self, 'get_valeurs_serializer') else None
+        if valeurs is None:
+            serializer = self.get_serializer()
+            for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+                yield serializer.to_representation(obj)
+            return
+        lignes = valeurs.preparer(queryset).iterator(chunk_size=self.stream_chunk_size)
+        while lot := list(islice(lignes, self.stream_chunk_size)):
+            yield from valeurs.serialiser(lot)
+
+
+class ValeursListMixin:
+    """Lecture rapide des listes : la page est lue avec `.values()` et
+    convertie par `valeurs_serializer_class` (voir ValeursSerializer), sans
+    instancier de modèles. Le JSON est identique à celui de serializer_class."""
+    valeurs_serializer_class = None
+
+    def get_valeurs_serializer(self):
+        if not self.valeurs_serializer_class:
+            return None
+        champs = self.champs_demandes() if hasattr(self, 'champs_demandes') else None
+        return self.valeurs_serializer_class(champs=champs)
+
+    def list(self, request, *args, **kwargs):
+        valeurs = self.get_valeurs_serializer()
+        if valeurs is None:
+            return super().list(request, *args, **kwargs)
+        # Colonnes du curseur de pagination, lues même si non demandées
+        queryset = valeurs.preparer(self.filter_queryset(self.get_queryset()), *colonnes_tri(self.pagination_class))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(valeurs.serialiser(page))
+        return Response(valeurs.serialiser(queryset))
+
+
+def colonnes_tri(pagination_class):
+    ordering = getattr(pagination_class, 'ordering', None) or ()
+    return [champ.lstrip('-') for champ in ([ordering] if isinstance(ordering, str) else ordering)]
+
+
+@lru_cache(maxsize=None)
+def _champs_disponibles(serializer_class):
+    champs = serializer_class().fields
+    return tuple(champs), frozenset(nom for nom, champ in champs.items() if isinstance(champ, serializers.BaseSerializer))
+
+
+def _liste_parametre(valeur):
+    return None if valeur is None else [nom.strip() for nom in valeur.split(',') if nom.strip()]
+
+
+def resoudre_champs(params, serializer_class):
+    """Champs de premier niveau demandés par `?fields=` et `?expand=`, dans
+    l'ordre du serializer, ou None sans ces paramètres (représentation
+    complète). Dès que l'un est fourni, les relations imbriquées sont à la
+    demande : incluses seulement si nommées dans `expand` ou `fields`."""
+    fields, expand = _liste_parametre(params.get('fields')), _liste_parametre(params.get('expand'))
+    if fields is None and expand is None:
+        return None
+    disponibles, imbriques = _champs_disponibles(serializer_class)
+    erreurs = {}
+    if fields == []:
+        erreurs['fields'] = "Aucun champ demandé"
+    elif inconnus := [nom for nom in fields or () if nom not in disponibles]:
+        erreurs['fields'] = f"Champ(s) inconnu(s) : {', '.join(inconnus)}"
+    if inconnus := [nom for nom in expand or () if nom not in imbriques]:
+        erreurs['expand'] = f"Relation(s) non extensible(s) : {', '.join(inconnus)}"
+    if erreurs:
+        raise serializers.ValidationError(erreurs)
+    demandes = set(expand or ())
+    demandes.update(fields if fields is not None else (nom for nom in disponibles if nom not in imbriques))
+    return [nom for nom in disponibles if nom in demandes]
+
+
+class ChampsDemandesMixin:
+    """Représentations partielles en lecture (`?fields=id,statut&expand=lignes`,
+    voir resoudre_champs) : le serializer ne construit que les champs demandés
+    et le queryset ne lit que leurs colonnes, jointures et préchargements
+    (ValeursSerializer.restreindre)."""
+
+    def champs_demandes(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if not hasattr(self, '_champs_demandes'):
+            self._champs_demandes = resoudre_champs(request.query_params, self.get_serializer_class())
+        return self._champs_demandes
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        champs = self.champs_demandes()
+        valeurs = getattr(self, 'valeurs_serializer_class', None)
+        if champs is None or valeurs is None:
+            return queryset
+        return valeurs.restreindre(queryset, champs, *colonnes_tri(self.pagination_class))
+
+    def get_serializer(self, *args, **kwargs):
+        champs = self.champs_demandes()
+        if champs is not None:
+            kwargs.setdefault('champs', champs)
+        return super().get_serializer(*args, **kwargs)
@@ -1,16 +1,59 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.utils.html import format_html
 
 # Create your models here.
 from django.db import models
 
+def proteger_champs(instance, champs, kwargs):
+    """Pour une mise à jour sans update_fields, exclut du save() les colonnes
+    maintenues par des UPDATE atomiques : une instance périmée ne doit jamais
+    les réécrire."""
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        differes = instance.get_deferred_fields()
+        kwargs['update_fields'] = [
+            champ.name for champ in instance._meta.concrete_fields
+            if not champ.primary_key
+            and champ.name not in champs
+            and (champ.attname not in differes or getattr(champ, 'auto_now', False))
+        ]
+    return kwargs
+
+class MedicamentQuerySet(models.QuerySet):
+    def en_rupture(self):
+        return self.filter(quantite_en_stock__lte=0)
+
+    def stock_faible(self):
+        # Même expression que l'index medicament_marge_stock_idx pour qu'il soit utilisé
+        return self.alias(marge_stock=models.F('quantite_en_stock') - models.F('seuil_alerte')).filter(marge_stock__lte=0)
+
+    def valeur_stock(self):
+        return self.aggregate(
+            valeur=models.Sum(models.F('prix') * models.F('quantite_en_stock'))
+        )['valeur'] or 0
+
 class Medicament(models.Model):
     nom = models.CharField(max_length=100)
     categorie = models.CharField(max_length=100)
     prix = models.DecimalField(max_digits=8, decimal_places=2)
     quantite_en_stock = models.IntegerField()
     seuil_alerte = models.IntegerField(default=10)  # Seuil d'alerte pour stock bas
+    # Horodatage des ETag (voir conditionnel.py) : aussi posé par les UPDATE directs
+    date_modification = models.DateTimeField(auto_now=True)
+    # Synchronisation différentielle : voir services.prochaine_sequence
+    sequence_synchro = models.BigIntegerField(default=0, editable=False)
+
+    objects = MedicamentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_modification'], name='medicament_modification_idx'),
+            models.Index(fields=['sequence_synchro'], name='medicament_sequence_idx'),
+            models.Index(fields=['quantite_en_stock'], name='medicament_stock_idx'),
+            models.Index(models.F('quantite_en_stock') - models.F('seuil_alerte'), name='medicament_marge_stock_idx'),
+            models.Index(fields=['nom'], name='medicament_nom_idx'),
+            models.Index(fields=['categorie', 'nom'], name='medicament_categorie_nom_idx'),
+        ]
 
     def __str__(self):
         return self.nom
@@ -29,11 +72,11 @@ class Medicament(models.Model):
         return format_html('<span style="color: green;">En stock ({} unités)</span>', self.quantite_en_stock)
 
     def ajuster_stock(self, quantite):
-        nouvelle_quantite = self.quantite_en_stock - quantite
-        if nouvelle_quantite < 0:
+        from .services import ajuster_stock, invalider_champs
+
+        if not ajuster_stock(self.pk, -quantite):
             raise ValidationError("Stock insuffisant")
-        self.quantite_en_stock = nouvelle_quantite
-        self.save()
+        invalider_champs(self, 'quantite_en_stock')
 
 class Client(models.Model):
     nom = models.CharField(max_length=100)
@@ -41,18 +84,37 @@ class Client(models.Model):
     adresse = models.TextField()
     telephone = models.CharField(max_length=15)
     est_regulier = models.BooleanField(default=False)
-    credit = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Crédit disponible
+    # Crédit utilisé : solde mis en cache du registre MouvementCredit
+    credit = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     plafond_credit = models.DecimalField(max_digits=10, decimal_places=2, default=1000)  # Limite de crédit
+    date_modification = models.DateTimeField(auto_now=True)
+    sequence_synchro = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_modification'], name='client_modification_idx'),
+            models.Index(fields=['sequence_synchro'], name='client_sequence_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **proteger_champs(self, ('credit',), kwargs))
 
     def __str__(self):
         return f"{self.nom} {self.prenom}"
 
     def get_historique_achats(self):
-        return self.commande_set.all().order_by('-date_commande')
+        return self.commande_set.avec_details().order_by('-date_commande')
 
     def peut_acheter_a_credit(self, montant):
         return (self.credit + montant) <= self.plafond_credit
 
+class CommandeQuerySet(models.QuerySet):
+    def avec_details(self):
+        # Client et lignes (avec leur médicament) chargés en un nombre fixe de requêtes
+        return self.select_related('client').prefetch_related(
+            models.Prefetch('lignes', queryset=LigneCommande.objects.select_related('medicament'))
+        )
+
 class Commande(models.Model):
     STATUT_CHOICES = [
         ('En attente', 'En attente'),
@@ -64,15 +126,64 @@ class Commande(models.Model):
     medicaments = models.ManyToManyField(Medicament, through='LigneCommande')
     date_commande = models.DateTimeField(auto_now_add=True)
     statut = models.CharField(max_length=50, choices=STATUT_CHOICES, default='En attente')
+    # Totaux dénormalisés, maintenus par LigneCommande.save/delete
+    montant_total = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    nombre_lignes = models.PositiveIntegerField(default=0, editable=False)
+    date_modification = models.DateTimeField(auto_now=True)
+    # Verrou optimiste : incrémenté par chaque écriture de la commande ou de
+    # ses lignes, comparé par CommandeSerializer.update
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CommandeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_modification'], name='commande_modification_idx'),
+            # Historique client (Client.get_historique_achats)
+            models.Index(fields=['client', 'date_commande'], name='commande_client_date_idx'),
+            # Pagination par curseur (-date_commande, -id)
+            models.Index(fields=['date_commande', 'id'], name='commande_date_id_idx'),
+            # Filtre par statut de CommandeAdmin
+            models.Index(fields=['statut', 'date_commande'], name='commande_statut_date_idx'),
+        ]
+
+    CHAMPS_DENORMALISES = ('montant_total', 'nombre_lignes')
+
+    def save(self, *args, **kwargs):
+        from .services import invalider_champs
+
+        modification = not self._state.adding
+        kwargs = proteger_champs(self, self.CHAMPS_DENORMALISES, kwargs)
+        if modification:
+            self.version = models.F('version') + 1
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'version']
+        super().save(*args, **kwargs)
+        if modification:
+            invalider_champs(self, 'version')
+        if modification and 'client' in kwargs['update_fields']:
+            # Garder le client recopié sur la facture
+            Facture.objects.filter(commande=self).exclude(client_id=self.client_id).update(client_id=self.client_id)
 
     def calculer_total(self):
-        return sum(ligne.sous_total() for ligne in self.lignes.all())
+        return self.montant_total
+
+    def recalculer_totaux(self):
+        totaux = self.lignes.aggregate(
+            montant_total=models.Sum(models.F('quantite') * models.F('prix_unitaire')),
+            nombre_lignes=models.Count('id'),
+        )
+        return totaux['montant_total'] or 0, totaux['nombre_lignes']
 
     def valider_commande(self):
-        for ligne in self.lignes.all():
-            ligne.medicament.ajuster_stock(ligne.quantite)
-        self.statut = 'Expédiée'
-        self.save()
+        with transaction.atomic():
+            for ligne in self.lignes.select_related('medicament'):
+                try:
+                    ligne.medicament.ajuster_stock(ligne.quantite)
+                except ValidationError:
+                    # Même message que l'ajout d'une ligne et la validation par lot
+                    ligne._stock_insuffisant()
+            self.statut = 'Expédiée'
+            self.save()
 
     def __str__(self):
         return f"Commande #{self.id} - {self.client} - {self.calculer_total()}€"
@@ -84,36 +195,56 @@ class LigneCommande(models.Model):
     prix_unitaire = models.DecimalField(max_digits=8, decimal_places=2, editable=False, default=0)
 
     def save(self, *args, **kwargs):
+        from .services import reserver_stock, liberer_stock, maj_totaux_commande, invalider_champs
+
         if not self.prix_unitaire:
             self.prix_unitaire = self.medicament.prix
-        
-        # Vérifier si c'est une nouvelle ligne
-        if not self.pk:
-            # Vérifier le stock disponible
-            if self.quantite > self.medicament.quantite_en_stock:
-                raise ValidationError(f"Stock insuffisant pour {self.medicament.nom}. Disponible: {self.medicament.quantite_en_stock}")
-            # Mettre à jour le stock
-            self.medicament.quantite_en_stock -= self.quantite
-            self.medicament.save()
-        else:
-            # Pour une mise à jour, récupérer l'ancienne quantité
-            ancien = LigneCommande.objects.get(pk=self.pk)
-            difference = self.quantite - ancien.quantite
-            if difference > 0:  # Si on augmente la quantité
-                if difference > self.medicament.quantite_en_stock:
-                    raise ValidationError(f"Stock insuffisant pour {self.medicament.nom}. Disponible: {self.medicament.quantite_en_stock}")
-                self.medicament.quantite_en_stock -= difference
-            else:  # Si on diminue la quantité
-                self.medicament.quantite_en_stock += abs(difference)
-            self.medicament.save()
-
-        super().save(*args, **kwargs)
+        # Le delta des totaux est calculé en Python : un prix ou une quantité
+        # reçus en chaîne (Medicament.objects.create(prix='2.50')) le fausseraient
+        for champ in ('quantite', 'prix_unitaire'):
+            setattr(self, champ, self._meta.get_field(champ).to_python(getattr(self, champ)))
+
+        with transaction.atomic():
+            # Vérifier si c'est une nouvelle ligne
+            if not self.pk:
+                if not reserver_stock(self.medicament_id, self.quantite):
+                    self._stock_insuffisant()
+                maj_totaux_commande(self.commande_id, self.sous_total(), 1)
+            else:
+                # Pour une mise à jour, comparer avec la ligne enregistrée
+                ancienne = LigneCommande.objects.only(
+                    'commande_id', 'medicament_id', 'quantite', 'prix_unitaire').get(pk=self.pk)
+                if ancienne.medicament_id != self.medicament_id:
+                    liberer_stock(ancienne.medicament_id, ancienne.quantite)
+                    if not reserver_stock(self.medicament_id, self.quantite):
+                        self._stock_insuffisant()
+                elif self.quantite != ancienne.quantite:
+                    if not reserver_stock(self.medicament_id, self.quantite - ancienne.quantite):
+                        self._stock_insuffisant()
+                if ancienne.commande_id != self.commande_id:
+                    maj_totaux_commande(ancienne.commande_id, -ancienne.sous_total(), -1)
+                    maj_totaux_commande(self.commande_id, self.sous_total(), 1)
+                else:
+                    maj_totaux_commande(self.commande_id, self.sous_total() - ancienne.sous_total(), 0)
+            invalider_champs(self._state.fields_cache.get('medicament'), 'quantite_en_stock')
+            invalider_champs(self._state.fields_cache.get('commande'), *Commande.CHAMPS_DENORMALISES)
+
+            super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
+        from .services import liberer_stock, maj_totaux_commande, invalider_champs
+
         # Restaurer le stock lors de la suppression
-        self.medicament.quantite_en_stock += self.quantite
-        self.medicament.save()
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            liberer_stock(self.medicament_id, self.quantite)
+            maj_totaux_commande(self.commande_id, -self.sous_total(), -1)
+            invalider_champs(self._state.fields_cache.get('medicament'), 'quantite_en_stock')
+            invalider_champs(self._state.fields_cache.get('commande'), *Commande.CHAMPS_DENORMALISES)
+            return super().delete(*args, **kwargs)
+
+    def _stock_insuffisant(self):
+        medicament = Medicament.objects.only('nom', 'quantite_en_stock').get(pk=self.medicament_id)
+        raise ValidationError(f"Stock insuffisant pour {medicament.nom}. Disponible: {medicament.quantite_en_stock}")
 
     def sous_total(self):
         return self.quantite * self.prix_unitaire
@@ -127,6 +258,13 @@ class LigneCommande(models.Model):
     def __str__(self):
         return f"{self.medicament.nom} x{self.quantite}"
 
+class FactureQuerySet(models.QuerySet):
+    def impayees(self):
+        return self.filter(est_payee=False)
+
+    def avec_reste(self):
+        return self.annotate(reste=models.F('montant_net') - models.F('montant_paye'))
+
 class Facture(models.Model):
     METHODE_PAIEMENT_CHOICES = [
         ('ESP', 'Espèces'),
@@ -136,43 +274,96 @@ class Facture(models.Model):
     ]
 
     commande = models.OneToOneField(Commande, on_delete=models.CASCADE)
+    # Copie de commande.client : les rapports de créances groupent par client sans jointure
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, editable=False, related_name='factures')
     date_facture = models.DateTimeField(auto_now_add=True)
     remise = models.DecimalField(max_digits=5, decimal_places=2, default=0.0, help_text="Remise en pourcentage (ex: 10 pour 10%)")
     montant_total = models.DecimalField(max_digits=10, decimal_places=2, editable=False, default=0)
-    montant_paye = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Montant après remise, recalculé à chaque enregistrement de la facture
+    montant_net = models.DecimalField(max_digits=10, decimal_places=2, editable=False, default=0)
+    # Somme des paiements valides, maintenue par Paiement.save/delete
+    montant_paye = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     methode_paiement = models.CharField(max_length=3, choices=METHODE_PAIEMENT_CHOICES, default='ESP')
     est_payee = models.BooleanField(default=False)
+    # Aussi mis à jour par chaque paiement (liste imbriquée de FactureSerializer)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    objects = FactureQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_modification'], name='facture_modification_idx'),
+            # Filtres par période et pagination par curseur (-date_facture, -id)
+            models.Index(fields=['date_facture', 'id'], name='facture_date_id_idx'),
+            models.Index(fields=['methode_paiement', 'est_payee'], name='facture_methode_payee_idx'),
+            # Balance âgée : index couvrant limité aux factures impayées
+            models.Index(fields=['client', 'date_facture', 'montant_net', 'montant_paye'],
+                         condition=models.Q(est_payee=False), name='facture_impayee_client_idx'),
+        ]
 
     def save(self, *args, **kwargs):
+        from .services import enregistrer_vente_facture
+
+        ancienne = None
+        if self.pk:
+            ancienne = Facture.objects.filter(pk=self.pk).only(
+                'date_facture', 'methode_paiement', 'montant_total', 'remise').first()
+
+        with transaction.atomic():
+            self._enregistrer(*args, **proteger_champs(self, ('montant_paye',), kwargs))
+            # Répercuter la facture sur le cumul journalier des ventes
+            if ancienne is not None:
+                enregistrer_vente_facture(ancienne, signe=-1)
+            enregistrer_vente_facture(self)
+
+    # Suppression retirée du cumul journalier par le signal post_delete
+    # (signals.retirer_vente_facture), aussi émis par les cascades
+
+    def _enregistrer(self, *args, **kwargs):
+        from .services import imputer_credit, invalider_champs, montant_net
+
+        mouvement = None
+        self.client_id = self.commande.client_id
         if self.commande and (not self.pk or not self.montant_total):
             self.montant_total = self.commande.calculer_total() or 0
-            
-            # Vérifier le plafond de crédit si paiement par crédit
+
+            # Imputer la facture sur le crédit du client (plafond vérifié en SQL)
             if self.methode_paiement == 'CRD':
+                mouvement = montant_net(self.montant_total, self.remise)
                 client = self.commande.client
-                montant_final = self.montant_final()
-                if client.credit + montant_final > client.plafond_credit:
+                if not imputer_credit(client.pk, mouvement):
+                    client.refresh_from_db(fields=['credit', 'plafond_credit'])
                     raise ValidationError(
                         f"Le montant dépasse le plafond de crédit disponible. "
                         f"Crédit actuel: {client.credit}€, "
                         f"Plafond: {client.plafond_credit}€, "
-                        f"Montant facture: {montant_final}€"
+                        f"Montant facture: {mouvement}€"
                     )
-                # Mettre à jour le crédit du client
-                client.credit += montant_final
-                client.save()
-
+                invalider_champs(client, 'credit')
+
+        self.montant_net = montant_net(self.montant_total, self.remise)
+        modification = bool(self.pk)
+        if modification:
+            # Recalculé en SQL depuis montant_paye enregistré : une remise
+            # modifiée peut rendre la facture payée ou impayée
+            self.est_payee = models.ExpressionWrapper(
+                models.Q(montant_paye__gte=self.montant_net), output_field=models.BooleanField())
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'montant_net', 'est_payee'}
+        else:
+            self.est_payee = self.montant_paye >= self.montant_net
         super().save(*args, **kwargs)
+        if modification:
+            invalider_champs(self, 'est_payee')
+        if mouvement is not None:
+            MouvementCredit.objects.create(client_id=self.commande.client_id, montant=mouvement,
+                                           motif='FACTURE', facture=self)
 
     def montant_final(self):
-        if not self.montant_total:
-            return 0
-        remise_decimale = float(self.remise or 0) / 100
-        montant_remise = float(self.montant_total) * remise_decimale
-        return float(self.montant_total) - montant_remise
+        return self.montant_net
 
     def montant_restant(self):
-        return self.montant_final() - float(self.montant_paye or 0)
+        return self.montant_net - self.montant_paye
 
     def __str__(self):
         status = "Payée" if self.est_payee else f"Reste {self.montant_restant():.2f}€"
@@ -194,10 +385,105 @@ class Paiement(models.Model):
     est_valide = models.BooleanField(default=True)
 
     def save(self, *args, **kwargs):
-        if self.methode == 'CRD':
-            client = self.facture.commande.client
-            if not client.peut_acheter_a_credit(self.montant):
-                raise ValidationError("Limite de crédit dépassée")
-            client.credit += self.montant
-            client.save()
+        from .services import imputer_credit, maj_montant_paye, invalider_champs
+
+        ancien = None
+        if self.pk:
+            ancien = Paiement.objects.filter(pk=self.pk).only('facture_id', 'montant', 'est_valide').first()
+
+        with transaction.atomic():
+            # Le crédit n'est imputé qu'à la création : un nouvel enregistrement
+            # du même paiement ne doit pas le compter deux fois
+            client_id = None
+            if not self.pk and self.methode == 'CRD':
+                client_id = Commande.objects.filter(facture=self.facture_id).values_list('client_id', flat=True).get()
+                if not imputer_credit(client_id, self.montant):
+                    raise ValidationError("Limite de crédit dépassée")
+            super().save(*args, **kwargs)
+            if client_id is not None:
+                MouvementCredit.objects.create(client_id=client_id, montant=self.montant,
+                                               motif='PAIEMENT', paiement=self)
+
+            # Répercuter le paiement sur le montant payé de la facture
+            if ancien is not None and ancien.est_valide:
+                maj_montant_paye(ancien.facture_id, -ancien.montant)
+            maj_montant_paye(self.facture_id, self.montant if self.est_valide else 0)
+            invalider_champs(self._state.fields_cache.get('facture'), 'montant_paye', 'est_payee')
+
+    def delete(self, *args, **kwargs):
+        from .services import maj_montant_paye, invalider_champs
+
+        with transaction.atomic():
+            maj_montant_paye(self.facture_id, -self.montant if self.est_valide else 0)
+            invalider_champs(self._state.fields_cache.get('facture'), 'montant_paye', 'est_payee')
+            return super().delete(*args, **kwargs)
+
+class VenteJournaliere(models.Model):
+    """Cumul des factures par jour et par méthode de paiement, maintenu par
+    Facture.save/delete et reconstructible avec `reconstruire_ventes`."""
+    jour = models.DateField()
+    methode_paiement = models.CharField(max_length=3, choices=Facture.METHODE_PAIEMENT_CHOICES)
+    nombre_factures = models.IntegerField(default=0)
+    montant_brut = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    montant_net = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'methode_paiement'], name='vente_journaliere_jour_methode_unique'),
+        ]
+        ordering = ['jour', 'methode_paiement']
+
+    def __str__(self):
+        return f"{self.jour} {self.methode_paiement} - {self.nombre_factures} facture(s) - {self.montant_net}€"
+
+class MouvementCredit(models.Model):
+    """Registre en ajout seul des mouvements de crédit client. Client.credit
+    en est le solde mis en cache (voir services.imputer_credit et la
+    commande `reconcilier_credits`)."""
+    MOTIF_CHOICES = [
+        ('OUVERTURE', "Solde d'ouverture"),
+        ('FACTURE', 'Facture à crédit'),
+        ('PAIEMENT', 'Paiement à crédit'),
+        ('REMBOURSEMENT', 'Remboursement'),
+        ('AJUSTEMENT', 'Ajustement'),
+    ]
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='mouvements_credit')
+    montant = models.DecimalField(max_digits=10, decimal_places=2)  # Positif : crédit consommé
+    motif = models.CharField(max_length=15, choices=MOTIF_CHOICES)
+    facture = models.ForeignKey(Facture, on_delete=models.SET_NULL, null=True, blank=True, related_name='mouvements_credit')
+    paiement = models.ForeignKey(Paiement, on_delete=models.SET_NULL, null=True, blank=True, related_name='mouvements_credit')
+    date_mouvement = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'date_mouvement'], name='mouvement_client_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Un mouvement de crédit ne peut pas être modifié")
         super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.client} {self.get_motif_display()} {self.montant}€"
+
+class SuppressionSynchro(models.Model):
+    """Pierre tombale d'un Medicament ou d'un Client supprimé, numérotée dans
+    la même séquence que ses lignes pour la synchronisation différentielle."""
+    MODELE_CHOICES = [
+        ('medicament', 'Médicament'),
+        ('client', 'Client'),
+    ]
+
+    modele = models.CharField(max_length=20, choices=MODELE_CHOICES)
+    objet_id = models.BigIntegerField()
+    sequence = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modele', 'sequence'], name='suppression_sequence_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.modele} #{self.objet_id} supprimé ({self.sequence})"
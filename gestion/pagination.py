@@ -0,0 +1,30 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class GestionCursorPagination(CursorPagination):
+    """Pagination par curseur : la position est encodée dans le jeton, chaque
+    page est une requête indexée quel que soit le volume de la table."""
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class CommandeCursorPagination(GestionCursorPagination):
+    ordering = ('-date_commande', '-id')
+
+
+class FactureCursorPagination(GestionCursorPagination):
+    ordering = ('-date_facture', '-id')
+
+
+class PaiementCursorPagination(GestionCursorPagination):
+    ordering = ('-date_paiement', '-id')
+
+
+class RapportPagination(PageNumberPagination):
+    """Pagination des rapports agrégés : le résultat (une ligne par client)
+    est calculé en une requête puis découpé en pages."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,69 @@
+import re
+
+from django.db import connection
+
+from .models import Medicament
+
+# Index plein texte FTS5 créé par la migration 0013 : diacritiques ignorés
+# ("paracetamol" trouve "Paracétamol"), index de préfixes pour la saisie.
+TABLE_RECHERCHE = 'medicament_recherche'
+
+def fts_disponible():
+    return connection.vendor == 'sqlite'
+
+
+def indexer_medicaments(medicaments):
+    """(Ré)indexe les médicaments donnés (instances ou tuples id, nom, categorie)."""
+    if not fts_disponible():
+        return
+    lignes = [
+        (m.pk, m.nom, m.categorie) if isinstance(m, Medicament) else tuple(m)
+        for m in medicaments
+    ]
+    if not lignes:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE_RECHERCHE} WHERE rowid = %s", [(ligne[0],) for ligne in lignes])
+        cursor.executemany(f"INSERT INTO {TABLE_RECHERCHE} (rowid, nom, categorie) VALUES (%s, %s, %s)", lignes)
+
+
+def retirer_medicament(medicament_id):
+    if not fts_disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE_RECHERCHE} WHERE rowid = %s", [medicament_id])
+
+
+def reconstruire_index():
+    if not fts_disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE_RECHERCHE}")
+        cursor.execute(
+            f"INSERT INTO {TABLE_RECHERCHE} (rowid, nom, categorie) "
+            f"SELECT id, nom, categorie FROM {Medicament._meta.db_table}"
+        )
+
+
+def requete_fts(terme):
+    """Transforme la saisie en requête FTS5 : chaque mot devient un préfixe,
+    tous les mots doivent être présents."""
+    mots = re.findall(r'\w+', terme)
+    return ' '.join(f'"{mot}"*' for mot in mots)
+
+
+def rechercher_medicaments(terme, limite=20):
+    """Médicaments classés par pertinence (bm25, le nom pèse plus que la
+    catégorie)."""
+    requete = requete_fts(terme)
+    if not requete:
+        return []
+    if not fts_disponible():
+        return list(Medicament.objects.filter(nom__icontains=terme.strip()).order_by('nom')[:limite])
+    return list(Medicament.objects.raw(
+        f"SELECT m.* FROM {TABLE_RECHERCHE} r "
+        f"JOIN {Medicament._meta.db_table} m ON m.id = r.rowid "
+        f"WHERE {TABLE_RECHERCHE} MATCH %s "
+        f"ORDER BY bm25({TABLE_RECHERCHE}, 10.0, 1.0), m.nom LIMIT %s",
+        [requete, limite],
+    ))
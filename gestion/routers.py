@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+ALIAS_REPLIQUE = 'replica'
+
+_lecture_replique = ContextVar('lecture_replique', default=False)
+
+
+@contextmanager
+def lecture_replique():
+    """Les lectures exécutées dans ce bloc partent vers la réplique si elle
+    est configurée (profil de production)."""
+    jeton = _lecture_replique.set(True)
+    try:
+        yield
+    finally:
+        _lecture_replique.reset(jeton)
+
+
+class LectureRepliqueMixin:
+    """Pour les vues DRF : les requêtes GET sont servies par la réplique."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return super().dispatch(request, *args, **kwargs)
+        with lecture_replique():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class RepliqueLectureRouter:
+    """La réplique est une copie de la base principale (API de sauvegarde
+    SQLite) : elle ne reçoit ni écriture ni migration, et n'est lue que dans
+    un bloc `lecture_replique()`."""
+
+    def db_for_read(self, model, **hints):
+        if _lecture_replique.get() and ALIAS_REPLIQUE in settings.DATABASES:
+            return ALIAS_REPLIQUE
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Même pour une instance lue sur la réplique
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_REPLIQUE
@@ -1,7 +1,25 @@
+from collections import defaultdict
+from itertools import zip_longest
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import BooleanField, Case, CharField, DecimalField, ExpressionWrapper, F, Q, Value, When
+from django.db.models.functions import Cast, Concat
 from rest_framework import serializers
 from .models import Medicament, Client, Commande, Facture, LigneCommande, Paiement
+from .services import ConflitVersion, invalider_champs, liberer_stock, maj_totaux_commande, reserver_stocks, verifier_version
+
+class ChampsDynamiquesMixin:
+    """Représentation partielle : `champs` restreint les champs de premier
+    niveau sérialisés (voir mixins.ChampsDemandesMixin)."""
+
+    def __init__(self, *args, champs=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if champs is not None:
+            for nom in set(self.fields) - set(champs):
+                self.fields.pop(nom)
 
-class MedicamentSerializer(serializers.ModelSerializer):
+class MedicamentSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     status_stock = serializers.SerializerMethodField()
     en_rupture = serializers.BooleanField(read_only=True)
     stock_faible = serializers.BooleanField(read_only=True)
@@ -18,7 +36,7 @@ class MedicamentSerializer(serializers.ModelSerializer):
             return f"Stock faible ({obj.quantite_en_stock} unités)"
         return f"En stock ({obj.quantite_en_stock} unités)"
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     credit_disponible = serializers.DecimalField(
         source='plafond_credit', 
         read_only=True,
@@ -31,26 +49,144 @@ class ClientSerializer(serializers.ModelSerializer):
         fields = ['id', 'nom', 'prenom', 'adresse', 'telephone', 
                  'est_regulier', 'credit', 'plafond_credit', 'credit_disponible']
 
+class PrimaryKeyPrechargeField(serializers.PrimaryKeyRelatedField):
+    """Résout la clé primaire depuis les instances préchargées dans le contexte
+    (voir CommandeListSerializer) avant de retomber sur une requête par valeur."""
+
+    def to_internal_value(self, data):
+        instances = self.context.get('instances_prechargees', {}).get(self.queryset.model)
+        if instances:
+            try:
+                return instances[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
 class LigneCommandeSerializer(serializers.ModelSerializer):
+    medicament = PrimaryKeyPrechargeField(queryset=Medicament.objects.all())
     nom_medicament = serializers.CharField(source='medicament.nom', read_only=True)
     prix_unitaire = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-    sous_total = serializers.DecimalField(source='sous_total', max_digits=10, decimal_places=2, read_only=True)
+    sous_total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = LigneCommande
         fields = ['id', 'medicament', 'nom_medicament', 'quantite', 'prix_unitaire', 'sous_total']
 
-class CommandeSerializer(serializers.ModelSerializer):
+    def validate_quantite(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("La quantité doit être supérieure à 0")
+        return value
+
+def precharger_instances(commandes_data):
+    """Clients et médicaments référencés par des données de commande brutes,
+    chargés en une requête par modèle pour PrimaryKeyPrechargeField."""
+    client_ids, medicament_ids = set(), set()
+    for commande_data in commandes_data:
+        if not isinstance(commande_data, dict):
+            continue
+        client_ids.add(commande_data.get('client'))
+        for ligne_data in commande_data.get('lignes') or []:
+            if isinstance(ligne_data, dict):
+                medicament_ids.add(ligne_data.get('medicament'))
+    return {
+        Client: Client.objects.in_bulk(_ids_valides(client_ids)),
+        Medicament: Medicament.objects.in_bulk(_ids_valides(medicament_ids)),
+    }
+
+def _ids_valides(valeurs):
+    ids = []
+    for valeur in valeurs:
+        try:
+            ids.append(int(valeur))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+# Commandes par requête groupée : la transaction garde le verrou d'écriture
+TAILLE_LOT_MAX = 1000
+
+class CommandeListSerializer(serializers.ListSerializer):
+    """Création groupée : une transaction, une requête de contrôle du stock
+    et une mise à jour conditionnelle par médicament."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', TAILLE_LOT_MAX)
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        # Lot trop grand : refusé par super() sans rien précharger
+        if isinstance(data, list) and len(data) <= self.max_length:
+            self.context['instances_prechargees'] = precharger_instances(data)
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        besoins = defaultdict(int)
+        for commande_data in validated_data:
+            for ligne_data in commande_data['lignes']:
+                besoins[ligne_data['medicament'].pk] += ligne_data['quantite']
+
+        with transaction.atomic():
+            medicaments = Medicament.objects.select_for_update().in_bulk(list(besoins))
+            erreurs = {
+                med.nom: f"Stock insuffisant. Disponible: {med.quantite_en_stock}, demandé: {besoins[pk]}"
+                for pk, med in medicaments.items()
+                if besoins[pk] > med.quantite_en_stock
+            }
+            if erreurs:
+                raise serializers.ValidationError(erreurs)
+
+            commandes = Commande.objects.bulk_create([
+                Commande(
+                    **{k: v for k, v in commande_data.items() if k not in ('lignes', 'version')},
+                    montant_total=sum(
+                        ligne_data['quantite'] * medicaments[ligne_data['medicament'].pk].prix
+                        for ligne_data in commande_data['lignes']
+                    ),
+                    nombre_lignes=len(commande_data['lignes']),
+                )
+                for commande_data in validated_data
+            ])
+            LigneCommande.objects.bulk_create([
+                LigneCommande(
+                    commande=commande,
+                    medicament=ligne_data['medicament'],
+                    quantite=ligne_data['quantite'],
+                    prix_unitaire=medicaments[ligne_data['medicament'].pk].prix,
+                )
+                for commande, commande_data in zip(commandes, validated_data)
+                for ligne_data in commande_data['lignes']
+            ])
+
+            echecs = reserver_stocks(besoins)
+            if echecs:
+                raise serializers.ValidationError(
+                    {medicaments[pk].nom: "Stock insuffisant" for pk in echecs}
+                )
+
+        return commandes
+
+class CommandeSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     lignes = LigneCommandeSerializer(many=True)
-    total = serializers.DecimalField(source='calculer_total', max_digits=10, decimal_places=2, read_only=True)
+    total = serializers.DecimalField(source='montant_total', max_digits=10, decimal_places=2, read_only=True)
+    client = PrimaryKeyPrechargeField(queryset=Client.objects.all())
     client_nom = serializers.CharField(source='client.__str__', read_only=True)
+    # Version lue, renvoyée à la modification : 409 si la commande a changé
+    version = serializers.IntegerField(min_value=0, required=False)
 
     class Meta:
         model = Commande
-        fields = ['id', 'client', 'client_nom', 'date_commande', 'statut', 'total', 'lignes']
+        fields = ['id', 'client', 'client_nom', 'date_commande', 'statut', 'total', 'nombre_lignes', 'version', 'lignes']
+        read_only_fields = ['nombre_lignes']
+        list_serializer_class = CommandeListSerializer
+
+    def to_internal_value(self, data):
+        if self.parent is None and isinstance(data, dict):
+            self.context['instances_prechargees'] = precharger_instances([data])
+        return super().to_internal_value(data)
 
     def create(self, validated_data):
         lignes_data = validated_data.pop('lignes')
+        validated_data.pop('version', None)
         commande = Commande.objects.create(**validated_data)
         
         for ligne_data in lignes_data:
@@ -60,25 +196,87 @@ class CommandeSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         lignes_data = validated_data.pop('lignes', None)
-        
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-
-        if lignes_data is not None:
-            instance.lignes.all().delete()
-            for ligne_data in lignes_data:
-                LigneCommande.objects.create(commande=instance, **ligne_data)
-            
-        return instance
-
-class PaiementSerializer(serializers.ModelSerializer):
+        version = validated_data.pop('version', None)
+
+        with transaction.atomic():
+            if version is not None and not verifier_version(instance.pk, version):
+                raise ConflitVersion("La commande a été modifiée entre-temps, la relire avant de la modifier")
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+
+            if lignes_data is not None:
+                self._synchroniser_lignes(instance, lignes_data)
+
+        # Relue avec ses lignes pour la réponse : l'instance de la vue a des
+        # totaux différés et des lignes préchargées périmées
+        return Commande.objects.avec_details().get(pk=instance.pk)
+
+    def _synchroniser_lignes(self, commande, lignes_data):
+        """Rapproche les lignes reçues des lignes enregistrées par médicament :
+        seules les lignes ajoutées, retirées ou de quantité modifiée sont
+        écrites, en une requête groupée par type d'écriture, avec une seule
+        variation de stock par médicament et une mise à jour des totaux.
+        Une ligne conservée garde son prix unitaire."""
+        existantes, recues = defaultdict(list), defaultdict(list)
+        enregistrees = LigneCommande.objects.filter(commande=commande).only(
+            'commande_id', 'medicament_id', 'quantite', 'prix_unitaire').order_by('pk')
+        for ligne in enregistrees:
+            existantes[ligne.medicament_id].append(ligne)
+        for ligne_data in lignes_data:
+            recues[ligne_data['medicament'].pk].append(ligne_data)
+
+        a_creer, a_modifier, a_supprimer = [], [], []
+        variations, medicaments = defaultdict(int), {}
+        delta_montant = 0
+        # Ordre de la requête : les nouvelles lignes sont créées dans cet ordre
+        for medicament_id in dict.fromkeys([*recues, *existantes]):
+            for ligne, ligne_data in zip_longest(existantes[medicament_id], recues[medicament_id]):
+                if ligne_data is None:
+                    a_supprimer.append(ligne.pk)
+                    variations[medicament_id] -= ligne.quantite
+                    delta_montant -= ligne.sous_total()
+                    continue
+                medicaments[medicament_id] = ligne_data['medicament']
+                if ligne is None:
+                    ligne = LigneCommande(commande=commande, medicament=ligne_data['medicament'],
+                                          quantite=ligne_data['quantite'], prix_unitaire=ligne_data['medicament'].prix)
+                    a_creer.append(ligne)
+                    variations[medicament_id] += ligne.quantite
+                    delta_montant += ligne.sous_total()
+                elif ligne.quantite != ligne_data['quantite']:
+                    variations[medicament_id] += ligne_data['quantite'] - ligne.quantite
+                    delta_montant += (ligne_data['quantite'] - ligne.quantite) * ligne.prix_unitaire
+                    ligne.quantite = ligne_data['quantite']
+                    a_modifier.append(ligne)
+
+        echecs = reserver_stocks({pk: variation for pk, variation in sorted(variations.items()) if variation > 0})
+        if echecs:
+            raise serializers.ValidationError({medicaments[pk].nom: "Stock insuffisant" for pk in echecs})
+        for pk, variation in sorted(variations.items()):
+            if variation < 0:
+                liberer_stock(pk, -variation)
+            invalider_champs(medicaments.get(pk), 'quantite_en_stock')
+
+        if a_supprimer:
+            LigneCommande.objects.filter(pk__in=a_supprimer).delete()
+        if a_modifier:
+            LigneCommande.objects.bulk_update(a_modifier, ['quantite'])
+        if a_creer:
+            LigneCommande.objects.bulk_create(a_creer)
+        if a_creer or a_modifier or a_supprimer:
+            # Version déjà incrémentée par le save() de update()
+            maj_totaux_commande(commande.pk, delta_montant, len(a_creer) - len(a_supprimer), incrementer_version=False)
+            invalider_champs(commande, *Commande.CHAMPS_DENORMALISES)
+
+class PaiementSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Paiement
         fields = ['id', 'facture', 'montant', 'methode', 'date_paiement', 'est_valide']
 
-class FactureSerializer(serializers.ModelSerializer):
+class FactureSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     paiements = PaiementSerializer(many=True, read_only=True)
+    montant_final = serializers.DecimalField(source='montant_net', max_digits=10, decimal_places=2, read_only=True)
     montant_restant = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
@@ -86,3 +284,187 @@ class FactureSerializer(serializers.ModelSerializer):
         fields = ['id', 'commande', 'date_facture', 'montant_total', 
                  'remise', 'montant_final', 'montant_paye', 'est_payee',
                  'montant_restant', 'paiements']
+        # Maintenu par les paiements et la remise (Facture._enregistrer)
+        read_only_fields = ['est_payee']
+
+class LotCommandesSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=TAILLE_LOT_MAX)
+
+class ValeursSerializer:
+    """Chemin de lecture rapide des listes : les lignes `.values()` sont
+    converties par les `to_representation` précompilés du ModelSerializer de
+    référence, sans instance de modèle ni machinerie DRF par champ. Le JSON
+    produit est identique à celui de `reference`.
+
+    `champs` associe chaque clé JSON, dans l'ordre de `reference`, à None
+    (colonne de même nom), à un nom de colonne ou à une expression SQL ;
+    `imbriques` associe une clé à (ValeursSerializer enfant, clé étrangère).
+    `champs` à l'instanciation restreint la sortie aux clés demandées.
+    """
+    reference = None
+    champs = {}
+    imbriques = {}
+
+    # Champs DRF dont to_representation ne change pas la valeur lue en base ;
+    # une SerializerMethodField est remplacée par son expression SQL
+    IDENTITE = (serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+                serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+                serializers.SerializerMethodField)
+
+    def __init__(self, champs=None):
+        champs_reference = self.reference().fields
+        self.selection = [cle for cle in self.champs if champs is None or cle in champs]
+        self.convertisseurs = []
+        for cle in self.selection:
+            champ = champs_reference[cle]
+            if cle in self.imbriques:
+                convertir = None
+            elif isinstance(champ, self.IDENTITE):
+                convertir = None
+            else:
+                convertir = champ.to_representation
+            self.convertisseurs.append((cle, convertir))
+        self.enfants = {
+            cle: (classe(), cle_etrangere) for cle, (classe, cle_etrangere) in self.imbriques.items()
+            if cle in self.selection
+        }
+
+    def preparer(self, queryset, *supplementaires):
+        if self.enfants:
+            # Clé de rattachement des enfants, même si `id` n'est pas demandé
+            supplementaires = ('id', *supplementaires)
+        colonnes, expressions = [c for c in dict.fromkeys(supplementaires) if c not in self.selection], {}
+        for cle in self.selection:
+            source = self.champs[cle]
+            if cle in self.imbriques:
+                continue
+            if source is None:
+                colonnes.append(cle)
+            else:
+                expressions[cle] = F(source) if isinstance(source, str) else source
+        return queryset.prefetch_related(None).values(*colonnes, **expressions)
+
+    def serialiser(self, lignes):
+        lignes = list(lignes)
+        for cle, (enfant, cle_etrangere) in self.enfants.items():
+            par_parent = {ligne['id']: [] for ligne in lignes}
+            filles = enfant.reference.Meta.model.objects.filter(**{f'{cle_etrangere}__in': list(par_parent)})
+            for fille in enfant.preparer(filles, cle_etrangere).order_by(cle_etrangere, 'id'):
+                par_parent[fille[cle_etrangere]].append(fille)
+            for ligne in lignes:
+                ligne[cle] = enfant.serialiser(par_parent[ligne['id']])
+        convertisseurs = self.convertisseurs
+        return [
+            {cle: ligne[cle] if convertir is None else convertir(ligne[cle]) for cle, convertir in convertisseurs}
+            for ligne in lignes
+        ]
+
+    @classmethod
+    def restreindre(cls, queryset, champs, *supplementaires):
+        """Restreint un queryset d'instances aux colonnes (only()), jointures
+        (select_related) et préchargements nécessaires aux clés `champs`."""
+        modele = cls.reference.Meta.model
+        chemins = {modele._meta.pk.name, *supplementaires}
+        for cle in champs:
+            if cle not in cls.imbriques:
+                source = cls.champs[cle]
+                chemins.update(_chemin_champ(modele, reference) for reference in _references(cle if source is None else source))
+        relations = {chemin.rsplit('__', 1)[0] for chemin in chemins if '__' in chemin}
+        prechargements = [
+            lookup for lookup in queryset._prefetch_related_lookups
+            if getattr(lookup, 'prefetch_to', lookup).split('__')[0] in champs
+        ]
+        queryset = queryset.select_related(None).prefetch_related(None).prefetch_related(*prechargements)
+        # select_related() sans argument suivrait toutes les clés étrangères
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*chemins)
+
+def _references(source):
+    # Chemins de champs lus par une source de ValeursSerializer.champs
+    if isinstance(source, str):
+        yield source
+    elif isinstance(source, F):
+        yield source.name
+    elif isinstance(source, Q):
+        for enfant in source.children:
+            if isinstance(enfant, Q):
+                yield from _references(enfant)
+            else:
+                lookup, valeur = enfant
+                yield lookup
+                yield from _references(valeur)
+    elif hasattr(source, 'get_source_expressions'):
+        for expression in source.get_source_expressions():
+            yield from _references(expression)
+
+def _chemin_champ(modele, reference):
+    # Retire le suffixe de lookup (`__lte`...) d'une référence de champ
+    parties = []
+    for partie in reference.split('__'):
+        try:
+            champ = modele._meta.get_field(partie)
+        except FieldDoesNotExist:
+            break
+        parties.append(champ.name)
+        if not champ.is_relation:
+            break
+        modele = champ.related_model
+    return '__'.join(parties)
+
+def _unites(colonne):
+    return Concat(Cast(colonne, CharField()), Value(' unités)'))
+
+class MedicamentValeursSerializer(ValeursSerializer):
+    reference = MedicamentSerializer
+    # en_rupture n'est pas un attribut de Medicament : DRF l'omet de la sortie
+    champs = {
+        'id': None, 'nom': None, 'categorie': None, 'prix': None,
+        'quantite_en_stock': None, 'seuil_alerte': None,
+        'status_stock': Case(
+            When(quantite_en_stock__lte=0, then=Value('Rupture de stock')),
+            When(quantite_en_stock__lte=F('seuil_alerte'), then=Concat(Value('Stock faible ('), _unites('quantite_en_stock'))),
+            default=Concat(Value('En stock ('), _unites('quantite_en_stock')),
+            output_field=CharField(),
+        ),
+        'stock_faible': ExpressionWrapper(Q(quantite_en_stock__lte=F('seuil_alerte')), output_field=BooleanField()),
+    }
+
+class ClientValeursSerializer(ValeursSerializer):
+    reference = ClientSerializer
+    champs = {
+        'id': None, 'nom': None, 'prenom': None, 'adresse': None, 'telephone': None,
+        'est_regulier': None, 'credit': None, 'plafond_credit': None, 'credit_disponible': 'plafond_credit',
+    }
+
+class LigneCommandeValeursSerializer(ValeursSerializer):
+    reference = LigneCommandeSerializer
+    champs = {
+        'id': None, 'medicament': None, 'nom_medicament': 'medicament__nom',
+        'quantite': None, 'prix_unitaire': None,
+        'sous_total': ExpressionWrapper(F('quantite') * F('prix_unitaire'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    }
+
+class CommandeValeursSerializer(ValeursSerializer):
+    reference = CommandeSerializer
+    champs = {
+        'id': None, 'client': None,
+        'client_nom': Concat('client__nom', Value(' '), 'client__prenom', output_field=CharField()),
+        'date_commande': None, 'statut': None, 'total': 'montant_total', 'nombre_lignes': None,
+        'version': None, 'lignes': None,
+    }
+    imbriques = {'lignes': (LigneCommandeValeursSerializer, 'commande')}
+
+class PaiementValeursSerializer(ValeursSerializer):
+    reference = PaiementSerializer
+    champs = {'id': None, 'facture': None, 'montant': None, 'methode': None, 'date_paiement': None, 'est_valide': None}
+
+class FactureValeursSerializer(ValeursSerializer):
+    reference = FactureSerializer
+    champs = {
+        'id': None, 'commande': None, 'date_facture': None, 'montant_total': None,
+        'remise': None, 'montant_final': 'montant_net', 'montant_paye': None, 'est_payee': None,
+        'montant_restant': ExpressionWrapper(F('montant_net') - F('montant_paye'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        'paiements': None,
+    }
+    imbriques = {'paiements': (PaiementValeursSerializer, 'facture')}
@@ -0,0 +1,452 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import BooleanField, Count, DecimalField, ExpressionWrapper, F, Max, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.utils import timezone
+
+from .cache import invalider_catalogue
+from .models import Medicament, Client, Commande, LigneCommande, Facture, VenteJournaliere, MouvementCredit, SuppressionSynchro
+
+
+def ajuster_stock(medicament_id, delta):
+    """Applique `delta` (positif ou négatif) au stock en une seule requête UPDATE.
+
+    Une sortie de stock n'est appliquée que si `quantite_en_stock >= -delta`,
+    la condition étant évaluée par la base. Retourne True si la ligne a été
+    mise à jour, False si le stock est insuffisant ou le médicament absent.
+    """
+    medicaments = Medicament.objects.filter(pk=medicament_id)
+    if delta < 0:
+        medicaments = medicaments.filter(quantite_en_stock__gte=-delta)
+    if medicaments.update(quantite_en_stock=F('quantite_en_stock') + delta, date_modification=timezone.now(),
+                          sequence_synchro=prochaine_sequence(Medicament)) != 1:
+        return False
+    # UPDATE direct : aucun signal post_save, invalider explicitement
+    invalider_catalogue()
+    return True
+
+
+def reserver_stock(medicament_id, quantite):
+    return ajuster_stock(medicament_id, -quantite)
+
+
+def liberer_stock(medicament_id, quantite):
+    return ajuster_stock(medicament_id, quantite)
+
+
+def reserver_stocks(besoins):
+    """Réserve plusieurs médicaments ({medicament_id: quantite}), une requête
+    par médicament. Retourne la liste des identifiants qui n'ont pas pu être
+    réservés ; l'appelant décide de l'annulation via sa transaction."""
+    return [pk for pk, quantite in besoins.items() if not reserver_stock(pk, quantite)]
+
+
+class _ConflitStock(Exception):
+    pass
+
+
+def valider_commandes(ids, tentatives=3):
+    """Valide un lot de commandes en attente. Retourne {id: None} pour les
+    commandes validées et {id: message} pour les refus ; un refus n'annule
+    pas les autres commandes du lot.
+
+    Les commandes et médicaments concernés sont verrouillés une fois, le
+    stock est réparti en mémoire puis décrémenté par un UPDATE par
+    médicament, et le statut change en un seul UPDATE.
+    """
+    for tentative in range(tentatives):
+        try:
+            with transaction.atomic():
+                return _valider_lot(ids)
+        except _ConflitStock:
+            # Stock modifié entre la lecture et l'UPDATE (verrou de ligne
+            # indisponible, p. ex. SQLite) : recommencer avec le stock relu
+            if tentative == tentatives - 1:
+                raise ValidationError("Stock modifié pendant la validation, réessayez")
+
+
+def _valider_lot(ids):
+    resultats = dict.fromkeys(ids, "Commande introuvable")
+    commandes = dict(Commande.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'statut'))
+    en_attente = []
+    for pk, statut in commandes.items():
+        if statut == 'En attente':
+            en_attente.append(pk)
+        else:
+            resultats[pk] = f"Commande déjà {statut.lower()}"
+
+    besoins_par_commande = {pk: {} for pk in en_attente}
+    lignes = LigneCommande.objects.filter(commande__in=en_attente).values_list('commande_id', 'medicament_id', 'quantite')
+    for commande_id, medicament_id, quantite in lignes:
+        besoins = besoins_par_commande[commande_id]
+        besoins[medicament_id] = besoins.get(medicament_id, 0) + quantite
+
+    medicaments = {m for besoins in besoins_par_commande.values() for m in besoins}
+    stocks = {
+        pk: [nom, stock] for pk, nom, stock in
+        Medicament.objects.select_for_update().filter(pk__in=medicaments).values_list('pk', 'nom', 'quantite_en_stock')
+    }
+
+    # Répartition dans l'ordre des identifiants : une commande est servie
+    # entièrement ou refusée
+    validees, sorties = [], {}
+    for pk in sorted(en_attente):
+        besoins = besoins_par_commande[pk]
+        manque = next((m for m, quantite in besoins.items() if stocks[m][1] < quantite), None)
+        if manque is not None:
+            nom, disponible = stocks[manque]
+            resultats[pk] = f"Stock insuffisant pour {nom}. Disponible: {disponible}"
+            continue
+        for m, quantite in besoins.items():
+            stocks[m][1] -= quantite
+            sorties[m] = sorties.get(m, 0) + quantite
+        validees.append(pk)
+        resultats[pk] = None
+
+    if reserver_stocks(sorties):
+        raise _ConflitStock()
+    Commande.objects.filter(pk__in=validees).update(
+        statut='Expédiée', date_modification=timezone.now(), version=F('version') + 1,
+    )
+    return resultats
+
+
+def annuler_commandes(ids):
+    """Annule un lot de commandes en un seul UPDATE ; même effet sur le stock
+    que l'annulation unitaire. Retourne {id: None ou message de refus}."""
+    resultats = dict.fromkeys(ids, "Commande introuvable")
+    with transaction.atomic():
+        commandes = dict(Commande.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'statut'))
+        a_annuler = {pk for pk, statut in commandes.items() if statut != 'Annulée'}
+        for pk in commandes:
+            resultats[pk] = None if pk in a_annuler else "Commande déjà annulée"
+        Commande.objects.filter(pk__in=a_annuler).update(
+            statut='Annulée', date_modification=timezone.now(), version=F('version') + 1,
+        )
+    return resultats
+
+
+class ConflitVersion(Exception):
+    pass
+
+
+def verifier_version(commande_id, version):
+    """Verrou optimiste : vérifie que la commande est encore à `version` et
+    verrouille sa ligne jusqu'à la fin de la transaction, sans l'écrire (le
+    save() qui suit incrémente la version). Retourne False si la commande a
+    été modifiée depuis sa lecture."""
+    return Commande.objects.select_for_update().filter(pk=commande_id, version=version).exists()
+
+
+def maj_totaux_commande(commande_id, delta_montant, delta_lignes, incrementer_version=True):
+    """Répercute la variation d'une ligne sur les totaux stockés de la commande
+    en une seule requête UPDATE. Sans variation, seules `date_modification`
+    et `version` changent : les lignes font partie de la commande.
+    `incrementer_version=False` quand la commande vient d'être enregistrée dans
+    la même transaction (une seule version par modification)."""
+    valeurs = {'date_modification': timezone.now()}
+    if incrementer_version:
+        valeurs['version'] = F('version') + 1
+    if delta_montant or delta_lignes:
+        valeurs.update(
+            montant_total=F('montant_total') + delta_montant,
+            nombre_lignes=F('nombre_lignes') + delta_lignes,
+        )
+    Commande.objects.filter(pk=commande_id).update(**valeurs)
+
+
+def maj_montant_paye(facture_id, delta):
+    """Ajoute `delta` au montant payé de la facture et recalcule `est_payee`
+    dans la même requête UPDATE. Un delta nul (paiement non valide) met
+    seulement à jour `date_modification`."""
+    valeurs = {'date_modification': timezone.now()}
+    if delta:
+        # Arrondi au centime : SQLite calcule la somme en flottant
+        nouveau_paye = Round(F('montant_paye') + delta, 2)
+        valeurs.update(
+            montant_paye=nouveau_paye,
+            est_payee=ExpressionWrapper(Q(montant_net__lte=nouveau_paye), output_field=BooleanField()),
+        )
+    Facture.objects.filter(pk=facture_id).update(**valeurs)
+
+
+def invalider_champs(instance, *champs):
+    """Marque des champs comme différés sur une instance déjà chargée : ils
+    seront relus à la prochaine lecture et ne seront pas réécrits par un
+    save() ultérieur de l'instance."""
+    if instance is not None:
+        for champ in champs:
+            instance.__dict__.pop(champ, None)
+
+
+def imputer_credit(client_id, montant):
+    """Applique `montant` au crédit utilisé du client en une seule requête
+    UPDATE. Une imputation positive n'est appliquée que si le nouveau solde
+    reste dans `plafond_credit`, condition évaluée par la base. Retourne True
+    si la ligne a été mise à jour.
+
+    Le mouvement correspondant doit être inscrit dans la même transaction.
+    """
+    clients = Client.objects.filter(pk=client_id)
+    if montant > 0:
+        clients = clients.filter(credit__lte=F('plafond_credit') - montant)
+    return clients.update(credit=F('credit') + montant, date_modification=timezone.now(),
+                          sequence_synchro=prochaine_sequence(Client)) == 1
+
+
+def enregistrer_mouvement_credit(client_id, montant, motif, **liens):
+    """Imputation et inscription au registre dans une même transaction.
+    Retourne le MouvementCredit créé, ou None si le plafond est dépassé."""
+    with transaction.atomic():
+        if not imputer_credit(client_id, montant):
+            return None
+        return MouvementCredit.objects.create(client_id=client_id, montant=montant, motif=motif, **liens)
+
+
+def centimes(montant):
+    """Arrondit au centime ; les agrégats SQLite reviennent en flottant non
+    arrondi."""
+    return Decimal(montant or 0).quantize(Decimal('0.01'))
+
+
+def montant_net(montant_total, remise):
+    """Montant après remise, arrondi au centime."""
+    montant_total = Decimal(montant_total or 0)
+    remise = Decimal(remise or 0)
+    return (montant_total * (100 - remise) / 100).quantize(Decimal('0.01'))
+
+
+def enregistrer_vente(jour, methode_paiement, nombre, montant_brut, montant_net):
+    """Ajoute des deltas au cumul (jour, méthode) : UPDATE atomique, ou
+    création de la ligne si elle n'existe pas encore."""
+    deltas = {
+        'nombre_factures': F('nombre_factures') + nombre,
+        'montant_brut': F('montant_brut') + montant_brut,
+        'montant_net': F('montant_net') + montant_net,
+    }
+    cumul = VenteJournaliere.objects.filter(jour=jour, methode_paiement=methode_paiement)
+    if cumul.update(**deltas):
+        return
+    try:
+        with transaction.atomic():
+            VenteJournaliere.objects.create(
+                jour=jour, methode_paiement=methode_paiement, nombre_factures=nombre,
+                montant_brut=montant_brut, montant_net=montant_net,
+            )
+    except IntegrityError:
+        # Créée entre-temps par une autre transaction
+        cumul.update(**deltas)
+
+
+def enregistrer_vente_facture(facture, signe=1):
+    """Ajoute (signe=1) ou retire (signe=-1) une facture du cumul journalier."""
+    brut = Decimal(facture.montant_total or 0)
+    enregistrer_vente(
+        timezone.localdate(facture.date_facture),
+        facture.methode_paiement,
+        signe,
+        signe * brut,
+        signe * montant_net(brut, facture.remise),
+    )
+
+
+def reconstruire_ventes_journalieres(debut=None, fin=None):
+    """Recalcule le cumul journalier depuis les factures, sur tout l'historique
+    ou sur l'intervalle de jours [debut, fin]. Retourne le nombre de lignes
+    de cumul écrites."""
+    factures = Facture.objects.all()
+    cumuls = VenteJournaliere.objects.all()
+    if debut:
+        factures = factures.filter(date_facture__date__gte=debut)
+        cumuls = cumuls.filter(jour__gte=debut)
+    if fin:
+        factures = factures.filter(date_facture__date__lte=fin)
+        cumuls = cumuls.filter(jour__lte=fin)
+
+    totaux = {}
+    lignes = factures.values_list('date_facture', 'methode_paiement', 'montant_total', 'remise')
+    for date_facture, methode, montant_total, remise in lignes.iterator(chunk_size=2000):
+        cle = (timezone.localdate(date_facture), methode)
+        nombre, brut, net = totaux.get(cle, (0, Decimal(0), Decimal(0)))
+        totaux[cle] = (nombre + 1, brut + montant_total, net + montant_net(montant_total, remise))
+
+    with transaction.atomic():
+        cumuls.delete()
+        VenteJournaliere.objects.bulk_create([
+            VenteJournaliere(jour=jour, methode_paiement=methode, nombre_factures=nombre,
+                             montant_brut=brut, montant_net=net)
+            for (jour, methode), (nombre, brut, net) in totaux.items()
+        ], batch_size=1000)
+    return len(totaux)
+
+
+def agreger_ventes(cumuls, debut, fin):
+    """Statistiques de ventes (totaux, par méthode, par jour) à partir des
+    lignes VenteJournaliere de la période."""
+    par_jour = {}
+    par_methode = {}
+    for cumul in cumuls:
+        jour = par_jour.setdefault(cumul.jour, {
+            'date_facture__date': cumul.jour, 'total': 0,
+            'montant_brut': 0, 'montant_net': 0, 'par_methode': {},
+        })
+        jour['total'] += cumul.nombre_factures
+        jour['montant_brut'] += cumul.montant_brut
+        jour['montant_net'] += cumul.montant_net
+        jour['par_methode'][cumul.methode_paiement] = cumul.nombre_factures
+        methode = par_methode.setdefault(cumul.methode_paiement, {
+            'nombre': 0, 'montant_brut': 0, 'montant_net': 0,
+        })
+        methode['nombre'] += cumul.nombre_factures
+        methode['montant_brut'] += cumul.montant_brut
+        methode['montant_net'] += cumul.montant_net
+
+    return {
+        'debut': debut,
+        'fin': fin,
+        'total_ventes': sum(jour['total'] for jour in par_jour.values()),
+        'montant_total': sum(jour['montant_brut'] for jour in par_jour.values()),
+        'montant_net': sum(jour['montant_net'] for jour in par_jour.values()),
+        'par_methode': par_methode,
+        'ventes_par_jour': list(par_jour.values()),
+    }
+
+
+def debut_jour(jour):
+    """Début du jour `jour` dans le fuseau courant, en datetime aware."""
+    return timezone.make_aware(datetime.combine(jour, time.min))
+
+
+def agreger_creances(factures, debut, fin):
+    """Créances et chiffre d'affaires net par méthode de paiement, calculés en
+    une seule requête d'agrégation groupée sur les colonnes stockées."""
+    montant = DecimalField(max_digits=14, decimal_places=2)
+    impayee = Q(est_payee=False)
+    # Bornes en datetime : un filtre __date convertirait chaque ligne en Python sous SQLite
+    periode = Q(date_facture__gte=debut_jour(debut), date_facture__lt=debut_jour(fin + timedelta(days=1)))
+    lignes = (
+        factures.order_by()
+        .values('methode_paiement')
+        .annotate(
+            factures_impayees=Count('id', filter=impayee),
+            montant_restant=Sum(F('montant_net') - F('montant_paye'), filter=impayee, output_field=montant),
+            chiffre_affaires_net=Sum('montant_net', filter=periode, output_field=montant),
+            encaisse=Sum('montant_paye', filter=periode, output_field=montant),
+        )
+    )
+
+    montants = ('montant_restant', 'chiffre_affaires_net', 'encaisse')
+    par_methode = {
+        ligne['methode_paiement']: {
+            'factures_impayees': ligne['factures_impayees'],
+            **{cle: centimes(ligne[cle]) for cle in montants},
+        }
+        for ligne in lignes
+    }
+    totaux = {'factures_impayees': sum(methode['factures_impayees'] for methode in par_methode.values())}
+    for cle in montants:
+        totaux[cle] = centimes(sum(methode[cle] for methode in par_methode.values()))
+    return {'debut': debut, 'fin': fin, **totaux, 'par_methode': par_methode}
+
+
+TRANCHES_BALANCE = ('jours_0_30', 'jours_31_60', 'jours_61_90', 'jours_90_plus')
+
+
+def balance_agee(reference):
+    """Reste dû des factures impayées par client, réparti par ancienneté
+    (0-30, 31-60, 61-90 et plus de 90 jours avant `reference`).
+
+    Une seule passe d'agrégation conditionnelle, servie par l'index partiel
+    facture_impayee_client_idx ; retourne un queryset de dictionnaires
+    (client, tranches, total) à trier par l'appelant. Les tranches sans
+    facture valent None.
+    """
+    j30, j60, j90 = (debut_jour(reference - timedelta(days=jours)) for jours in (30, 60, 90))
+    montant = DecimalField(max_digits=14, decimal_places=2)
+    reste = F('montant_net') - F('montant_paye')
+
+    def somme(condition=None):
+        # Pas de Coalesce : il coûte une conversion par ligne et par tranche ;
+        # une tranche vide vaut None
+        return Sum(reste, filter=condition, output_field=montant)
+
+    return (
+        Facture.objects.impayees()
+        .order_by()
+        .values('client')
+        .annotate(
+            jours_0_30=somme(Q(date_facture__gte=j30)),
+            jours_31_60=somme(Q(date_facture__gte=j60, date_facture__lt=j30)),
+            jours_61_90=somme(Q(date_facture__gte=j90, date_facture__lt=j60)),
+            jours_90_plus=somme(Q(date_facture__lt=j90)),
+            total=somme(),
+        )
+        .filter(total__gt=0)
+    )
+
+
+
+def agregat_scalaire(queryset, **agregats):
+    """Agrégats de tout `queryset` en une ligne, utilisable en sous-requête :
+    le groupement sur une constante évite le GROUP BY sur les colonnes du
+    modèle."""
+    return queryset.order_by().annotate(_tout=Value(1)).values('_tout').annotate(**agregats).values(*agregats)
+
+
+def prochaine_sequence(modele):
+    """Expression SQL de la prochaine séquence de synchronisation de
+    Medicament ou Client : un de plus que la plus grande séquence de ses
+    lignes et de ses pierres tombales (deux MAX indexés). Évaluée dans la
+    requête d'écriture, donc sous le verrou d'écriture de SQLite : les
+    séquences suivent l'ordre des commits."""
+    lignes = agregat_scalaire(modele.objects.all(), s=Max('sequence_synchro'))
+    tombes = agregat_scalaire(SuppressionSynchro.objects.filter(modele=modele._meta.model_name), s=Max('sequence'))
+    return Greatest(Coalesce(Subquery(lignes), 0), Coalesce(Subquery(tombes), 0)) + 1
+
+
+def numeroter_synchro(modele, objets):
+    """Attribue des séquences consécutives à des objets avant une écriture
+    groupée (bulk_create), dans la transaction de cette écriture."""
+    debut = max(
+        modele.objects.aggregate(s=Max('sequence_synchro'))['s'] or 0,
+        SuppressionSynchro.objects.filter(modele=modele._meta.model_name).aggregate(s=Max('sequence'))['s'] or 0,
+    ) + 1
+    for sequence, objet in enumerate(objets, start=debut):
+        objet.sequence_synchro = sequence
+    return objets
+
+
+def changements_depuis(modele, jeton, limite, preparer):
+    """Page de synchronisation différentielle : au plus `limite` écritures et
+    suppressions de `modele` de séquence > `jeton`, dans l'ordre de la
+    séquence. Retourne (lignes .values() écrites, ids supprimés, jeton de la
+    page, suite), les lignes étant préparées par `preparer`.
+
+    Retourne None si `jeton` dépasse la séquence (base restaurée ou
+    réinitialisée) : le terminal doit repartir de 0."""
+    tombes = SuppressionSynchro.objects.filter(modele=modele._meta.model_name)
+    # Une transaction de lecture : les deux requêtes voient le même instantané
+    with transaction.atomic():
+        lignes = list(preparer(modele.objects.filter(sequence_synchro__gt=jeton), 'sequence_synchro')
+                      .order_by('sequence_synchro')[:limite + 1])
+        supprimes = list(tombes.filter(sequence__gt=jeton).order_by('sequence')
+                         .values_list('sequence', 'objet_id')[:limite + 1])
+        if not lignes and not supprimes and jeton and not (
+                modele.objects.filter(sequence_synchro__gte=jeton).exists()
+                or tombes.filter(sequence__gte=jeton).exists()):
+            return None
+    evenements = sorted(
+        [(ligne['sequence_synchro'], ligne, None) for ligne in lignes]
+        + [(sequence, None, objet_id) for sequence, objet_id in supprimes],
+        key=lambda evenement: evenement[0],
+    )
+    page = evenements[:limite]
+    return (
+        [ligne for _, ligne, _ in page if ligne is not None],
+        [objet_id for _, _, objet_id in page if objet_id is not None],
+        page[-1][0] if page else jeton,
+        len(evenements) > limite,
+    )
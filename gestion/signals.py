@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalider_catalogue
+from .models import Client, Facture, LigneCommande, Medicament, SuppressionSynchro
+from .recherche import indexer_medicaments, retirer_medicament
+from .services import enregistrer_vente_facture, invalider_champs, prochaine_sequence
+
+
+@receiver(post_save, sender=Medicament)
+@receiver(post_delete, sender=Medicament)
+@receiver(post_save, sender=LigneCommande)
+@receiver(post_delete, sender=LigneCommande)
+def invalider_cache_catalogue(sender, **kwargs):
+    invalider_catalogue()
+
+
+@receiver(post_save, sender=Medicament)
+def indexer_medicament(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'nom', 'categorie'} & set(update_fields):
+        indexer_medicaments([instance])
+
+
+@receiver(post_delete, sender=Medicament)
+def desindexer_medicament(sender, instance, **kwargs):
+    retirer_medicament(instance.pk)
+
+
+@receiver(post_save, sender=Medicament)
+@receiver(post_save, sender=Client)
+def numeroter_ecriture(sender, instance, **kwargs):
+    sender.objects.filter(pk=instance.pk).update(sequence_synchro=prochaine_sequence(sender))
+    invalider_champs(instance, 'sequence_synchro')
+
+
+@receiver(post_delete, sender=Medicament)
+@receiver(post_delete, sender=Client)
+def enregistrer_suppression(sender, instance, **kwargs):
+    SuppressionSynchro.objects.create(
+        modele=sender._meta.model_name, objet_id=instance.pk, sequence=prochaine_sequence(sender),
+    )
+
+
+@receiver(post_delete, sender=Facture)
+def retirer_vente_facture(sender, instance, **kwargs):
+    # Aussi émis par les suppressions en cascade (commande, client)
+    enregistrer_vente_facture(instance, signe=-1)
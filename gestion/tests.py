@@ -1,3 +1,1311 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Medicament, Client, Commande, LigneCommande, Facture, Paiement, VenteJournaliere, MouvementCredit
+from .cache import reinitialiser_statistiques_cache
+from .management.commands.benchmark_api import Command as BenchmarkApi
+from .instrumentation import gabarit_sql, reinitialiser_metriques, requetes_repetees
+from .routers import RepliqueLectureRouter, lecture_replique
+from .services import reserver_stock, liberer_stock, enregistrer_mouvement_credit
+from .views import ClientViewSet, CommandeViewSet, FactureViewSet, MedicamentViewSet, PaiementViewSet
+
+
+class CommandeBulkTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Dupont', prenom='Jean', adresse='1 rue', telephone='0600000000')
+        self.doliprane = Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix='2.50', quantite_en_stock=100)
+        self.smecta = Medicament.objects.create(nom='Smecta', categorie='Digestif', prix='4.00', quantite_en_stock=10)
+
+    def _commande(self, *lignes):
+        return {
+            'client': self.client_pharma.pk,
+            'lignes': [{'medicament': med.pk, 'quantite': q} for med, q in lignes],
+        }
+
+    def test_bulk_cree_commandes_et_decremente_stock(self):
+        payload = [
+            self._commande((self.doliprane, 3), (self.smecta, 2)),
+            self._commande((self.doliprane, 5)),
+        ]
+        with self.assertNumQueries(11):
+            response = self.api.post(reverse('commande-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(Commande.objects.count(), 2)
+        self.assertEqual(LigneCommande.objects.count(), 3)
+        self.doliprane.refresh_from_db()
+        self.smecta.refresh_from_db()
+        self.assertEqual(self.doliprane.quantite_en_stock, 92)
+        self.assertEqual(self.smecta.quantite_en_stock, 8)
+        self.assertEqual(response.data[0]['lignes'][0]['prix_unitaire'], '2.50')
+        self.assertEqual(response.data[0]['total'], '15.50')
+        self.assertEqual(response.data[0]['nombre_lignes'], 2)
+
+    def test_bulk_stock_insuffisant_annule_tout(self):
+        payload = [
+            self._commande((self.doliprane, 3)),
+            self._commande((self.smecta, 6)),
+            self._commande((self.smecta, 6)),
+        ]
+        response = self.api.post(reverse('commande-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Smecta', response.data)
+        self.assertEqual(Commande.objects.count(), 0)
+        self.doliprane.refresh_from_db()
+        self.assertEqual(self.doliprane.quantite_en_stock, 100)
+
+    def test_bulk_taille_limitee(self):
+        payload = [self._commande((self.doliprane, 1))] * 1001
+        with self.assertNumQueries(0):
+            response = self.api.post(reverse('commande-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Commande.objects.count(), 0)
+
+
+class StockServiceTests(TestCase):
+    def setUp(self):
+        self.client_pharma = Client.objects.create(nom='Martin', prenom='Paul', adresse='2 rue', telephone='0611111111')
+        self.commande = Commande.objects.create(client=self.client_pharma)
+        self.medicament = Medicament.objects.create(nom='Spasfon', categorie='Antispasmodique', prix='3.20', quantite_en_stock=10)
+
+    def test_reserver_stock_conditionnel(self):
+        self.assertTrue(reserver_stock(self.medicament.pk, 10))
+        self.assertFalse(reserver_stock(self.medicament.pk, 1))
+        self.assertTrue(liberer_stock(self.medicament.pk, 4))
+        self.medicament.refresh_from_db()
+        self.assertEqual(self.medicament.quantite_en_stock, 4)
+
+    def test_ajuster_stock_ne_reecrit_pas_le_stock(self):
+        self.medicament.ajuster_stock(3)
+        Medicament.objects.filter(pk=self.medicament.pk).update(quantite_en_stock=50)
+        self.medicament.prix = '3.50'
+        self.medicament.save()
+        self.medicament.refresh_from_db()
+        self.assertEqual(self.medicament.quantite_en_stock, 50)
+        with self.assertRaises(ValidationError):
+            self.medicament.ajuster_stock(51)
+
+    def test_cycle_de_vie_ligne_commande(self):
+        ligne = LigneCommande.objects.create(commande=self.commande, medicament=self.medicament, quantite=4)
+        self.assertEqual(self.medicament.quantite_en_stock, 6)
+        ligne.quantite = 7
+        ligne.save()
+        self.assertEqual(self.medicament.quantite_en_stock, 3)
+        ligne.quantite = 2
+        ligne.save()
+        self.assertEqual(self.medicament.quantite_en_stock, 8)
+        with self.assertRaises(ValidationError):
+            LigneCommande.objects.create(commande=self.commande, medicament=self.medicament, quantite=9)
+        ligne.delete()
+        self.medicament.refresh_from_db()
+        self.assertEqual(self.medicament.quantite_en_stock, 10)
+
+
+class StockConcurrenceTests(TransactionTestCase):
+    WORKERS = 8
+    RESERVATIONS_PAR_WORKER = 25
+
+    def test_reservations_concurrentes_stock_exact(self):
+        stock_initial = 150
+        medicament = Medicament.objects.create(nom='Ibuprofène', categorie='AINS', prix='3.00', quantite_en_stock=stock_initial)
+        succes = []
+        erreurs = []
+        depart = threading.Barrier(self.WORKERS)
+
+        def worker():
+            reussies = 0
+            try:
+                depart.wait()
+                for _ in range(self.RESERVATIONS_PAR_WORKER):
+                    if reserver_stock(medicament.pk, 1):
+                        reussies += 1
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                succes.append(reussies)
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erreurs, [])
+        medicament.refresh_from_db()
+        self.assertEqual(sum(succes), stock_initial)
+        self.assertEqual(medicament.quantite_en_stock, 0)
+
+
+class CommandeTotauxTests(TestCase):
+    def setUp(self):
+        self.client_pharma = Client.objects.create(nom='Bernard', prenom='Lucie', adresse='3 rue', telephone='0622222222')
+        self.commande = Commande.objects.create(client=self.client_pharma)
+        self.doliprane = Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix=Decimal('2.50'), quantite_en_stock=100)
+        self.smecta = Medicament.objects.create(nom='Smecta', categorie='Digestif', prix=Decimal('4.00'), quantite_en_stock=100)
+
+    def _totaux(self):
+        self.commande.refresh_from_db()
+        return self.commande.montant_total, self.commande.nombre_lignes
+
+    def test_totaux_maintenus(self):
+        ligne = LigneCommande.objects.create(commande=self.commande, medicament=self.doliprane, quantite=4)
+        LigneCommande.objects.create(commande=self.commande, medicament=self.smecta, quantite=1)
+        self.assertEqual(self._totaux(), (Decimal('14.00'), 2))
+        ligne.quantite = 2
+        ligne.save()
+        self.assertEqual(self._totaux(), (Decimal('9.00'), 2))
+        ligne.delete()
+        self.assertEqual(self._totaux(), (Decimal('4.00'), 1))
+        self.assertEqual(self.commande.recalculer_totaux(), (Decimal('4.00'), 1))
+
+    def test_prix_en_chaine(self):
+        medicament = Medicament.objects.create(nom='Spasfon', categorie='Antispasmodique', prix='2.50', quantite_en_stock=10)
+        LigneCommande.objects.create(commande=self.commande, medicament=medicament, quantite=3)
+        self.assertEqual(self._totaux(), (Decimal('7.50'), 1))
+
+    def test_save_commande_ne_reecrit_pas_les_totaux(self):
+        perimee = Commande.objects.get(pk=self.commande.pk)
+        LigneCommande.objects.create(commande=self.commande, medicament=self.doliprane, quantite=2)
+        perimee.statut = 'Annulée'
+        perimee.save()
+        self.assertEqual(self._totaux(), (Decimal('5.00'), 1))
+
+    def test_commande_verification(self):
+        LigneCommande.objects.create(commande=self.commande, medicament=self.doliprane, quantite=2)
+        Commande.objects.filter(pk=self.commande.pk).update(montant_total=0)
+        sortie = StringIO()
+        call_command('verifier_totaux_commandes', stdout=sortie)
+        self.assertIn('1 commande(s) incohérente(s)', sortie.getvalue())
+        call_command('verifier_totaux_commandes', '--corriger', stdout=StringIO())
+        self.assertEqual(self._totaux(), (Decimal('5.00'), 1))
+
+
+class CommandeMiseAJourTests(TestCase):
+    """Modification d'une commande par l'API : seules les lignes changées
+    sont écrites (CommandeSerializer._synchroniser_lignes)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Bernard', prenom='Lucie', adresse='3 rue', telephone='0622222222')
+        self.medicaments = Medicament.objects.bulk_create([
+            Medicament(nom=f'Med {i}', categorie='Test', prix=Decimal('2.00'), quantite_en_stock=100)
+            for i in range(40)
+        ])
+        self.commande = Commande.objects.create(client=self.client_pharma)
+        for medicament in self.medicaments[:3]:
+            LigneCommande.objects.create(commande=self.commande, medicament=medicament, quantite=2)
+        self.url = reverse('commande-detail', args=[self.commande.pk])
+
+    def _modifier(self, lignes, **donnees):
+        return self.api.patch(self.url, {
+            'lignes': [{'medicament': medicament.pk, 'quantite': quantite} for medicament, quantite in lignes],
+            **donnees,
+        }, format='json')
+
+    def _stocks(self):
+        return list(Medicament.objects.filter(pk__in=[m.pk for m in self.medicaments[:4]])
+                    .order_by('pk').values_list('quantite_en_stock', flat=True))
+
+    def test_seules_les_lignes_modifiees_sont_ecrites(self):
+        Medicament.objects.filter(pk=self.medicaments[1].pk).update(prix=Decimal('9.99'))
+        conservees = dict(self.commande.lignes.values_list('medicament_id', 'pk'))
+        a, b, c, d = self.medicaments[:4]
+        response = self._modifier([(b, 2), (a, 5), (d, 1)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._stocks(), [95, 98, 100, 99])
+        lignes = {ligne.medicament_id: ligne for ligne in self.commande.lignes.all()}
+        self.assertEqual(set(lignes), {a.pk, b.pk, d.pk})
+        self.assertEqual([lignes[a.pk].pk, lignes[b.pk].pk], [conservees[a.pk], conservees[b.pk]])
+        # Ligne conservée : prix d'origine, pas le nouveau prix du médicament
+        self.assertEqual(lignes[b.pk].prix_unitaire, Decimal('2.00'))
+        self.assertEqual((response.json()['total'], response.json()['nombre_lignes']), ('16.00', 3))
+        self.assertEqual(self.commande.recalculer_totaux(), (Decimal('16.00'), 3))
+
+    def test_requetes_independantes_du_nombre_de_lignes(self):
+        for medicament in self.medicaments[3:]:
+            LigneCommande.objects.create(commande=self.commande, medicament=medicament, quantite=2)
+        lignes = [(medicament, 2) for medicament in self.medicaments]
+        lignes[7] = (self.medicaments[7], 3)
+        # Lecture de la commande, médicaments référencés, SAVEPOINT, commande
+        # et client de sa facture, lignes enregistrées, un stock, une ligne,
+        # totaux, RELEASE et relecture pour la réponse : rien par ligne
+        with self.assertNumQueries(13):
+            response = self._modifier(lignes)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Medicament.objects.get(pk=self.medicaments[7].pk).quantite_en_stock, 97)
+        self.assertEqual(response.json()['total'], '162.00')
+
+    def test_stock_insuffisant_annule_tout(self):
+        a, b = self.medicaments[:2]
+        response = self._modifier([(a, 200), (b, 1)], statut='Expédiée')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Med 0', response.json())
+        self.commande.refresh_from_db()
+        self.assertEqual((self.commande.statut, self.commande.nombre_lignes), ('En attente', 3))
+        self.assertEqual(self._stocks(), [98, 98, 98, 100])
+
+    def test_version_optimiste(self):
+        version = self.api.get(self.url).json()['version']
+        lignes = [(medicament, 2) for medicament in self.medicaments[:3]]
+        # Une modification (champs et lignes) incrémente une seule fois
+        response = self._modifier([(self.medicaments[0], 3), *lignes[1:]], statut='Expédiée', version=version)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], version + 1)
+        # Un second terminal modifie avec la version périmée
+        response = self._modifier(lignes[:1], version=version)
+        self.assertEqual(response.status_code, 409)
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.nombre_lignes, 3)
+        # Une écriture de ligne hors API change aussi la version
+        version = self.api.get(self.url).json()['version']
+        LigneCommande.objects.create(commande=self.commande, medicament=self.medicaments[5], quantite=1)
+        self.assertEqual(self._modifier(lignes, version=version).status_code, 409)
+
+
+class RegistreCreditTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Roux', prenom='Anne', adresse='9 rue', telephone='0699999999',
+                                                   plafond_credit=Decimal('100.00'))
+        self.doliprane = Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix=Decimal('30.00'), quantite_en_stock=100)
+
+    def _facture_credit(self, quantite, remise=0):
+        commande = Commande.objects.create(client=self.client_pharma)
+        LigneCommande.objects.create(commande=commande, medicament=self.doliprane, quantite=quantite)
+        return Facture.objects.create(commande=Commande.objects.get(pk=commande.pk), methode_paiement='CRD', remise=remise)
+
+    def _credit(self):
+        return Client.objects.get(pk=self.client_pharma.pk).credit
+
+    def test_facture_credit_inscrite_au_registre(self):
+        facture = self._facture_credit(2, remise=10)
+        self.assertEqual(self._credit(), Decimal('54.00'))
+        mouvement = MouvementCredit.objects.get()
+        self.assertEqual((mouvement.montant, mouvement.motif, mouvement.facture_id), (Decimal('54.00'), 'FACTURE', facture.pk))
+
+    def test_plafond_verifie_en_sql(self):
+        self._facture_credit(3)
+        with self.assertRaises(ValidationError):
+            self._facture_credit(1)
+        self.assertEqual(self._credit(), Decimal('90.00'))
+        self.assertIsNone(enregistrer_mouvement_credit(self.client_pharma.pk, Decimal('10.01'), 'AJUSTEMENT'))
+        self.assertIsNotNone(enregistrer_mouvement_credit(self.client_pharma.pk, Decimal('-40.00'), 'REMBOURSEMENT'))
+        self.assertEqual(MouvementCredit.objects.count(), 2)
+
+    def test_paiement_impute_une_seule_fois(self):
+        facture = self._facture_credit(1)
+        paiement = Paiement.objects.create(facture=facture, montant=Decimal('20.00'), methode='CRD')
+        paiement.save()
+        self.assertEqual(self._credit(), Decimal('50.00'))
+        self.assertEqual(paiement.mouvements_credit.count(), 1)
+
+    def test_save_client_ne_reecrit_pas_le_credit(self):
+        perime = Client.objects.get(pk=self.client_pharma.pk)
+        self._facture_credit(1)
+        perime.est_regulier = True
+        perime.save()
+        self.assertEqual(self._credit(), Decimal('30.00'))
+        reponse = self.api.patch(reverse('client-detail', args=[self.client_pharma.pk]), {'credit': '0'}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        reponse = self.api.get(reverse('credit-client', args=[self.client_pharma.pk]))
+        self.assertEqual(Decimal(str(reponse.data['credit_actuel'])), Decimal('30.00'))
+
+    def test_reconciliation(self):
+        self._facture_credit(1)
+        Client.objects.filter(pk=self.client_pharma.pk).update(credit=0)
+        sortie = StringIO()
+        call_command('reconcilier_credits', stdout=sortie)
+        self.assertIn('1 solde(s) incohérent(s)', sortie.getvalue())
+        call_command('reconcilier_credits', '--corriger', stdout=StringIO())
+        self.assertEqual(self._credit(), Decimal('30.00'))
+
+class CreancesFactureTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Petit', prenom='Marc', adresse='4 rue', telephone='0644444444')
+        self.doliprane = Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix=Decimal('10.00'), quantite_en_stock=100)
+
+    def _facture(self, quantite, methode='ESP', remise=0):
+        commande = Commande.objects.create(client=self.client_pharma)
+        LigneCommande.objects.create(commande=commande, medicament=self.doliprane, quantite=quantite)
+        return Facture.objects.create(commande=Commande.objects.get(pk=commande.pk), methode_paiement=methode, remise=remise)
+
+    def test_montants_stockes_maintenus_par_les_paiements(self):
+        facture = self._facture(3, remise=Decimal('10'))
+        self.assertEqual(facture.montant_net, Decimal('27.00'))
+        paiement = Paiement.objects.create(facture=facture, montant=Decimal('20.00'), methode='ESP')
+        facture.refresh_from_db()
+        self.assertEqual((facture.montant_paye, facture.montant_restant(), facture.est_payee), (Decimal('20.00'), Decimal('7.00'), False))
+        Paiement.objects.create(facture=facture, montant=Decimal('7.00'), methode='CB')
+        facture.refresh_from_db()
+        self.assertTrue(facture.est_payee)
+        paiement.est_valide = False
+        paiement.save()
+        paiement.delete()
+        facture.refresh_from_db()
+        self.assertEqual((facture.montant_paye, facture.est_payee), (Decimal('7.00'), False))
+
+    def test_save_facture_ne_reecrit_pas_le_montant_paye(self):
+        facture = self._facture(2)
+        perimee = Facture.objects.get(pk=facture.pk)
+        Paiement.objects.create(facture=facture, montant=Decimal('5.00'), methode='ESP')
+        perimee.remise = Decimal('50')
+        perimee.save()
+        facture.refresh_from_db()
+        self.assertEqual((facture.montant_net, facture.montant_paye), (Decimal('10.00'), Decimal('5.00')))
+
+    def test_remise_modifiee_recalcule_est_payee(self):
+        facture = self._facture(3, remise=Decimal('10'))
+        Paiement.objects.create(facture=facture, montant=Decimal('27.00'), methode='ESP')
+        url = reverse('facture-detail', args=[facture.pk])
+        reponse = self.api.patch(url, {'remise': '0'}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual((reponse.data['est_payee'], reponse.data['montant_restant']), (False, '3.00'))
+        self.assertEqual(self.api.get(reverse('stats-creances')).data['montant_restant'], Decimal('3.00'))
+        # est_payee n'est pas modifiable directement
+        self.api.patch(url, {'est_payee': True}, format='json')
+        self.assertFalse(Facture.objects.get(pk=facture.pk).est_payee)
+        self.api.patch(url, {'remise': '10'}, format='json')
+        self.assertTrue(Facture.objects.get(pk=facture.pk).est_payee)
+
+    def test_endpoint_creances_en_une_requete(self):
+        esp = self._facture(2)
+        self._facture(1, methode='CB', remise=Decimal('50'))
+        Paiement.objects.create(facture=esp, montant=Decimal('15.00'), methode='ESP')
+        with self.assertNumQueries(1):
+            reponse = self.api.get(reverse('stats-creances'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['factures_impayees'], 2)
+        self.assertEqual(reponse.data['montant_restant'], Decimal('10.00'))
+        self.assertEqual(reponse.data['chiffre_affaires_net'], Decimal('25.00'))
+        self.assertEqual(reponse.data['par_methode']['CB']['montant_restant'], Decimal('5.00'))
+
+class BalanceAgeeTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.doliprane = Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix=Decimal('10.00'), quantite_en_stock=100)
+        self.dupont = Client.objects.create(nom='Dupont', prenom='Jean', adresse='1 rue', telephone='0600000000')
+        self.martin = Client.objects.create(nom='Martin', prenom='Paul', adresse='2 rue', telephone='0611111111')
+        self.reference = timezone.localdate()
+
+    def _facture(self, client, quantite, jours):
+        commande = Commande.objects.create(client=client)
+        LigneCommande.objects.create(commande=commande, medicament=self.doliprane, quantite=quantite)
+        facture = Facture.objects.create(commande=Commande.objects.get(pk=commande.pk))
+        Facture.objects.filter(pk=facture.pk).update(date_facture=timezone.now() - timedelta(days=jours))
+        return facture
+
+    def test_tranches_par_client_triees_par_exposition(self):
+        self._facture(self.dupont, 1, 0)
+        self._facture(self.dupont, 2, 45)
+        payee = self._facture(self.dupont, 5, 100)
+        Paiement.objects.create(facture=payee, montant=Decimal('20.00'), methode='ESP')
+        self._facture(self.martin, 9, 75)
+        reponse = self.api.get(reverse('balance-agee'), {'date': self.reference.isoformat()})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['count'], 2)
+        martin, dupont = reponse.data['results']
+        self.assertEqual((martin['nom'], martin['jours_61_90'], martin['total']), ('Martin', Decimal('90.00'), Decimal('90.00')))
+        self.assertEqual(
+            [dupont[tranche] for tranche in ('jours_0_30', 'jours_31_60', 'jours_61_90', 'jours_90_plus', 'total')],
+            [Decimal('10.00'), Decimal('20.00'), Decimal('0.00'), Decimal('30.00'), Decimal('60.00')],
+        )
+        reponse = self.api.get(reverse('balance-agee'), {'tri': '-jours_0_30', 'page_size': 1})
+        self.assertEqual(reponse.data['results'][0]['client'], self.dupont.pk)
+        self.assertEqual(self.api.get(reverse('balance-agee'), {'tri': 'adresse'}).status_code, 400)
+
+    def test_export_csv(self):
+        self._facture(self.martin, 3, 10)
+        reponse = self.api.get(reverse('balance-agee-export'))
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        lignes = list(csv.DictReader(StringIO(reponse.content.decode())))
+        self.assertEqual([(ligne['nom'], ligne['jours_0_30'], ligne['total']) for ligne in lignes], [('Martin', '30.00', '30.00')])
+
+class CommandesLotTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Garnier', prenom='Eva', adresse='5 rue', telephone='0655555555')
+        self.doliprane = Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix=Decimal('2.50'), quantite_en_stock=30)
+        self.smecta = Medicament.objects.create(nom='Smecta', categorie='Digestif', prix=Decimal('4.00'), quantite_en_stock=30)
+
+    def _commande(self, *lignes):
+        commande = Commande.objects.create(client=self.client_pharma)
+        for medicament, quantite in lignes:
+            LigneCommande.objects.create(commande=commande, medicament=medicament, quantite=quantite)
+        return commande
+
+    def _statuts(self, *commandes):
+        return [Commande.objects.get(pk=c.pk).statut for c in commandes]
+
+    def test_valider_lot_resultat_par_commande(self):
+        # Stock après réservation des lignes : Doliprane 30 - 19 = 11, Smecta 30 - 6 = 24
+        premiere = self._commande((self.doliprane, 5), (self.smecta, 2))
+        deuxieme = self._commande((self.doliprane, 12))
+        troisieme = self._commande((self.doliprane, 2), (self.smecta, 4))
+        Commande.objects.filter(pk=troisieme.pk).update(statut='Annulée')
+        with self.assertNumQueries(8):
+            reponse = self.api.post(reverse('commande-valider-lot'), {'ids': [premiere.pk, deuxieme.pk, troisieme.pk, 999]}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual((reponse.data['reussies'], reponse.data['echecs']), (1, 3))
+        erreurs = {r['id']: r.get('erreur') for r in reponse.data['resultats']}
+        self.assertEqual(erreurs[premiere.pk], None)
+        self.assertEqual(erreurs[deuxieme.pk], "Stock insuffisant pour Doliprane. Disponible: 6")
+        self.assertEqual(erreurs[troisieme.pk], "Commande déjà annulée")
+        self.assertEqual(erreurs[999], "Commande introuvable")
+        self.assertEqual(self._statuts(premiere, deuxieme), ['Expédiée', 'En attente'])
+        self.doliprane.refresh_from_db()
+        self.smecta.refresh_from_db()
+        self.assertEqual((self.doliprane.quantite_en_stock, self.smecta.quantite_en_stock), (6, 22))
+        # La validation unitaire refuse avec le même message
+        reponse = self.api.post(reverse('commande-valider-commande', args=[deuxieme.pk]))
+        self.assertEqual(reponse.data, {'error': "Stock insuffisant pour Doliprane. Disponible: 6"})
+
+    def test_annuler_lot(self):
+        premiere = self._commande((self.doliprane, 1))
+        deuxieme = self._commande((self.smecta, 1))
+        Commande.objects.filter(pk=deuxieme.pk).update(statut='Annulée')
+        reponse = self.api.post(reverse('commande-annuler-lot'), {'ids': [premiere.pk, deuxieme.pk]}, format='json')
+        self.assertEqual([r['succes'] for r in reponse.data['resultats']], [True, False])
+        self.assertEqual(self._statuts(premiere, deuxieme), ['Annulée', 'Annulée'])
+        self.assertEqual(self.api.post(reverse('commande-annuler-lot'), {'ids': []}, format='json').status_code, 400)
+
+class AdminRequetesTests(TestCase):
+    """Les listes de l'admin exécutent un nombre fixe de requêtes."""
+
+    def setUp(self):
+        utilisateur = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(utilisateur)
+        self.client_pharma = Client.objects.create(nom='Faure', prenom='Luc', adresse='6 rue', telephone='0666666666')
+        self.medicaments = [
+            Medicament.objects.create(nom=f'Med {i}', categorie='Test', prix=Decimal('2.00'), quantite_en_stock=1000, seuil_alerte=i * 400)
+            for i in range(3)
+        ]
+
+    def _creer(self, nombre):
+        for _ in range(nombre):
+            commande = Commande.objects.create(client=self.client_pharma)
+            for medicament in self.medicaments:
+                LigneCommande.objects.create(commande=commande, medicament=medicament, quantite=1)
+            Facture.objects.create(commande=commande)
+
+    def _requetes(self, url):
+        self.client.get(url)  # Amorce les caches (types de contenu)
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        return len(requetes)
+
+    def test_listes_admin(self):
+        for nom, attendu in (('admin:gestion_commande_changelist', 6), ('admin:gestion_facture_changelist', 5)):
+            self._creer(2)
+            peu = self._requetes(reverse(nom))
+            self._creer(20)
+            self.assertEqual(self._requetes(reverse(nom)), peu)
+            self.assertEqual(peu, attendu)
+
+    def test_formulaire_facture(self):
+        self._creer(2)
+        peu = self._requetes(reverse('admin:gestion_facture_add'))
+        self._creer(10)
+        self.assertEqual(self._requetes(reverse('admin:gestion_facture_add')), peu)
+
+class RequetesListeTests(TestCase):
+    """Le nombre de requêtes des listes ne dépend pas du nombre de lignes."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Petit', prenom='Anne', adresse='4 rue', telephone='0633333333')
+        self.medicaments = Medicament.objects.bulk_create([
+            Medicament(nom=f'Med {i}', categorie='Test', prix=Decimal('1.50'), quantite_en_stock=1000)
+            for i in range(3)
+        ])
+
+    def _creer(self, nombre):
+        commandes = Commande.objects.bulk_create([
+            Commande(client=self.client_pharma, montant_total=Decimal('3.00'), nombre_lignes=2)
+            for _ in range(nombre)
+        ])
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commande, medicament=medicament, quantite=1, prix_unitaire=Decimal('1.50'))
+            for commande in commandes
+            for medicament in self.medicaments[:2]
+        ])
+        factures = Facture.objects.bulk_create([
+            Facture(commande=commande, client=self.client_pharma, montant_total=Decimal('3.00')) for commande in commandes
+        ])
+        Paiement.objects.bulk_create([
+            Paiement(facture=facture, montant=Decimal('1.00'), methode='ESP') for facture in factures
+        ])
+
+    def _verifier(self, url, requetes):
+        for nombre in (1, 99, 900):
+            self._creer(nombre)
+            with self.subTest(lignes=Commande.objects.count()), self.assertNumQueries(requetes):
+                response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    # Une requête de plus pour l'ETag (etat_modifications), constante elle aussi
+    def test_liste_commandes(self):
+        self._verifier(reverse('commande-list'), 3)
+
+    def test_liste_factures(self):
+        self._verifier(reverse('facture-list'), 3)
+
+    def test_historique_client(self):
+        self._verifier(reverse('client-historique', args=[self.client_pharma.pk]), 3)
+
+
+class StockSqlTests(TestCase):
+    def setUp(self):
+        Medicament.objects.bulk_create([
+            Medicament(nom='Rupture', categorie='Test', prix=Decimal('5.00'), quantite_en_stock=0, seuil_alerte=5),
+            Medicament(nom='Faible', categorie='Test', prix=Decimal('2.00'), quantite_en_stock=4, seuil_alerte=5),
+            Medicament(nom='Seuil', categorie='Test', prix=Decimal('1.00'), quantite_en_stock=5, seuil_alerte=5),
+            Medicament(nom='Ok', categorie='Test', prix=Decimal('3.00'), quantite_en_stock=20, seuil_alerte=5),
+        ])
+
+    def test_filtres_et_valeur(self):
+        self.assertEqual(list(Medicament.objects.en_rupture().values_list('nom', flat=True)), ['Rupture'])
+        self.assertEqual(sorted(Medicament.objects.stock_faible().values_list('nom', flat=True)), ['Faible', 'Rupture', 'Seuil'])
+        self.assertEqual(Medicament.objects.valeur_stock(), Decimal('73.00'))
+
+    def test_stats_stock(self):
+        with self.assertNumQueries(3):
+            response = APIClient().get(reverse('stats-stock'))
+        self.assertEqual(response.data, {'rupture_stock': 1, 'stock_faible': 3, 'valeur_stock_total': Decimal('73.00')})
+
+    def test_plans_utilisent_les_index(self):
+        for queryset, index in (
+            (Medicament.objects.en_rupture(), 'medicament_stock_idx'),
+            (Medicament.objects.stock_faible(), 'medicament_marge_stock_idx'),
+        ):
+            with self.subTest(index=index):
+                self.assertIn(index, queryset.explain())
+
+
+class PaginationStreamingTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        client_pharma = Client.objects.create(nom='Roux', prenom='Marc', adresse='5 rue', telephone='0644444444')
+        medicament = Medicament.objects.create(nom='Advil', categorie='AINS', prix=Decimal('4.10'), quantite_en_stock=1000)
+        commandes = Commande.objects.bulk_create([
+            Commande(client=client_pharma, montant_total=Decimal('4.10'), nombre_lignes=1) for _ in range(12)
+        ])
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commande, medicament=medicament, quantite=1, prix_unitaire=Decimal('4.10'))
+            for commande in commandes
+        ])
+
+    def test_parcours_par_curseur(self):
+        ids = []
+        url = reverse('commande-list') + '?page_size=5'
+        while url:
+            response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [commande['id'] for commande in response.data['results']]
+            url = response.data['next']
+        attendus = list(Commande.objects.order_by('-date_commande', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, attendus)
+
+    def test_export_en_flux(self):
+        response = self.api.get(reverse('commande-list') + '?stream=1')
+        self.assertTrue(response.streaming)
+        lignes = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(lignes), 12)
+        page = self.api.get(reverse('commande-list') + '?page_size=12').json()['results']
+        self.assertEqual(lignes, page)
+
+
+class ValeursSerializerTests(TestCase):
+    """Le chemin rapide `.values()` rend les mêmes octets que les ModelSerializer."""
+
+    def setUp(self):
+        self.api = APIClient()
+        client_pharma = Client.objects.create(nom='Zé "Quote"', prenom='Ana', adresse='7 rue', telephone='0655555555')
+        medicaments = Medicament.objects.bulk_create([
+            Medicament(nom='Rupture', categorie='Test', prix=Decimal('5.00'), quantite_en_stock=0, seuil_alerte=5),
+            Medicament(nom='Faible', categorie='Test', prix=Decimal('2.10'), quantite_en_stock=4, seuil_alerte=5),
+            Medicament(nom='Éphédrine', categorie='Test', prix=Decimal('3.33'), quantite_en_stock=20, seuil_alerte=5),
+        ])
+        commandes = Commande.objects.bulk_create([
+            Commande(client=client_pharma, montant_total=Decimal('16.31'), nombre_lignes=2),
+            Commande(client=client_pharma),
+        ])
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commandes[0], medicament=medicaments[1], quantite=3, prix_unitaire=Decimal('2.10')),
+            LigneCommande(commande=commandes[0], medicament=medicaments[2], quantite=3, prix_unitaire=Decimal('3.33')),
+        ])
+        factures = Facture.objects.bulk_create([
+            Facture(commande=commande, client=client_pharma, montant_total=Decimal('16.31'),
+                    remise=Decimal('1.50'), montant_net=Decimal('14.81'), montant_paye=Decimal('4.10'))
+            for commande in commandes
+        ])
+        Paiement.objects.create(facture=factures[0], montant=Decimal('4.10'), methode='ESP')
+
+    def _comparer(self, vue, url):
+        rapide = self.api.get(url)
+        with mock.patch.object(vue, 'valeurs_serializer_class', None):
+            cache.clear()
+            reference = self.api.get(url)
+        contenu = b''.join(rapide.streaming_content) if rapide.streaming else rapide.content
+        attendu = b''.join(reference.streaming_content) if reference.streaming else reference.content
+        self.assertEqual(contenu, attendu)
+        return json.loads(contenu)
+
+    def test_listes_identiques(self):
+        for vue, nom in ((MedicamentViewSet, 'medicament'), (ClientViewSet, 'client'), (CommandeViewSet, 'commande'),
+                         (FactureViewSet, 'facture'), (PaiementViewSet, 'paiement')):
+            for suffixe in ('', '?page_size=1', '?stream=1'):
+                with self.subTest(liste=nom, params=suffixe):
+                    cache.clear()
+                    self._comparer(vue, reverse(f'{nom}-list') + suffixe)
+
+    def test_statut_calcule_en_sql(self):
+        resultats = self._comparer(MedicamentViewSet, reverse('medicament-list'))['results']
+        self.assertEqual([m['status_stock'] for m in resultats],
+                         ['En stock (20 unités)', 'Stock faible (4 unités)', 'Rupture de stock'])
+
+    def test_benchmark_serialisation(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'benchmark.json')
+            call_command('benchmark_serialisation', '--base-existante', iterations=2, lignes=10, sortie=chemin, stdout=StringIO())
+            with open(chemin, encoding='utf-8') as fichier:
+                resultats = json.load(fichier)
+        self.assertEqual(len(resultats['scenarios']), 8)
+        self.assertFalse(any(mesure['erreurs'] for mesure in resultats['scenarios'].values()))
+
+
+class CommandesMesureTests(TestCase):
+    def test_generation_sans_catalogue_refusee(self):
+        for options in ({'medicaments': 0}, {'clients': 0}, {'lignes_max': 0}, {'lot': 0}):
+            with self.subTest(**options), self.assertRaises(CommandError):
+                call_command('generer_donnees', commandes=1, stdout=StringIO(), **options)
+        self.assertFalse(Medicament.objects.exists())
+
+    def test_scenarios_sans_commande_creee(self):
+        Client.objects.create(nom='Noir', prenom='Eva', adresse='9 rue', telephone='0677777777')
+        Medicament.objects.bulk_create([
+            Medicament(nom=f'Med {i}', categorie='Test', prix=Decimal('1.00'), quantite_en_stock=100) for i in range(3)
+        ])
+        _, scenarios = BenchmarkApi()._scenarios(random.Random(0))
+        scenarios = dict(scenarios)
+        self.assertIsNone(scenarios['valider_commande']())
+        self.assertIsNone(scenarios['facturer_commande']())
+        mesure = BenchmarkApi._statistiques([], [], 3, 1.0)
+        self.assertEqual((mesure['requetes_http'], mesure['erreurs']), (0, 3))
+
+
+class ReponseConditionnelleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Blanc', prenom='Léa', adresse='8 rue', telephone='0666666666')
+        self.medicament = Medicament.objects.create(nom='Spasfon', categorie='Antispasmodique', prix=Decimal('3.20'), quantite_en_stock=50)
+        self.commande = Commande.objects.create(client=self.client_pharma)
+        LigneCommande.objects.create(commande=self.commande, medicament=self.medicament, quantite=1)
+        self.facture = Facture.objects.create(commande=self.commande)
+
+    def _etag(self, url):
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_304_sans_serialisation(self):
+        for url in (reverse('medicament-list'), reverse('client-detail', args=[self.client_pharma.pk]),
+                    reverse('commande-list'), reverse('facture-detail', args=[self.facture.pk])):
+            with self.subTest(url=url):
+                etag = self._etag(url)
+                cache.clear()
+                with self.assertNumQueries(1):
+                    response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+    def test_catalogue_en_cache_sans_requete(self):
+        url = reverse('medicament-list')
+        etag = self._etag(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserver_stock(self.medicament.pk, 1)
+        self.assertNotEqual(self._etag(url), etag)
+
+    def test_etag_suit_les_modifications(self):
+        detail, liste = reverse('commande-detail', args=[self.commande.pk]), reverse('commande-list')
+        Commande.objects.create(client=self.client_pharma)
+        for url, modifier in (
+            (detail, lambda: LigneCommande.objects.create(commande=self.commande, medicament=self.medicament, quantite=2)),
+            # Dépendances : nom du médicament des lignes, nom du client
+            (detail, lambda: Medicament.objects.filter(pk=self.medicament.pk).update(nom='Spasfon Lyoc', date_modification=timezone.now())),
+            (detail, lambda: Client.objects.filter(pk=self.client_pharma.pk).update(nom='Noir', date_modification=timezone.now())),
+            # Suppression d'une ligne plus ancienne : max inchangé, nombre modifié
+            (liste, lambda: Commande.objects.filter(pk=self.commande.pk).delete()),
+        ):
+            etag = self._etag(url)
+            self.assertEqual(self._etag(url), etag)
+            modifier()
+            self.assertNotEqual(self._etag(url), etag)
+
+    def test_dependances_limitees_aux_lignes_referencees(self):
+        url = reverse('commande-detail', args=[self.commande.pk])
+        etag = self._etag(url)
+        autre = Client.objects.create(nom='Gris', prenom='Paul', adresse='9 rue', telephone='0677777777')
+        Medicament.objects.create(nom='Smecta', categorie='Digestif', prix=Decimal('4.00'), quantite_en_stock=10)
+        Client.objects.filter(pk=autre.pk).update(nom='Noir', date_modification=timezone.now())
+        self.assertEqual(self._etag(url), etag)
+
+    def test_paiement_non_valide_change_la_facture(self):
+        url = reverse('facture-list')
+        etag = self._etag(url)
+        Paiement.objects.create(facture=self.facture, montant=Decimal('1.00'), methode='ESP', est_valide=False)
+        self.assertNotEqual(self._etag(url), etag)
+
+    def test_suppression_change_la_liste(self):
+        url = reverse('client-list')
+        ancien = self.client_pharma.pk
+        Client.objects.create(nom='Gris', prenom='Paul', adresse='9 rue', telephone='0677777777')
+        etag = self._etag(url)
+        Client.objects.filter(pk=ancien).delete()
+        self.assertNotEqual(self._etag(url), etag)
+        self.assertEqual(self.api.get(reverse('client-detail', args=[ancien])).status_code, 404)
+
+
+class ChampsDemandesTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.client_pharma = Client.objects.create(nom='Blanc', prenom='Léa', adresse='8 rue', telephone='0666666666')
+        medicament = Medicament.objects.create(nom='Spasfon', categorie='Antispasmodique', prix=Decimal('3.20'), quantite_en_stock=50)
+        self.commandes = []
+        for _ in range(3):
+            commande = Commande.objects.create(client=self.client_pharma)
+            LigneCommande.objects.create(commande=commande, medicament=medicament, quantite=2)
+            self.commandes.append(commande)
+        self.facture = Facture.objects.create(commande=self.commandes[0])
+        Paiement.objects.create(facture=self.facture, montant=Decimal('1.00'), methode='ESP')
+
+    def _get(self, url, nombre_requetes, **params):
+        # Une requête de plus pour l'ETag (reponse_conditionnelle)
+        with self.assertNumQueries(nombre_requetes):
+            response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_liste_partielle_sans_prechargement(self):
+        page = self._get(reverse('commande-list'), 2, fields='id,statut,total', page_size=2)
+        self.assertEqual([list(commande) for commande in page['results']], [['id', 'statut', 'total']] * 2)
+        # Curseur sur date_commande, lue bien que non demandée
+        suite = self.api.get(page['next']).json()
+        self.assertEqual([c['id'] for c in suite['results']], [self.commandes[0].pk])
+
+        page = self._get(reverse('commande-list'), 3, fields='id', expand='lignes')
+        self.assertEqual(list(page['results'][0]), ['id', 'lignes'])
+        self.assertEqual(page['results'][0]['lignes'][0]['sous_total'], '6.40')
+
+    def test_detail_colonnes_demandees(self):
+        url = reverse('facture-detail', args=[self.facture.pk])
+        self.assertEqual(len(self._get(url, 3)['paiements']), 1)
+        with CaptureQueriesContext(connection) as requetes:
+            facture = self._get(url, 2, fields='id,montant_restant')
+        self.assertEqual(facture, {'id': self.facture.pk, 'montant_restant': '5.40'})
+        self.assertNotIn('remise', requetes[-1]['sql'])
+        self.assertNotIn('JOIN', requetes[-1]['sql'])
+
+        facture = self._get(url, 3, expand='paiements')
+        self.assertNotIn('paiements', self._get(url, 2, fields='id'))
+        self.assertEqual(list(facture), list(self._get(url, 3)))
+
+    def test_chemin_rapide_identique(self):
+        for url, params in ((reverse('commande-list'), '?fields=client_nom,id&expand=lignes'),
+                            (reverse('facture-list'), '?fields=montant_final,est_payee'),
+                            (reverse('medicament-list'), '?fields=status_stock,stock_faible')):
+            with self.subTest(url=url):
+                cache.clear()
+                rapide = self.api.get(url + params).content
+                with mock.patch.object(CommandeViewSet, 'valeurs_serializer_class', None), \
+                        mock.patch.object(FactureViewSet, 'valeurs_serializer_class', None), \
+                        mock.patch.object(MedicamentViewSet, 'valeurs_serializer_class', None):
+                    cache.clear()
+                    self.assertEqual(rapide, self.api.get(url + params).content)
+
+    def test_champs_inconnus(self):
+        for params in ({'fields': 'id,inconnu'}, {'fields': ''}, {'fields': ','}, {'expand': 'client'}):
+            with self.subTest(params=params):
+                response = self.api.get(reverse('commande-list'), params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.json())
+        # Les écritures ignorent les paramètres de lecture
+        response = self.api.patch(reverse('client-detail', args=[self.client_pharma.pk]) + '?fields=id',
+                                  {'est_regulier': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('nom', response.json())
+
+
+class SynchroTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.url = reverse('synchro-medicaments')
+        self.medicaments = [
+            Medicament.objects.create(nom=f'Med {i}', categorie='Test', prix=Decimal('1.00'), quantite_en_stock=10)
+            for i in range(3)
+        ]
+
+    def _synchro(self, url, **params):
+        response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_puis_changements(self):
+        premiere = self._synchro(self.url, limite=2)
+        self.assertEqual([m['nom'] for m in premiere['modifies']], ['Med 0', 'Med 1'])
+        self.assertIsNotNone(premiere['next'])
+        seconde = self.api.get(premiere['next']).json()
+        self.assertEqual([m['nom'] for m in seconde['modifies']], ['Med 2'])
+        self.assertIsNone(seconde['next'])
+        # Même représentation que l'API de liste
+        detail = self.api.get(reverse('medicament-detail', args=[self.medicaments[2].pk])).json()
+        self.assertEqual(seconde['modifies'][0], detail)
+
+        jeton = seconde['jeton']
+        self.assertEqual(self._synchro(self.url, depuis=jeton), {'jeton': jeton, 'next': None, 'modifies': [], 'supprimes': []})
+
+        # UPDATE direct du stock, save() puis suppression, dans cet ordre
+        reserver_stock(self.medicaments[1].pk, 3)
+        self.medicaments[0].prix = Decimal('2.00')
+        self.medicaments[0].save()
+        supprime = self.medicaments[2].pk
+        self.medicaments[2].delete()
+        # Lignes et suppressions, dans un SAVEPOINT sous TestCase
+        with self.assertNumQueries(4):
+            changements = self._synchro(self.url, depuis=jeton)
+        self.assertEqual([(m['nom'], m['quantite_en_stock'], m['prix']) for m in changements['modifies']],
+                         [('Med 1', 7, '1.00'), ('Med 0', 10, '2.00')])
+        self.assertEqual(changements['supprimes'], [supprime])
+        self.assertGreater(changements['jeton'], jeton)
+
+    def test_clients_et_credit(self):
+        url = reverse('synchro-clients')
+        client_pharma = Client.objects.create(nom='Blanc', prenom='Léa', adresse='8 rue', telephone='0666666666')
+        jeton = self._synchro(url)['jeton']
+        enregistrer_mouvement_credit(client_pharma.pk, Decimal('25.00'), 'AJUSTEMENT')
+        self.assertEqual([c['credit'] for c in self._synchro(url, depuis=jeton)['modifies']], ['25.00'])
+
+    def test_jeton_invalide(self):
+        jeton = self._synchro(self.url)['jeton']
+        self.assertEqual(self.api.get(self.url, {'depuis': jeton + 1}).status_code, 410)
+        self.assertEqual(self.api.get(self.url, {'depuis': 'abc'}).status_code, 400)
+
+
+class VenteJournaliereTests(TestCase):
+    def setUp(self):
+        self.client_pharma = Client.objects.create(nom='Blanc', prenom='Julie', adresse='6 rue', telephone='0655555555')
+        self.medicament = Medicament.objects.create(nom='Gaviscon', categorie='Digestif', prix=Decimal('10.00'), quantite_en_stock=100)
+
+    def _facture(self, quantite, **kwargs):
+        commande = Commande.objects.create(client=self.client_pharma)
+        LigneCommande.objects.create(commande=commande, medicament=self.medicament, quantite=quantite)
+        commande.refresh_from_db()
+        return Facture.objects.create(commande=commande, **kwargs)
+
+    def _cumuls(self):
+        return list(VenteJournaliere.objects.values_list('methode_paiement', 'nombre_factures', 'montant_brut', 'montant_net'))
+
+    def test_cumul_maintenu_et_reconstruit(self):
+        facture = self._facture(2, remise=Decimal('10'))
+        self._facture(3, methode_paiement='CB')
+        self.assertEqual(self._cumuls(), [
+            ('CB', 1, Decimal('30.00'), Decimal('30.00')),
+            ('ESP', 1, Decimal('20.00'), Decimal('18.00')),
+        ])
+        facture.methode_paiement = 'CB'
+        facture.save()
+        self.assertEqual(self._cumuls(), [
+            ('CB', 2, Decimal('50.00'), Decimal('48.00')),
+            ('ESP', 0, Decimal('0.00'), Decimal('0.00')),
+        ])
+        facture.delete()
+        incremental = [c for c in self._cumuls() if c[1]]
+        call_command('reconstruire_ventes', stdout=StringIO())
+        self.assertEqual(self._cumuls(), incremental)
+
+    def test_statistiques_ventes(self):
+        self._facture(2, remise=Decimal('50'))
+        self._facture(1, methode_paiement='CHQ')
+        with self.assertNumQueries(1):
+            response = APIClient().get(reverse('stats-ventes'))
+        self.assertEqual(response.data['total_ventes'], 2)
+        self.assertEqual(response.data['montant_total'], Decimal('30.00'))
+        self.assertEqual(response.data['montant_net'], Decimal('20.00'))
+        self.assertEqual(response.data['par_methode']['CHQ']['nombre'], 1)
+        self.assertEqual(len(response.data['ventes_par_jour']), 1)
+        response = APIClient().get(reverse('stats-ventes'), {'debut': '2020-01-01', 'fin': '2020-01-31'})
+        self.assertEqual(response.data['total_ventes'], 0)
+        response = APIClient().get(reverse('stats-ventes'), {'debut': 'hier'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_suppression_en_cascade(self):
+        facture = self._facture(2)
+        self._facture(1)
+        response = APIClient().delete(reverse('commande-detail', args=[facture.commande_id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(APIClient().get(reverse('stats-ventes')).data['total_ventes'], 1)
+        self.assertEqual([c for c in self._cumuls() if c[1]], [('ESP', 1, Decimal('10.00'), Decimal('10.00'))])
+
+
+class CacheCatalogueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reinitialiser_statistiques_cache()
+        self.api = APIClient()
+        self.medicament = Medicament.objects.create(nom='Efferalgan', categorie='Antalgique', prix=Decimal('2.10'), quantite_en_stock=3)
+
+    def _verifier_lecture_et_invalidation(self):
+        url = reverse('medicament-list')
+        self.assertEqual(len(self.api.get(url).data['results']), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.api.get(url).data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicament.objects.create(nom='Dafalgan', categorie='Antalgique', prix=Decimal('2.30'), quantite_en_stock=50)
+        self.assertEqual(len(self.api.get(url).data['results']), 2)
+
+        url = reverse('stock-faible')
+        self.assertEqual(self.api.get(url).data['results'][0]['quantite_en_stock'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserver_stock(self.medicament.pk, 1)
+        self.assertEqual(self.api.get(url).data['results'][0]['quantite_en_stock'], 2)
+
+        self.assertEqual(self.api.get(reverse('cache-statistiques')).data,
+                         {'hits': 1, 'misses': 4, 'ratio': 0.2})
+
+    def test_cache_memoire_locale(self):
+        self._verifier_lecture_et_invalidation()
+
+    def test_cache_fichier(self):
+        with tempfile.TemporaryDirectory() as dossier, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': dossier},
+        }):
+            self._verifier_lecture_et_invalidation()
+
+
+class CatalogueImportExportTests(TestCase):
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dossier.cleanup)
+        self.existant = Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix=Decimal('2.50'), quantite_en_stock=10)
+
+    def _fichier(self, nom, contenu):
+        chemin = os.path.join(self.dossier.name, nom)
+        with open(chemin, 'w', encoding='utf-8') as fichier:
+            fichier.write(contenu)
+        return chemin
+
+    def test_import_csv_upsert_et_rapport(self):
+        chemin = self._fichier('catalogue.csv', (
+            "nom,categorie,prix,quantite_en_stock,seuil_alerte\n"
+            "Doliprane,,2.80,40,\n"
+            "Smecta,Digestif,4.00,25,5\n"
+            "Spasfon,Antispasmodique,abc,3,\n"
+            "Orphelin,,1.00,1,\n"
+        ))
+        rapport = os.path.join(self.dossier.name, 'erreurs.csv')
+        sortie = StringIO()
+        call_command('catalogue_medicaments', 'import', chemin, '--taille-lot', '2', '--rapport', rapport,
+                     stdout=sortie, stderr=StringIO())
+        self.assertIn('1 créé(s), 1 mis à jour, 2 rejeté(s)', sortie.getvalue())
+        self.existant.refresh_from_db()
+        self.assertEqual((self.existant.categorie, self.existant.prix, self.existant.quantite_en_stock),
+                         ('Antalgique', Decimal('2.80'), 40))
+        self.assertEqual(Medicament.objects.get(nom='Smecta').seuil_alerte, 5)
+        with open(rapport, encoding='utf-8') as fichier:
+            self.assertEqual([ligne['ligne'] for ligne in csv.DictReader(fichier)], ['4', '5'])
+
+    def test_dry_run_n_enregistre_rien(self):
+        chemin = self._fichier('catalogue.jsonl', '{"nom": "Smecta", "categorie": "Digestif", "prix": "4.00", "quantite_en_stock": 2}\n')
+        sortie = StringIO()
+        call_command('catalogue_medicaments', 'import', chemin, '--dry-run', stdout=sortie, stderr=StringIO())
+        self.assertIn('[dry-run] 1 créé(s)', sortie.getvalue())
+        self.assertFalse(Medicament.objects.filter(nom='Smecta').exists())
+
+    def test_taille_lot_invalide(self):
+        chemin = self._fichier('catalogue.csv', "nom,categorie,prix,quantite_en_stock\nSmecta,Digestif,4.00,2\n")
+        for action, taille in (('import', '0'), ('import', '-1'), ('export', '0')):
+            with self.subTest(action=action, taille=taille), self.assertRaises(CommandError):
+                call_command('catalogue_medicaments', action, chemin, '--taille-lot', taille, stdout=StringIO())
+        self.assertFalse(Medicament.objects.filter(nom='Smecta').exists())
+
+    def test_export_puis_reimport(self):
+        chemin = os.path.join(self.dossier.name, 'export.jsonl')
+        call_command('catalogue_medicaments', 'export', chemin, stdout=StringIO())
+        with open(chemin, encoding='utf-8') as fichier:
+            lignes = [json.loads(ligne) for ligne in fichier]
+        self.assertEqual(lignes, [{'id': self.existant.pk, 'nom': 'Doliprane', 'categorie': 'Antalgique',
+                                   'prix': '2.50', 'quantite_en_stock': 10, 'seuil_alerte': 10}])
+        sortie = StringIO()
+        call_command('catalogue_medicaments', 'import', chemin, stdout=sortie, stderr=StringIO())
+        self.assertIn('0 créé(s), 1 mis à jour, 0 rejeté(s)', sortie.getvalue())
+
+
+class PlansRequetesTests(TestCase):
+    """Chaque requête fréquente doit passer par un index (EXPLAIN QUERY PLAN)."""
+
+    def _assert_indexee(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIsNone(re.search(r'SCAN gestion_\w+$', plan, re.MULTILINE), plan)
+        self.assertIn(index, plan)
+
+    def test_plans(self):
+        client_pharma = Client.objects.create(nom='Noir', prenom='Léa', adresse='7 rue', telephone='0666666666')
+        depuis = timezone.now()
+        requetes = [
+            (Facture.objects.filter(date_facture__gte=depuis), 'facture_date_id_idx'),
+            (Facture.objects.order_by('-date_facture', '-id')[:51], 'facture_date_id_idx'),
+            (Facture.objects.filter(methode_paiement='CRD', est_payee=False), 'facture_methode_payee_idx'),
+            (Commande.objects.filter(client=client_pharma).order_by('-date_commande'), 'commande_client_date_idx'),
+            (Commande.objects.order_by('-date_commande', '-id')[:51], 'commande_date_id_idx'),
+            (Commande.objects.filter(statut='En attente'), 'commande_statut_date_idx'),
+            (Medicament.objects.filter(categorie='Antalgique').order_by('nom'), 'medicament_categorie_nom_idx'),
+            (Medicament.objects.filter(nom='Doliprane'), 'medicament_nom_idx'),
+            (Medicament.objects.order_by('nom')[:100], 'medicament_nom_idx'),
+        ]
+        for queryset, index in requetes:
+            with self.subTest(index=index, sql=str(queryset.query)):
+                self._assert_indexee(queryset, index)
+
+
+class RechercheMedicamentTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        Medicament.objects.create(nom='Paracétamol Biogaran', categorie='Antalgique', prix=Decimal('1.90'), quantite_en_stock=10)
+        Medicament.objects.create(nom='Ibuprofène', categorie='Anti-inflammatoire', prix=Decimal('2.40'), quantite_en_stock=10)
+        self.codoliprane = Medicament.objects.create(nom='Codoliprane', categorie='Antalgique paracétamol', prix=Decimal('3.10'), quantite_en_stock=10)
+
+    def _noms(self, q):
+        response = self.api.get(reverse('medicament-recherche'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [medicament['nom'] for medicament in response.data]
+
+    def test_prefixe_accents_et_classement(self):
+        self.assertEqual(self._noms('paracetamol'), ['Paracétamol Biogaran', 'Codoliprane'])
+        self.assertEqual(self._noms('IBUPRO'), ['Ibuprofène'])
+        self.assertEqual(self._noms('para bio'), ['Paracétamol Biogaran'])
+        self.assertEqual(self._noms('"*'), [])
+
+    def test_index_synchronise(self):
+        self.codoliprane.nom = 'Dafalgan Codéine'
+        self.codoliprane.save()
+        self.assertEqual(self._noms('codeine'), ['Dafalgan Codéine'])
+        self.assertEqual(self._noms('codoli'), [])
+        self.codoliprane.delete()
+        self.assertEqual(self._noms('dafalgan'), [])
+
+    def test_import_groupe_indexe(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as fichier:
+            fichier.write('{"nom": "Smecta", "categorie": "Digestif", "prix": "4.00", "quantite_en_stock": 2}\n')
+        self.addCleanup(os.remove, fichier.name)
+        call_command('catalogue_medicaments', 'import', fichier.name, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self._noms('smec'), ['Smecta'])
+
+
+class GenerationBenchmarkTests(TestCase):
+    def test_donnees_generees_coherentes(self):
+        call_command('generer_donnees', medicaments=20, clients=10, commandes=60, lot=25, stdout=StringIO())
+        self.assertEqual(Commande.objects.count(), 60)
+        sortie = StringIO()
+        call_command('verifier_totaux_commandes', stdout=sortie)
+        self.assertIn('cohérents', sortie.getvalue())
+        self.assertEqual(sum(VenteJournaliere.objects.values_list('nombre_factures', flat=True)), Facture.objects.count())
+        self.assertTrue(Paiement.objects.exists())
+
+    def test_benchmark_produit_un_rapport(self):
+        call_command('generer_donnees', medicaments=20, clients=10, commandes=30, stdout=StringIO())
+        Medicament.objects.update(quantite_en_stock=500)
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'benchmark.json')
+            call_command('benchmark_api', '--base-existante', iterations=3, sortie=chemin, stdout=StringIO())
+            with open(chemin, encoding='utf-8') as fichier:
+                resultats = json.load(fichier)
+        self.assertEqual(len(resultats['scenarios']), 9)
+        for nom, mesure in resultats['scenarios'].items():
+            with self.subTest(scenario=nom):
+                self.assertEqual(mesure['erreurs'], 0)
+                self.assertEqual(set(mesure['latence_ms']), {'moyenne', 'p50', 'p95', 'p99'})
+
+
+class ProfilSqliteTests(TransactionTestCase):
+    def test_routeur_replique(self):
+        routeur = RepliqueLectureRouter()
+        with lecture_replique():
+            self.assertIsNone(routeur.db_for_read(Medicament))
+        with mock.patch.dict(settings.DATABASES, {'replica': {}}):
+            self.assertIsNone(routeur.db_for_read(Medicament))
+            with lecture_replique():
+                self.assertEqual(routeur.db_for_read(Medicament), 'replica')
+                self.assertEqual(routeur.db_for_write(Medicament), 'default')
+        self.assertFalse(routeur.allow_migrate('replica', 'gestion'))
+
+    def test_pragmas_de_production(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            base = sqlite3.connect(os.path.join(dossier, 'base.sqlite3'))
+            for pragma in settings.GESTION_SQLITE_PRAGMAS.split(';'):
+                if pragma.strip():
+                    base.execute(pragma)
+            self.assertEqual(base.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+            self.assertEqual(base.execute('PRAGMA busy_timeout').fetchone(), (5000,))
+            base.close()
+
+    def test_rafraichir_replique_et_benchmark(self):
+        Medicament.objects.create(nom='Doliprane', categorie='Antalgique', prix=Decimal('2.50'), quantite_en_stock=100)
+        with tempfile.TemporaryDirectory() as dossier:
+            replique = os.path.join(dossier, 'replique.sqlite3')
+            call_command('rafraichir_replique', destination=replique, stdout=StringIO())
+            base = sqlite3.connect(replique)
+            self.assertEqual(base.execute('SELECT nom FROM gestion_medicament').fetchall(), [('Doliprane',)])
+            base.close()
+
+            call_command('generer_donnees', medicaments=20, clients=10, commandes=30, stdout=StringIO())
+            Medicament.objects.update(quantite_en_stock=500)
+            chemin = os.path.join(dossier, 'benchmark.json')
+            call_command('benchmark_sqlite', '--base-existante', duree=0.2, lecteurs=2, ecrivains=1,
+                         sortie=chemin, stdout=StringIO())
+            with open(chemin, encoding='utf-8') as fichier:
+                scenarios = json.load(fichier)['scenarios']
+        self.assertEqual(set(scenarios), {'defaut_lectures', 'defaut_ecritures', 'production_lectures', 'production_ecritures'})
+        self.assertEqual(scenarios['production_ecritures']['erreurs'], 0)
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        reinitialiser_metriques()
+
+    def test_gabarits_et_detection_n_plus_un(self):
+        self.assertEqual(
+            gabarit_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND nom = 'x' LIMIT 21"),
+            gabarit_sql("SELECT * FROM t WHERE id IN (%s) AND nom = 'y' LIMIT 21"),
+        )
+        requetes = [(f'SELECT * FROM gestion_medicament WHERE id = {i}', 0.001) for i in range(6)]
+        requetes.append(('SELECT 1', 0.001))
+        self.assertEqual(list(requetes_repetees(requetes, 5).values()), [6])
+        self.assertEqual(requetes_repetees(requetes, 7), {})
+
+    def test_desactive_par_defaut(self):
+        APIClient().get(reverse('stats-stock'))
+        self.assertEqual(APIClient().get(reverse('instrumentation')).data, {})
+
+    @override_settings(GESTION_INSTRUMENTATION=True)
+    def test_mesures_par_route(self):
+        api = APIClient()
+        with self.assertLogs('gestion.instrumentation', 'INFO') as journal:
+            api.get(reverse('stats-stock'))
+            api.get(reverse('stats-stock'))
+        ligne = json.loads(journal.records[0].getMessage())
+        self.assertEqual((ligne['url_name'], ligne['requetes_sql'], ligne['n_plus_un']), ('stats-stock', 3, {}))
+        mesures = api.get(reverse('instrumentation')).data['stats-stock']
+        self.assertEqual((mesures['appels'], mesures['requetes_sql_totales']), (2, 6))
+        self.assertEqual(mesures['n_plus_un_detectes'], 0)
+
+    @override_settings(GESTION_INSTRUMENTATION=True)
+    def test_reponse_en_flux_mesuree_a_la_fermeture(self):
+        client_pharma = Client.objects.create(nom='Gris', prenom='Tom', adresse='3 rue', telephone='0688888888')
+        Commande.objects.create(client=client_pharma)
+        with self.assertLogs('gestion.instrumentation', 'INFO') as journal:
+            response = APIClient().get(reverse('commande-list') + '?stream=1')
+            with CaptureQueriesContext(connection) as requetes:
+                self.assertEqual(len(json.loads(b''.join(response.streaming_content))), 1)
+        self.assertEqual(len(journal.records), 1)
+        ligne = json.loads(journal.records[0].getMessage())
+        self.assertEqual(ligne['url_name'], 'commande-list')
+        self.assertGreaterEqual(ligne['requetes_sql'], len(requetes))
+        self.assertTrue(requetes)
+
+
+class LecturesAsynchronesTests(TransactionTestCase):
+    def setUp(self):
+        self.client_pharma = Client.objects.create(nom='Vert', prenom='Hugo', adresse='8 rue', telephone='0677777777')
+        self.medicaments = [
+            Medicament.objects.create(nom=f'Med {i}', categorie='Test', prix=Decimal('2.00'),
+                                      quantite_en_stock=i * 5, seuil_alerte=10)
+            for i in range(5)
+        ]
+        for _ in range(3):
+            commande = Commande.objects.create(client=self.client_pharma)
+            LigneCommande.objects.create(commande=commande, medicament=self.medicaments[4], quantite=1)
+
+    async def test_catalogue_pagine(self):
+        client = AsyncClient()
+        response = await client.get(reverse('async-medicaments'), {'page_size': 3})
+        page = response.json()
+        self.assertEqual(len(page['results']), 3)
+        suite = (await client.get(reverse('async-medicaments'), {'page_size': 3, 'cursor': page['next']})).json()
+        self.assertIsNone(suite['next'])
+        ids = [m['id'] for m in page['results'] + suite['results']]
+        self.assertEqual(ids, sorted((m.pk for m in self.medicaments), reverse=True))
+        faible = (await client.get(reverse('async-stock-faible'))).json()['results']
+        self.assertEqual(len(faible), 3)
+        self.assertEqual((await client.get(reverse('async-medicaments'), {'cursor': '!!'})).status_code, 400)
+
+    async def test_historique_identique_a_la_vue_synchrone(self):
+        url = reverse('async-client-historique', args=[self.client_pharma.pk])
+        page = (await AsyncClient().get(url, {'page_size': 2})).json()
+        suite = (await AsyncClient().get(url, {'page_size': 2, 'cursor': page['next']})).json()
+        synchrone = await sync_to_async(
+            lambda: APIClient().get(reverse('client-historique', args=[self.client_pharma.pk])).json()
+        )()
+        self.assertEqual(page['results'] + suite['results'], synchrone['results'])
+
+    async def test_curseur_mal_forme(self):
+        historique = reverse('async-client-historique', args=[self.client_pharma.pk])
+        for url, contenu in (
+            (historique, {'date': '2024-01-01', 'id': 1}),
+            (historique, ['2024-01-01']),
+            (historique, [1, 1]),
+            (reverse('async-medicaments'), {'id': 1}),
+            (reverse('async-medicaments'), ['1']),
+        ):
+            with self.subTest(url=url, contenu=contenu):
+                curseur = base64.urlsafe_b64encode(json.dumps(contenu).encode()).decode()
+                self.assertEqual((await AsyncClient().get(url, {'cursor': curseur})).status_code, 400)
+
+    async def test_statistiques_et_tableau_de_bord(self):
+        stock = (await AsyncClient().get(reverse('async-stats-stock'))).json()
+        synchrone = await sync_to_async(lambda: APIClient().get(reverse('stats-stock')).json())()
+        self.assertEqual(stock, synchrone)
+        tableau = (await AsyncClient().get(reverse('async-tableau-de-bord'))).json()
+        self.assertEqual(tableau['stock'], stock)
+        self.assertEqual(tableau['commandes_en_attente'], 3)
+        ventes = (await AsyncClient().get(reverse('async-stats-ventes'))).json()
+        self.assertEqual(ventes['total_ventes'], 0)
+
+    def test_benchmark_asgi_wsgi(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'benchmark.json')
+            call_command('benchmark_asgi', '--base-existante', iterations=4, concurrence=2,
+                         sortie=chemin, stdout=StringIO())
+            with open(chemin, encoding='utf-8') as fichier:
+                scenarios = json.load(fichier)['scenarios']
+        self.assertEqual(len(scenarios), 8)
+        self.assertFalse([nom for nom, mesure in scenarios.items() if mesure['erreurs']])
@@ -2,6 +2,7 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     MedicamentViewSet, 
     ClientViewSet, 
@@ -10,7 +11,13 @@ from .views import (
     StockAlerteView,
     ClientHistoriqueView,
     StatistiquesView,
-    PaiementViewSet
+    PaiementViewSet,
+    CacheStatistiquesView,
+    InstrumentationView,
+    BalanceAgeeView,
+    BalanceAgeeExportView,
+    SynchroMedicamentsView,
+    SynchroClientsView
 )
 
 router = DefaultRouter()
@@ -21,8 +28,6 @@ router.register(r'factures', FactureViewSet)
 router.register(r'paiements', PaiementViewSet)
 
 urlpatterns = [
-    path('api/', include(router.urls)),
-    
     # URLs pour la gestion des médicaments
     path('api/medicaments/rupture/', StockAlerteView.as_view({'get': 'rupture_stock'}), name='rupture-stock'),
     path('api/medicaments/stock-faible/', StockAlerteView.as_view({'get': 'stock_faible'}), name='stock-faible'),
@@ -40,5 +45,26 @@ urlpatterns = [
     # URLs pour les statistiques
     path('api/statistiques/ventes/', StatistiquesView.as_view({'get': 'ventes'}), name='stats-ventes'),
     path('api/statistiques/stock/', StatistiquesView.as_view({'get': 'stock'}), name='stats-stock'),
+    path('api/statistiques/creances/', StatistiquesView.as_view({'get': 'creances'}), name='stats-creances'),
+    path('api/rapports/balance-agee/', BalanceAgeeView.as_view(), name='balance-agee'),
+    path('api/rapports/balance-agee/export/', BalanceAgeeExportView.as_view(), name='balance-agee-export'),
+    # Synchronisation différentielle des terminaux hors ligne
+    path('api/synchro/medicaments/', SynchroMedicamentsView.as_view(), name='synchro-medicaments'),
+    path('api/synchro/clients/', SynchroClientsView.as_view(), name='synchro-clients'),
+    # Lectures asynchrones (déploiement ASGI)
+    path('api/async/medicaments/', async_views.liste_medicaments, name='async-medicaments'),
+    path('api/async/medicaments/rupture/', async_views.rupture_stock, name='async-rupture-stock'),
+    path('api/async/medicaments/stock-faible/', async_views.stock_faible, name='async-stock-faible'),
+    path('api/async/clients/<int:pk>/historique/', async_views.historique_client, name='async-client-historique'),
+    path('api/async/statistiques/ventes/', async_views.statistiques_ventes, name='async-stats-ventes'),
+    path('api/async/statistiques/stock/', async_views.statistiques_stock, name='async-stats-stock'),
+    path('api/async/tableau-de-bord/', async_views.tableau_de_bord, name='async-tableau-de-bord'),
+
+    path('api/cache/statistiques/', CacheStatistiquesView.as_view(), name='cache-statistiques'),
+    path('api/instrumentation/', InstrumentationView.as_view(), name='instrumentation'),
     path('api/factures/<int:pk>/paiement/', PaiementViewSet.as_view({'post': 'ajouter_paiement'}), name='ajouter-paiement'),
+
+    # Routes du routeur en dernier : son motif medicaments/<pk>/ masquerait
+    # sinon rupture/ et stock-faible/
+    path('api/', include(router.urls)),
 ]
@@ -1,50 +1,125 @@
-from django.shortcuts import render
+import csv
+
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.http import HttpResponse
+from django.shortcuts import render, get_object_or_404
 
 # Create your views here.
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
-from django.db.models import Sum, Count
 from django.utils import timezone
-from datetime import timedelta
-from .models import Medicament, Client, Commande, Facture, Paiement
+from datetime import date, timedelta
+from .models import Medicament, Client, Commande, Facture, Paiement, VenteJournaliere
+from .cache import cache_catalogue, statistiques_cache
+from .conditionnel import reponse_conditionnelle
+from .instrumentation import metriques, reinitialiser_metriques
+from .mixins import ChampsDemandesMixin, StreamingListMixin, ValeursListMixin, resoudre_champs
+from .recherche import rechercher_medicaments
+from .routers import LectureRepliqueMixin
+from .services import (
+    TRANCHES_BALANCE,
+    ConflitVersion,
+    agreger_creances,
+    agreger_ventes,
+    annuler_commandes,
+    balance_agee,
+    centimes,
+    changements_depuis,
+    valider_commandes
+)
+from .pagination import (
+    GestionCursorPagination,
+    CommandeCursorPagination,
+    FactureCursorPagination,
+    PaiementCursorPagination,
+    RapportPagination
+)
 from .serializers import (
     MedicamentSerializer, 
     ClientSerializer, 
     CommandeSerializer, 
     FactureSerializer,
-    PaiementSerializer
+    PaiementSerializer,
+    LotCommandesSerializer,
+    MedicamentValeursSerializer,
+    ClientValeursSerializer,
+    CommandeValeursSerializer,
+    FactureValeursSerializer,
+    PaiementValeursSerializer
 )
 
-class MedicamentViewSet(viewsets.ModelViewSet):
+class MedicamentViewSet(ChampsDemandesMixin, StreamingListMixin, ValeursListMixin, viewsets.ModelViewSet):
     queryset = Medicament.objects.all()
     serializer_class = MedicamentSerializer
+    valeurs_serializer_class = MedicamentValeursSerializer
+    pagination_class = GestionCursorPagination
+
+    @cache_catalogue
+    @reponse_conditionnelle
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_catalogue
+    @reponse_conditionnelle
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'])
+    def recherche(self, request):
+        try:
+            limite = max(1, min(int(request.query_params.get('limite', 20)), 100))
+        except ValueError:
+            return Response({'error': 'limite doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+        medicaments = rechercher_medicaments(request.query_params.get('q', ''), limite)
+        return Response(self.get_serializer(medicaments, many=True).data)
 
     @action(detail=True, methods=['post'])
     def ajuster_stock(self, request, pk=None):
         medicament = self.get_object()
-        quantite = request.data.get('quantite', 0)
         try:
+            quantite = int(request.data.get('quantite', 0))
             medicament.ajuster_stock(quantite)
             return Response({'status': 'Stock ajusté'})
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 class StockAlerteView(viewsets.ViewSet):
+    pagination_class = GestionCursorPagination
+
+    @cache_catalogue
     def rupture_stock(self, request):
-        medicaments = Medicament.objects.filter(quantite_en_stock=0)
-        serializer = MedicamentSerializer(medicaments, many=True)
-        return Response(serializer.data)
+        return self._paginer(request, Medicament.objects.en_rupture())
 
+    @cache_catalogue
     def stock_faible(self, request):
-        medicaments = [med for med in Medicament.objects.all() if med.stock_faible()]
-        serializer = MedicamentSerializer(medicaments, many=True)
-        return Response(serializer.data)
+        return self._paginer(request, Medicament.objects.stock_faible())
+
+    def _paginer(self, request, medicaments):
+        champs = resoudre_champs(request.query_params, MedicamentSerializer)
+        if champs is not None:
+            medicaments = MedicamentValeursSerializer.restreindre(medicaments, champs)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(medicaments, request, view=self)
+        serializer = MedicamentSerializer(page, many=True, champs=champs)
+        return paginator.get_paginated_response(serializer.data)
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(ChampsDemandesMixin, StreamingListMixin, ValeursListMixin, viewsets.ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    valeurs_serializer_class = ClientValeursSerializer
+    pagination_class = GestionCursorPagination
+
+    @reponse_conditionnelle
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @reponse_conditionnelle
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     @action(detail=True, methods=['post'])
     def toggle_regulier(self, request, pk=None):
@@ -55,6 +130,7 @@ class ClientViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def credit_info(self, request, pk=None):
+        # Solde mis en cache sur Client, maintenu avec le registre MouvementCredit
         client = self.get_object()
         return Response({
             'credit_actuel': client.credit,
@@ -62,16 +138,102 @@ class ClientViewSet(viewsets.ModelViewSet):
             'credit_disponible': client.plafond_credit - client.credit
         })
 
-class ClientHistoriqueView(APIView):
+class SynchroView(APIView):
+    """Synchronisation différentielle des terminaux (`?depuis=<jeton>&limite=`) :
+    lignes écrites et identifiants supprimés depuis le jeton, dans l'ordre de
+    `sequence_synchro`. Le jeton renvoyé est celui de la requête suivante ;
+    `next` est renseigné tant qu'il reste des changements."""
+    modele = None
+    valeurs_serializer_class = None
+
+    def get(self, request):
+        try:
+            jeton = max(0, int(request.query_params.get('depuis', 0)))
+            limite = max(1, min(int(request.query_params.get('limite', 500)), 5000))
+        except ValueError:
+            return Response({'error': 'depuis et limite doivent être des entiers'}, status=status.HTTP_400_BAD_REQUEST)
+        valeurs = self.valeurs_serializer_class()
+        page = changements_depuis(self.modele, jeton, limite, valeurs.preparer)
+        if page is None:
+            return Response({'error': 'Jeton inconnu, resynchroniser depuis 0'}, status=status.HTTP_410_GONE)
+
+        ecrits, supprimes, jeton, suite = page
+        return Response({
+            'jeton': jeton,
+            'next': replace_query_param(request.build_absolute_uri(), 'depuis', jeton) if suite else None,
+            'modifies': valeurs.serialiser(ecrits),
+            'supprimes': supprimes,
+        })
+
+class SynchroMedicamentsView(SynchroView):
+    modele = Medicament
+    valeurs_serializer_class = MedicamentValeursSerializer
+
+class SynchroClientsView(SynchroView):
+    modele = Client
+    valeurs_serializer_class = ClientValeursSerializer
+
+class ClientHistoriqueView(LectureRepliqueMixin, APIView):
     def get(self, request, pk):
-        client = Client.objects.get(pk=pk)
-        commandes = client.get_historique_achats()
-        serializer = CommandeSerializer(commandes, many=True)
-        return Response(serializer.data)
+        client = get_object_or_404(Client, pk=pk)
+        paginator = CommandeCursorPagination()
+        page = paginator.paginate_queryset(client.get_historique_achats(), request, view=self)
+        serializer = CommandeSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-class CommandeViewSet(viewsets.ModelViewSet):
-    queryset = Commande.objects.all()
+class CommandeViewSet(ChampsDemandesMixin, StreamingListMixin, ValeursListMixin, viewsets.ModelViewSet):
+    queryset = Commande.objects.avec_details()
     serializer_class = CommandeSerializer
+    valeurs_serializer_class = CommandeValeursSerializer
+    pagination_class = CommandeCursorPagination
+    # client_nom et nom_medicament font partie de la représentation
+    etag_dependances = {Client: 'client', Medicament: 'lignes__medicament'}
+
+    @reponse_conditionnelle
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @reponse_conditionnelle
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except ConflitVersion as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        commandes = serializer.save()
+        commandes = Commande.objects.avec_details().filter(pk__in=[c.pk for c in commandes])
+        return Response(self.get_serializer(commandes, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='valider', url_name='valider-lot')
+    def valider_lot(self, request):
+        return self._traiter_lot(request, valider_commandes)
+
+    @action(detail=False, methods=['post'], url_path='annuler', url_name='annuler-lot')
+    def annuler_lot(self, request):
+        return self._traiter_lot(request, annuler_commandes)
+
+    def _traiter_lot(self, request, traitement):
+        lot = LotCommandesSerializer(data=request.data)
+        lot.is_valid(raise_exception=True)
+        try:
+            resultats = traitement(list(dict.fromkeys(lot.validated_data['ids'])))
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'reussies': sum(erreur is None for erreur in resultats.values()),
+            'echecs': sum(erreur is not None for erreur in resultats.values()),
+            'resultats': [
+                {'id': pk, 'succes': erreur is None, **({'erreur': erreur} if erreur else {})}
+                for pk, erreur in resultats.items()
+            ],
+        })
 
     @action(detail=True, methods=['post'])
     def valider_commande(self, request, pk=None):
@@ -79,6 +241,8 @@ class CommandeViewSet(viewsets.ModelViewSet):
         try:
             commande.valider_commande()
             return Response({'status': 'Commande validée'})
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -89,36 +253,57 @@ class CommandeViewSet(viewsets.ModelViewSet):
         commande.save()
         return Response({'status': 'Commande annulée'})
 
-class FactureViewSet(viewsets.ModelViewSet):
-    queryset = Facture.objects.all()
+class FactureViewSet(ChampsDemandesMixin, StreamingListMixin, ValeursListMixin, viewsets.ModelViewSet):
+    queryset = Facture.objects.prefetch_related('paiements')
     serializer_class = FactureSerializer
+    valeurs_serializer_class = FactureValeursSerializer
+    pagination_class = FactureCursorPagination
+
+    @reponse_conditionnelle
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @reponse_conditionnelle
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+def periode_ventes(params):
+    fin = date.fromisoformat(params['fin']) if 'fin' in params else timezone.localdate()
+    debut = date.fromisoformat(params['debut']) if 'debut' in params else fin - timedelta(days=30)
+    return debut, fin
 
-class StatistiquesView(viewsets.ViewSet):
+class StatistiquesView(LectureRepliqueMixin, viewsets.ViewSet):
     def ventes(self, request):
-        # Statistiques des ventes sur les 30 derniers jours
-        date_debut = timezone.now() - timedelta(days=30)
-        stats = {
-            'total_ventes': Facture.objects.filter(date_facture__gte=date_debut).count(),
-            'montant_total': Facture.objects.filter(date_facture__gte=date_debut).aggregate(
-                total=Sum('montant_total'))['total'] or 0,
-            'ventes_par_jour': Facture.objects.filter(date_facture__gte=date_debut)
-                .values('date_facture__date')
-                .annotate(total=Count('id'))
-        }
-        return Response(stats)
+        # Statistiques des ventes lues dans le cumul journalier (30 derniers jours par défaut)
+        try:
+            debut, fin = periode_ventes(request.query_params)
+        except ValueError:
+            return Response({'error': 'Dates attendues au format AAAA-MM-JJ'}, status=status.HTTP_400_BAD_REQUEST)
+        cumuls = VenteJournaliere.objects.filter(jour__range=(debut, fin))
+        return Response(agreger_ventes(cumuls, debut, fin))
+
+    def creances(self, request):
+        # Reste dû (toutes dates) et chiffre d'affaires net de la période
+        try:
+            debut, fin = periode_ventes(request.query_params)
+        except ValueError:
+            return Response({'error': 'Dates attendues au format AAAA-MM-JJ'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(agreger_creances(Facture.objects.all(), debut, fin))
 
     def stock(self, request):
         # Statistiques du stock
         stats = {
-            'rupture_stock': Medicament.objects.filter(quantite_en_stock=0).count(),
-            'stock_faible': len([med for med in Medicament.objects.all() if med.stock_faible()]),
-            'valeur_stock_total': sum(med.prix * med.quantite_en_stock for med in Medicament.objects.all())
+            'rupture_stock': Medicament.objects.en_rupture().count(),
+            'stock_faible': Medicament.objects.stock_faible().count(),
+            'valeur_stock_total': Medicament.objects.valeur_stock()
         }
         return Response(stats)
 
-class PaiementViewSet(viewsets.ModelViewSet):
+class PaiementViewSet(ChampsDemandesMixin, StreamingListMixin, ValeursListMixin, viewsets.ModelViewSet):
     queryset = Paiement.objects.all()
     serializer_class = PaiementSerializer
+    valeurs_serializer_class = PaiementValeursSerializer
+    pagination_class = PaiementCursorPagination
 
     @action(detail=False, methods=['post'])
     def ajouter_paiement(self, request):
@@ -133,3 +318,66 @@ class PaiementViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class BalanceAgeeView(LectureRepliqueMixin, APIView):
+    """Balance âgée des créances par client (`?date=AAAA-MM-JJ`, `?tri=-total`)."""
+    COLONNES = ('client', 'nom', 'prenom') + TRANCHES_BALANCE + ('total',)
+    TRIS = ('client',) + TRANCHES_BALANCE + ('total',)
+
+    def lignes(self, request):
+        try:
+            reference = date.fromisoformat(request.query_params['date']) if 'date' in request.query_params else timezone.localdate()
+        except ValueError:
+            raise ValueError('Date attendue au format AAAA-MM-JJ')
+        tri = request.query_params.get('tri', '-total')
+        if tri.lstrip('-') not in self.TRIS:
+            raise ValueError(f"tri attendu parmi : {', '.join(self.TRIS)}")
+        champ = F(tri.lstrip('-'))
+        ordre = champ.desc(nulls_last=True) if tri.startswith('-') else champ.asc(nulls_first=True)
+        return balance_agee(reference).order_by(ordre, 'client'), reference
+
+    def avec_noms(self, lignes):
+        # Noms chargés après l'agrégation, seulement pour les lignes retournées
+        clients = Client.objects.only('nom', 'prenom').in_bulk([ligne['client'] for ligne in lignes])
+        for ligne in lignes:
+            client = clients[ligne['client']]
+            ligne['nom'], ligne['prenom'] = client.nom, client.prenom
+            for tranche in TRANCHES_BALANCE + ('total',):
+                ligne[tranche] = centimes(ligne[tranche])
+        return lignes
+
+    def get(self, request):
+        try:
+            lignes, reference = self.lignes(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = RapportPagination()
+        page = paginator.paginate_queryset(list(lignes), request, view=self)
+        reponse = paginator.get_paginated_response(self.avec_noms(page))
+        reponse.data['date'] = reference
+        return reponse
+
+class BalanceAgeeExportView(BalanceAgeeView):
+    def get(self, request):
+        try:
+            lignes, reference = self.lignes(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        reponse = HttpResponse(content_type='text/csv; charset=utf-8')
+        reponse['Content-Disposition'] = f'attachment; filename="balance_agee_{reference}.csv"'
+        writer = csv.DictWriter(reponse, fieldnames=self.COLONNES)
+        writer.writeheader()
+        writer.writerows(self.avec_noms(list(lignes)))
+        return reponse
+
+class CacheStatistiquesView(APIView):
+    def get(self, request):
+        return Response(statistiques_cache())
+
+class InstrumentationView(APIView):
+    def get(self, request):
+        return Response(metriques())
+
+    def delete(self, request):
+        reinitialiser_metriques()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,8 +51,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Inactif tant que GESTION_INSTRUMENTATION vaut False
+    'gestion.instrumentation.InstrumentationMiddleware',
 ]
 
+# Mesures par route (durée, requêtes SQL, N+1) exposées sur
+# /gestion/api/instrumentation/ et journalisées par 'gestion.instrumentation'
+GESTION_INSTRUMENTATION = False
+GESTION_N_PLUS_UN_SEUIL = 5
+
 ROOT_URLCONF = 'pharmacie.urls'
 
 TEMPLATES = [
@@ -83,6 +91,58 @@ DATABASES = {
     }
 }
 
+# Profil SQLite de production (PHARMACIE_PROFIL_BD=production) : WAL (les
+# lectures ne bloquent plus pendant une écriture), pragmas appliqués à
+# l'ouverture de chaque connexion, transactions IMMEDIATE (pas d'échec
+# "database is locked" à la promotion lecture -> écriture), connexions
+# persistantes et réplique en lecture rafraîchie par
+# `python manage.py rafraichir_replique`.
+GESTION_SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA busy_timeout=5000;'
+    'PRAGMA cache_size=-65536;'  # 64 Mio
+    'PRAGMA mmap_size=268435456;'  # 256 Mio
+    'PRAGMA temp_store=MEMORY;'
+)
+
+if os.environ.get('PHARMACIE_PROFIL_BD') == 'production':
+    DATABASES['default'].update({
+        'OPTIONS': {
+            'init_command': GESTION_SQLITE_PRAGMAS,
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replique.sqlite3',
+        'OPTIONS': {'init_command': GESTION_SQLITE_PRAGMAS + 'PRAGMA query_only=1;'},
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Vues en lecture seule et statistiques servies par la réplique quand elle existe
+DATABASE_ROUTERS = ['gestion.routers.RepliqueLectureRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Le cache du catalogue fonctionne aussi avec un cache fichier partagé entre
+# processus : 'django.core.cache.backends.filebased.FileBasedCache' avec
+# 'LOCATION': BASE_DIR / 'cache'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+GESTION_CACHE_ALIAS = 'default'
+GESTION_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators